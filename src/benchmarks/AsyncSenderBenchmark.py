@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - Sender concurrency: sync Senders on worker threads vs. async Senders on the AsyncRuntime
+
+Usage (from the src folder):
+    python3 -m benchmarks.AsyncSenderBenchmark [nr-messages ...]
+
+Sends messages concurrently to fake Senders with a simulated network latency and measures the time,
+the peak number of threads and the peak memory:
+    * threads: a sync Sender on a pool of async_runtime::executor_workers threads (like the upload workers)
+    * thread-per-msg: a sync Sender with one thread per message
+    * adapter: a sync Sender wrapped in an AsyncSenderAdapter
+    * async: an AsyncSender, all messages in flight at once
+Then checks that the SenderRegister wraps an AsyncSender in a SyncSenderAdapter.
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+import tracemalloc
+import concurrent.futures
+
+from tools.Settings import Settings
+from sender.Sender import Sender
+from sender.AsyncSender import AsyncSender
+from sender.AsyncRuntime import AsyncRuntime
+from sender.AsyncSenderAdapter import AsyncSenderAdapter
+from sender.SyncSenderAdapter import SyncSenderAdapter
+from sender.SenderRegister import SenderRegister
+
+LATENCY_S = 0.05
+
+
+class FakeSender(Sender):
+    """Sync Sender blocking for LATENCY_S per message, counts the peak number of threads"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.lock = threading.Lock()
+        self.nr_threads_max = 0
+
+    def is_initialized(self):
+        return self.initialized
+
+    def is_started(self):
+        return self.started
+
+    def is_finished(self):
+        return True
+
+    def get_name(self):
+        return 'Fake'
+
+    def init(self):
+        self.initialized = True
+        return True
+
+    def start(self):
+        self.started = True
+        return True
+
+    def stop(self):
+        self.started = False
+
+    def cleanup(self):
+        self.initialized = False
+
+    def can_send_msg(self):
+        return True
+
+    def can_send_img(self):
+        return False
+
+    def can_send_video(self):
+        return False
+
+    def send_msg(self, msg, subject='', force_send=False):
+        with self.lock:
+            self.nr_threads_max = max(self.nr_threads_max, threading.active_count())
+        time.sleep(LATENCY_S)
+        return True
+
+    def send_image(self, fullname, subfolder, name):
+        return False
+
+    def send_video(self, fullname, subfolder, name):
+        return False
+
+
+class FakeAsyncSender(AsyncSender):
+    """AsyncSender awaiting LATENCY_S per message, counts the peak number of threads"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.nr_threads_max = 0
+
+    def is_finished(self):
+        return True
+
+    def get_name(self):
+        return 'FakeAsync'
+
+    async def init(self):
+        self.initialized = True
+        return True
+
+    async def start(self):
+        self.started = True
+        return True
+
+    async def stop(self):
+        self.started = False
+
+    async def cleanup(self):
+        self.initialized = False
+
+    def can_send_msg(self):
+        return True
+
+    def can_send_img(self):
+        return False
+
+    def can_send_video(self):
+        return False
+
+    async def send_msg(self, msg, subject='', force_send=False):
+        self.nr_threads_max = max(self.nr_threads_max, threading.active_count())
+        await asyncio.sleep(LATENCY_S)
+        return True
+
+    async def send_image(self, fullname, subfolder, name):
+        return False
+
+    async def send_video(self, fullname, subfolder, name):
+        return False
+
+
+def send_threads(sender, nr_messages, nr_workers):
+    """Sends the messages from a thread pool
+
+    :param sender: The sync Sender
+    :param nr_messages: The number of messages
+    :param nr_workers: The number of threads, one per message if not set
+    :return: The number of sent messages
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nr_workers or nr_messages) as executor:
+        futures = [executor.submit(sender.send_msg, 'Message {}'.format(i)) for i in range(nr_messages)]
+        return sum(f.result() for f in futures)
+
+
+def send_async(runtime, sender, nr_messages):
+    """Sends the messages from the event loop of the runtime
+
+    :param runtime: The AsyncRuntime
+    :param sender: The AsyncSender
+    :param nr_messages: The number of messages
+    :return: The number of sent messages
+    """
+    async def send_all():
+        results = await asyncio.gather(*[sender.send_msg('Message {}'.format(i)) for i in range(nr_messages)])
+        return sum(results)
+
+    return runtime.run(send_all())
+
+
+def bench(func, sender):
+    """Runs a path once
+
+    :param func: Sends the messages, returns the number of sent messages
+    :param sender: The Sender counting the peak number of threads
+    :return: Tuple (number of sent messages, seconds, peak number of threads, peak memory in bytes)
+    """
+    sender.nr_threads_max = 0
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    nr_sent = func()
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return nr_sent, seconds, sender.nr_threads_max, peak
+
+
+def check_register(settings, runtime):
+    """Loads the FakeAsyncSender through the SenderRegister, checks that it is wrapped and sends
+
+    :param settings: The settings
+    :param runtime: The AsyncRuntime
+    """
+    s_register = SenderRegister(sender_info=[{
+        'fullpackage': 'benchmarks.AsyncSenderBenchmark',
+        'package': 'fake',
+        'name': 'FakeAsyncSender',
+        'class': None
+    }])
+    assert len(s_register.senders) == 1, 'FakeAsyncSender not found by the SenderRegister'
+    s = s_register.create(s_register.senders[0], settings)
+    assert isinstance(s, SyncSenderAdapter), 'AsyncSender not wrapped in a SyncSenderAdapter'
+    s.runtime = runtime
+    sent = s.init() and s.start() and s.send_msg('Message')
+    s.stop()
+    s.cleanup()
+    print('register: {} -> {}, message {}'.format(
+        s_register.senders[0]['name'], type(s).__name__, 'sent' if sent else 'not sent'))
+    assert sent, 'Message not sent through the SyncSenderAdapter'
+
+
+def main(argv):
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    settings = Settings()
+    runtime = AsyncRuntime(settings)
+    runtime.start()
+    try:
+        sync_sender = FakeSender(settings)
+        adapter = AsyncSenderAdapter(settings, sync_sender, runtime=runtime)
+        async_sender = FakeAsyncSender(settings)
+        nr_workers = runtime.executor_workers
+
+        print('{} ms Sender latency, {} worker threads'.format(1000 * LATENCY_S, nr_workers))
+        for nr_messages in [int(arg) for arg in argv] or [10, 100, 500]:
+            print('{} messages'.format(nr_messages))
+            paths = [
+                ('threads', lambda: send_threads(sync_sender, nr_messages, nr_workers), sync_sender),
+                ('thread-per-msg', lambda: send_threads(sync_sender, nr_messages, None), sync_sender),
+                ('adapter', lambda: send_async(runtime, adapter, nr_messages), sync_sender),
+                ('async', lambda: send_async(runtime, async_sender, nr_messages), async_sender)
+            ]
+            for label, func, sender in paths:
+                nr_sent, seconds, nr_threads, peak = bench(func, sender)
+                print('\t{:<14} {:8.1f} ms, {:4} thread(s), {:8.1f} KB peak memory, {} of {} sent'.format(
+                    label, 1000.0 * seconds, nr_threads, peak / 1024.0, nr_sent, nr_messages))
+        check_register(settings, runtime)
+    finally:
+        runtime.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - DropboxBot: single-request uploads vs. chunked upload sessions, per-file vs. batched events
+
+Usage (from the src folder):
+    python3 -m benchmarks.DropboxUploadBenchmark [file-size-mb ...]
+
+Uploads temporary files to the fake Dropbox backend and measures the upload time
+and the peak memory allocated while uploading (tracemalloc).
+Then uploads the files of a motion event one by one and in one batch, with a simulated API latency,
+and measures the upload time and the number of API calls.
+Finally uploads a burst of files against a rate limit, without and with the request governor.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import tracemalloc
+import concurrent.futures
+
+from tools.Settings import Settings
+from sender.dropbox.DropboxBot import DropboxBot
+
+EVENT_FILES = [('rs-{}.jpg'.format(i), 200 * 1024) for i in range(10)] + [('rs-video.mp4', 12 * 1024 * 1024)]
+COMMIT_CALLS = ['files_upload', 'files_upload_session_finish', 'files_upload_session_finish_batch',
+                'files_upload_session_finish_batch_v2']
+EVENT_LATENCY_S = 0.05
+BURST_FILES = 60
+BURST_WORKERS = 4
+BURST_RATE_LIMIT = 10
+
+
+def create_file(size_mb):
+    """Creates a temporary file with random content
+
+    :param size_mb: The file size (in MB)
+    :return: The full file name
+    """
+    fd, fullname = tempfile.mkstemp(prefix='rs-bench-', suffix='.mp4')
+    with os.fdopen(fd, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    return fullname
+
+
+def bench(settings, fullname, threshold_mb):
+    """Uploads a file once
+
+    :param settings: The settings
+    :param fullname: The full file name
+    :param threshold_mb: The upload session threshold (in MB)
+    :return: Tuple (success, seconds, peak memory in bytes, fake Dropbox module)
+    """
+    settings.set_sender('dropbox', 'upload_session_threshold_mb', threshold_mb)
+    bot = DropboxBot(settings)
+    bot.init()
+    bot.start()
+    bot.dropbox.Dropbox.reset()
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    success = bot.send_video(fullname, 'benchmark', os.path.basename(fullname))
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return success, seconds, peak, bot.dropbox
+
+
+def bench_event(settings, folder, batch):
+    """Uploads the files of an event once
+
+    :param settings: The settings
+    :param folder: The event folder
+    :param batch: Whether to upload the files in one batch
+    :return: Tuple (number of uploaded files, seconds, number of API calls, number of commits)
+    """
+    bot = DropboxBot(settings)
+    bot.init()
+    bot.start()
+    bot.dropbox.Dropbox.reset(latency_s=EVENT_LATENCY_S)
+
+    files = [(os.path.join(folder, name), 'benchmark', name) for name, _ in EVENT_FILES]
+    t0 = time.perf_counter()
+    if batch:
+        nr_uploaded = sum(bot.send_files(files).values())
+    else:
+        nr_uploaded = sum(bot.send_image(*f) for f in files)
+    seconds = time.perf_counter() - t0
+    nr_api_calls = bot.get_stats()['nr_api_calls']
+    return nr_uploaded, seconds, sum(nr_api_calls.values()), sum(nr_api_calls.get(name, 0) for name in COMMIT_CALLS)
+
+
+def bench_burst(settings, folder, governor):
+    """Uploads a burst of files against a rate limit
+
+    :param settings: The settings
+    :param folder: The folder of the files
+    :param governor: Whether to use the request governor
+    :return: Tuple (number of uploaded files, seconds, governor counters)
+    """
+    settings.set_sender('dropbox', 'governor_active', governor)
+    bot = DropboxBot(settings)
+    bot.init()
+    bot.start()
+    bot.dropbox.Dropbox.reset(rate_limit=BURST_RATE_LIMIT)
+
+    t0 = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BURST_WORKERS) as executor:
+        results = list(executor.map(lambda name: bot.send_image(os.path.join(folder, name), 'benchmark', name),
+                                    os.listdir(folder)))
+    seconds = time.perf_counter() - t0
+    return sum(results), seconds, bot.get_stats().get('governor')
+
+
+def main(argv):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    settings = Settings()
+    settings.set_sender('dropbox', 'backend', 'fake')
+    settings.set_sender('dropbox', 'access_token', 'benchmark')
+    chunk_mb = settings.get_sender('dropbox', 'upload_chunk_mb', 4)
+
+    print('Chunk size {} MB'.format(chunk_mb))
+    for size_mb in [int(arg) for arg in argv] or [1, 16, 64]:
+        fullname = create_file(size_mb)
+        try:
+            print('{} MB file'.format(size_mb))
+            for label, threshold_mb in [('single', size_mb + 1), ('session', 0)]:
+                success, seconds, peak, module = bench(settings, fullname, threshold_mb)
+                print('\t{:<8} {:8.1f} ms, peak memory {:8.2f} MB, {} API call(s){}'.format(
+                    label, 1000.0 * seconds, peak / (1024.0 * 1024.0), sum(module.Dropbox.nr_api_calls.values()),
+                    '' if success else ' (failed)'))
+        finally:
+            os.remove(fullname)
+
+    folder = tempfile.mkdtemp(prefix='rs-bench-')
+    try:
+        for name, size in EVENT_FILES:
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(os.urandom(size))
+        settings.set_sender('dropbox', 'upload_session_threshold_mb', 8)
+        print('Event with {} files, {} ms API latency'.format(len(EVENT_FILES), 1000 * EVENT_LATENCY_S))
+        for label, batch in [('per-file', False), ('batch', True)]:
+            nr_uploaded, seconds, nr_api_calls, nr_commits = bench_event(settings, folder, batch)
+            print('\t{:<8} {:8.1f} ms, {:3} API call(s), {:3} commit(s), {} of {} file(s) uploaded'.format(
+                label, 1000.0 * seconds, nr_api_calls, nr_commits, nr_uploaded, len(EVENT_FILES)))
+    finally:
+        shutil.rmtree(folder)
+
+    folder = tempfile.mkdtemp(prefix='rs-bench-')
+    try:
+        for i in range(BURST_FILES):
+            with open(os.path.join(folder, 'rs-{}.jpg'.format(i)), 'wb') as f:
+                f.write(os.urandom(1024))
+        print('Burst of {} files, {} workers, rate limit {} API calls/s'.format(
+            BURST_FILES, BURST_WORKERS, BURST_RATE_LIMIT))
+        for label, governor in [('direct', False), ('governor', True)]:
+            nr_uploaded, seconds, stats = bench_burst(settings, folder, governor)
+            print('\t{:<8} {:8.1f} ms, {} of {} file(s) uploaded{}'.format(
+                label, 1000.0 * seconds, nr_uploaded, BURST_FILES,
+                ', {} throttled, {} requeued, {:.1f} s waited'.format(
+                    stats['nr_throttled'], stats['nr_requeued'], stats['wait_s']) if stats else ''))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
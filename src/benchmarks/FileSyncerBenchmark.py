@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - FileSyncer: walking the full tree vs. the watcher-backed index
+
+Usage (from the src folder):
+    python3 -m benchmarks.FileSyncerBenchmark [nr-event-folders ...]
+
+Creates a temporary tree with thousands of event folders left over from failed uploads
+(parked in the retry scheduler), then measures syncing one new event folder at a time in both sync modes.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+from sender.Sender import Sender
+from tools.Settings import Settings
+from tools.FileSyncer import FileSyncer
+
+FILES_PER_EVENT = ['rs-1.jpg', 'rs-2.jpg', 'rs-video.mp4']
+ROUNDS = 10
+TIMEOUT_S = 60
+
+
+class BenchmarkSender(Sender):
+    """Fails to upload the leftover files, accepts new files"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.nr_calls = 0
+        self.nr_uploaded = 0
+
+    def is_initialized(self):
+        return self.initialized
+
+    def is_started(self):
+        return self.started
+
+    def is_finished(self):
+        return True
+
+    def get_name(self):
+        return 'Benchmark'
+
+    def init(self):
+        self.initialized = True
+        return True
+
+    def start(self):
+        self.started = True
+        return True
+
+    def stop(self):
+        self.started = False
+
+    def cleanup(self):
+        self.initialized = False
+
+    def can_send_msg(self):
+        return False
+
+    def can_send_img(self):
+        return True
+
+    def can_send_video(self):
+        return True
+
+    def send_msg(self, msg, subject='', force_send=False):
+        return False
+
+    def _send(self, fullname, subfolder, name):
+        self.nr_calls = self.nr_calls + 1
+        success = '-old-' not in fullname
+        if success:
+            self.nr_uploaded = self.nr_uploaded + 1
+        return success
+
+    send_image = _send
+    send_video = _send
+
+
+def create_event(folder, name):
+    """Creates an event folder with placeholder files
+
+    :param folder: The local sync folder
+    :param name: The event folder name
+    """
+    event_folder = os.path.join(folder, name)
+    os.mkdir(event_folder)
+    for fname in FILES_PER_EVENT:
+        with open(os.path.join(event_folder, fname), 'wb') as f:
+            f.write(b'\0' * 1024)
+
+
+def wait_for(condition):
+    """Waits until a condition is met
+
+    :param condition: The condition
+    """
+    t0 = time.time()
+    while not condition() and (time.time() - t0) < TIMEOUT_S:
+        time.sleep(0.001)
+
+
+def bench(settings, mode, nr_events):
+    """Syncs ROUNDS new event folders in a tree with nr_events leftover event folders
+
+    :param settings: The settings
+    :param mode: The sync mode
+    :param nr_events: Number of leftover event folders
+    :return: Tuple (seconds per sync, sender calls per sync, effective sync mode)
+    """
+    folder = tempfile.mkdtemp(prefix='rs-bench-')
+    try:
+        for i in range(nr_events):
+            create_event(folder, 'rs-old-{}'.format(i))
+
+        settings.set('sync', 'mode', mode)
+        sender = BenchmarkSender(settings)
+        syncer = FileSyncer(settings, [sender])
+        syncer.local_folder = folder
+        syncer.init()
+
+        # Initial sync, leftover files fail
+        syncer.sync()
+        wait_for(lambda: not syncer.get_stats()['syncing'])
+
+        seconds = 0
+        nr_calls = sender.nr_calls
+        nr_uploaded = sender.nr_uploaded
+        for i in range(ROUNDS):
+            create_event(folder, 'rs-new-{}'.format(i))
+            if syncer.sync_mode == FileSyncer.SYNC_MODE_WATCH:
+                wait_for(lambda: syncer.get_stats()['nr_pending_files'] >= len(FILES_PER_EVENT))
+            t0 = time.perf_counter()
+            syncer.sync()
+            wait_for(lambda: not syncer.get_stats()['syncing'])
+            seconds = seconds + time.perf_counter() - t0
+        effective_mode = syncer.sync_mode
+        syncer.cleanup()
+        # Every new file is uploaded exactly once
+        assert sender.nr_uploaded - nr_uploaded == ROUNDS * len(FILES_PER_EVENT), \
+            '{} of {} new files uploaded in mode "{}"'.format(sender.nr_uploaded - nr_uploaded,
+                                                             ROUNDS * len(FILES_PER_EVENT), effective_mode)
+        return seconds / ROUNDS, (sender.nr_calls - nr_calls) / ROUNDS, effective_mode
+    finally:
+        shutil.rmtree(folder)
+
+
+def main(argv):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    settings = Settings()
+    settings.set('sleep', 'sync_done_sec', 0)
+    settings.set('sync', 'journal_active', False)
+    settings.set('sync', 'retry_backoff_base_sec', 3600)
+
+    for nr_events in [int(arg) for arg in argv] or [1000, 5000]:
+        print('{} leftover event folders ({} files), {} syncs of one new event folder'.format(
+            nr_events, nr_events * len(FILES_PER_EVENT), ROUNDS))
+        for mode in [FileSyncer.SYNC_MODE_WALK, FileSyncer.SYNC_MODE_WATCH]:
+            seconds, nr_calls, effective_mode = bench(settings, mode, nr_events)
+            print('\t{:<6} {:8.2f} ms/sync, {:8.1f} uploads/sync{}'.format(
+                mode, 1000.0 * seconds, nr_calls,
+                '' if effective_mode == mode else ' (fell back to "{}")'.format(effective_mode)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
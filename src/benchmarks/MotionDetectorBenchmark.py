@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - software motion detector on recorded frame sequences
+
+Usage (from the src folder):
+    python3 -m benchmarks.MotionDetectorBenchmark [recorded-frames.npy ...]
+
+A recording is a .npy file with grayscale frames of shape (nr_frames, height, width), dtype uint8.
+Without recordings a synthetic 320x240 sequence (noise and a moving block) is generated.
+The detector is configured via motion_detection in settings.json.
+"""
+
+import sys
+import time
+import logging
+
+import numpy as np
+
+from tools.Settings import Settings
+from tools.camera.MotionDetector import MotionDetector
+
+TARGET_FPS = 10
+
+
+def synthetic_frames(nr_frames=600, width=320, height=240, block=40):
+    """Generates a noisy static scene with a block moving through it in the second half
+
+    :param nr_frames: Number of frames
+    :param width: Frame width
+    :param height: Frame height
+    :param block: Block size
+    :return: Array of shape (nr_frames, height, width)
+    """
+    rng = np.random.default_rng(42)
+    scene = rng.integers(60, 120, size=(height, width), dtype=np.uint8)
+    frames = np.empty((nr_frames, height, width), dtype=np.uint8)
+    for i in range(nr_frames):
+        frame = scene + rng.integers(0, 8, size=(height, width), dtype=np.uint8)
+        if i >= nr_frames // 2:
+            x = (i * 4) % (width - block)
+            frame[height // 3:height // 3 + block, x:x + block] = 230
+        frames[i] = frame
+    return frames
+
+
+def main(argv):
+    logging.getLogger().setLevel(logging.WARNING)
+    settings = Settings()
+
+    recordings = [(name, np.load(name)) for name in argv]
+    if not recordings:
+        recordings.append(('synthetic-320x240', synthetic_frames()))
+
+    for name, frames in recordings:
+        events = {'detected': 0, 'ended': 0}
+        detector = MotionDetector(settings,
+                                  cb_motion_detected=lambda: events.update(detected=events['detected'] + 1),
+                                  cb_motion_ended=lambda: events.update(ended=events['ended'] + 1))
+        t0 = time.perf_counter()
+        for frame in frames:
+            detector.process(frame)
+        seconds = time.perf_counter() - t0
+        fps = len(frames) / seconds
+        print('Recording "{}" ({} frames of {}x{})'.format(name, len(frames), frames.shape[2], frames.shape[1]))
+        print('\t{:.1f} fps, {:.2f} ms/frame ({} the target of {} fps on a single core)'.format(
+            fps, 1000.0 * seconds / len(frames), 'meets' if fps >= TARGET_FPS else 'MISSES', TARGET_FPS))
+        print('\tmotion detected {}x, ended {}x'.format(events['detected'], events['ended']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
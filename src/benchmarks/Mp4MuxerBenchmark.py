@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - in-process MP4 muxing vs. the MP4Box subprocess
+
+Usage (from the src folder):
+    python3 -m benchmarks.Mp4MuxerBenchmark [recorded-sample.h264 ...]
+
+Without sample streams a fake H.264 stream is generated.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from subprocess import call, DEVNULL
+
+from tools.camera.Mp4Muxer import Mp4Muxer
+from tools.camera.FakeCameraBackend import generate_h264
+
+CHUNK_SIZE = 64 * 1024
+RUNS = 5
+
+
+def bench_mp4box(data, folder):
+    """Old path: write the .h264 file, then convert it with MP4Box
+
+    :param data: The H.264 stream
+    :param folder: The output folder
+    :return: Tuple (seconds, bytes written)
+    """
+    iname = os.path.join(folder, 'rs-video.h264')
+    oname = os.path.join(folder, 'rs-video.mp4')
+    t0 = time.time()
+    with open(iname, 'wb') as f:
+        f.write(data)
+    retcode = call(['MP4Box', '-quiet', '-add', iname, oname], stdout=DEVNULL, stderr=DEVNULL)
+    seconds = time.time() - t0
+    if retcode != 0:
+        raise RuntimeError('MP4Box failed with return code {}'.format(retcode))
+    written = os.path.getsize(iname) + os.path.getsize(oname)
+    os.remove(iname)
+    os.remove(oname)
+    return seconds, written
+
+
+def bench_muxer(data, folder, framerate):
+    """New path: mux the stream chunk by chunk straight into the .mp4 file
+
+    :param data: The H.264 stream
+    :param folder: The output folder
+    :param framerate: The framerate
+    :return: Tuple (seconds, bytes written)
+    """
+    oname = os.path.join(folder, 'rs-video.mp4')
+    t0 = time.time()
+    with Mp4Muxer(oname, framerate=framerate) as muxer:
+        for i in range(0, len(data), CHUNK_SIZE):
+            muxer.write(data[i:i + CHUNK_SIZE])
+    seconds = time.time() - t0
+    written = os.path.getsize(oname)
+    os.remove(oname)
+    return seconds, written
+
+
+def main(argv):
+    samples = []
+    for name in argv:
+        with open(name, 'rb') as f:
+            samples.append((name, f.read()))
+    if not samples:
+        data = b''.join(frame for _, frame in generate_h264(1296, 972, nr_frames=300, frame_size=16 * 1024))
+        samples.append(('fake-1296x972-300-frames', data))
+
+    has_mp4box = shutil.which('MP4Box') is not None
+    if not has_mp4box:
+        print('MP4Box not found, skipping the MP4Box path')
+
+    folder = tempfile.mkdtemp(prefix='rs-bench-')
+    try:
+        for name, data in samples:
+            print('Sample "{}" ({} bytes)'.format(name, len(data)))
+            results = {'muxer': [bench_muxer(data, folder, 30) for _ in range(RUNS)]}
+            if has_mp4box:
+                results['mp4box'] = [bench_mp4box(data, folder) for _ in range(RUNS)]
+            for path, runs in results.items():
+                best = min(s for s, _ in runs)
+                print('\t{:<8} best {:8.4f}s, mean {:8.4f}s, {} bytes written'.format(
+                    path, best, sum(s for s, _ in runs) / len(runs), runs[0][1]))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
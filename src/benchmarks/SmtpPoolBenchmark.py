@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - SMTP: a single connection vs. the SmtpPool against a local SMTP server that drops idle connections
+
+Usage (from the src folder, requires aiosmtpd):
+    python3 -m benchmarks.SmtpPoolBenchmark [nr-rounds]
+
+Sends bursts of mails from several threads, pausing longer than the idle timeout of the server between the bursts,
+and measures the send latency, failures and (re-)connects.
+Then checks that the circuit breaker of the mail Sender opens once the server is down.
+"""
+
+import sys
+import time
+import socket
+import logging
+import threading
+import concurrent.futures
+
+from tools.Settings import Settings
+from sender.mail.SmtpPool import SmtpPool
+from sender.CircuitBreaker import CircuitBreaker
+
+MAILS_PER_ROUND = 20
+THREADS = 4
+SERVER_IDLE_TIMEOUT_S = 1
+PAUSE_S = 1.5
+MSG = 'From:rs@localhost\nSubject:Benchmark\nTo:rs@localhost\n\nMotion detected'
+
+
+class CountingHandler:
+    """Counts the received mails"""
+
+    def __init__(self):
+        self.nr_received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.nr_received = self.nr_received + 1
+        return '250 OK'
+
+
+class SingleConnection:
+    """One connection opened at start and shared by all threads, as before the SmtpPool"""
+
+    def __init__(self, settings):
+        self.pool = SmtpPool(settings)
+        self.connection = self.pool._connect()
+        self.lock = threading.Lock()
+        self.nr_sent = 0
+        self.nr_failed = 0
+        self.send_s_total = 0
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        t0 = time.time()
+        try:
+            with self.lock:
+                self.connection.sendmail(from_addr, to_addrs, msg)
+            self.nr_sent = self.nr_sent + 1
+            self.send_s_total = self.send_s_total + (time.time() - t0)
+            return True
+        except Exception:
+            self.nr_failed = self.nr_failed + 1
+            return False
+
+    def get_stats(self):
+        return {
+            'nr_sent': self.nr_sent,
+            'nr_failed': self.nr_failed,
+            'send_s_mean': (self.send_s_total / self.nr_sent) if self.nr_sent else 0,
+            'nr_connects': 1,
+            'nr_reconnects': 0
+        }
+
+    def close(self):
+        self.pool._quit(self.connection)
+
+
+def get_free_port():
+    """Returns a free local port
+
+    :return: The port
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench(client, nr_rounds):
+    """Sends nr_rounds bursts of mails
+
+    :param client: The client, SingleConnection or SmtpPool
+    :param nr_rounds: The number of rounds
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=THREADS) as executor:
+        for i in range(nr_rounds):
+            if i > 0:
+                time.sleep(PAUSE_S)
+            list(executor.map(lambda _: client.sendmail('rs@localhost', 'rs@localhost', MSG),
+                              range(MAILS_PER_ROUND)))
+
+
+def check_circuit_breaker(settings):
+    """Sends mails to a server that is down, checks that the circuit breaker opens
+
+    :param settings: The settings, pointing to the stopped server
+    """
+    circuit_breaker = CircuitBreaker(settings, 'mail')
+    pool = SmtpPool(settings, circuit_breaker=circuit_breaker)
+    pool.start()
+    nr_sent = sum(pool.sendmail('rs@localhost', 'rs@localhost', MSG) for _ in range(circuit_breaker.min_calls))
+    pool.close()
+    stats = circuit_breaker.get_stats()
+    print('\tserver down: {} sent, circuit breaker {} after {} failure(s)'.format(
+        nr_sent, stats['state'], stats['nr_failures']))
+    assert stats['state'] == CircuitBreaker.STATE_OPEN, 'Circuit breaker not open while the SMTP server is down'
+
+
+def main(argv):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    try:
+        controller_module = __import__('aiosmtpd.controller', globals(), locals(), ['Controller'], 0)
+    except ImportError:
+        print('This benchmark requires aiosmtpd (pip install aiosmtpd)')
+        return
+    nr_rounds = int(argv[0]) if argv else 3
+
+    handler = CountingHandler()
+    port = get_free_port()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port,
+                                              server_kwargs={'timeout': SERVER_IDLE_TIMEOUT_S})
+    controller.start()
+    try:
+        settings = Settings()
+        settings.set_sender('mail', 'server', '127.0.0.1')
+        settings.set_sender('mail', 'server_port', port)
+        settings.set_sender('mail', 'security', SmtpPool.SECURITY_NONE)
+        settings.set_sender('mail', 'pool_size', THREADS)
+
+        print('{} rounds of {} mails from {} threads, {} s pauses, server idle timeout {} s'.format(
+            nr_rounds, MAILS_PER_ROUND, THREADS, PAUSE_S, SERVER_IDLE_TIMEOUT_S))
+        for label, client_class in [('single', SingleConnection), ('pool', SmtpPool)]:
+            client = client_class(settings)
+            if client_class is SmtpPool:
+                client.start()
+            nr_received = handler.nr_received
+            t0 = time.perf_counter()
+            bench(client, nr_rounds)
+            seconds = time.perf_counter() - t0 - (nr_rounds - 1) * PAUSE_S
+            stats = client.get_stats()
+            client.close()
+            print('\t{:<6} {:8.1f} ms sending, {:3} sent, {:3} failed, {:3} received, '
+                  '{:6.2f} ms mean latency, {} connect(s), {} reconnect(s)'.format(
+                      label, 1000.0 * seconds, stats['nr_sent'], stats['nr_failed'],
+                      handler.nr_received - nr_received, 1000.0 * stats['send_s_mean'],
+                      stats['nr_connects'], stats['nr_reconnects']))
+    finally:
+        controller.stop()
+    check_circuit_breaker(settings)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Benchmark - TelegramSender: sending the images of an event one by one vs. as albums,
+sending to several chats with one Sender per chat vs. one Sender uploading once
+
+Usage (from the src folder, requires python-telegram-bot):
+    python3 -m benchmarks.TelegramBenchmark [nr-images ...]
+
+Sends the images of an event to a local fake Bot API server with a simulated latency
+and measures the time, the number of requests and the uploaded bytes per event.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+from tools.Settings import Settings
+from sender.Event import Event
+from sender.telegram.FakeBotApi import FakeBotApiServer
+from sender.telegram.TelegramSender import TelegramSender
+
+LATENCY_S = 0.05
+IMAGE_SIZE = 100 * 1024
+VIDEO_SIZE = 2 * 1024 * 1024
+CHAT_IDS = [1, 2, 3]
+
+
+def bench(settings, server, files, event):
+    """Sends the images of an event once
+
+    :param settings: The settings
+    :param server: The fake Bot API server
+    :param files: List of tuples (full name, subfolder, name)
+    :param event: Whether to send the images as event (albums)
+    :return: Tuple (number of sent images, seconds, number of requests)
+    """
+    sender = TelegramSender(settings)
+    sender.init()
+    sender.start()
+    server.reset()
+
+    t0 = time.perf_counter()
+    if event:
+        nr_sent = sum(sender.send_batch(Event('benchmark', files)).values())
+    else:
+        nr_sent = sum(sender.send_image(*f) for f in files)
+    seconds = time.perf_counter() - t0
+    sender.stop()
+    return nr_sent, seconds, server.get_stats()['nr_requests_total']
+
+
+def bench_chats(settings, server, files, shared):
+    """Sends the files of an event to all CHAT_IDS
+
+    :param settings: The settings
+    :param server: The fake Bot API server
+    :param files: List of tuples (full name, subfolder, name)
+    :param shared: Whether to send with one Sender to all chats, one Sender per chat else
+    :return: Tuple (seconds, number of requests, uploaded bytes)
+    """
+    chat_id_lists = [CHAT_IDS] if shared else [[chat_id] for chat_id in CHAT_IDS]
+    senders = []
+    for chat_ids in chat_id_lists:
+        settings.set_sender('telegram', 'chat_ids', chat_ids)
+        sender = TelegramSender(settings)
+        sender.init()
+        sender.start()
+        senders.append(sender)
+    server.reset()
+
+    t0 = time.perf_counter()
+    for sender in senders:
+        sender.send_batch(Event('benchmark', files))
+    seconds = time.perf_counter() - t0
+    for sender in senders:
+        sender.stop()
+    stats = server.get_stats()
+    return seconds, stats['nr_requests_total'], stats['bytes_uploaded']
+
+
+def main(argv):
+    logging.getLogger().setLevel(logging.CRITICAL)
+    try:
+        __import__('telegram', globals(), locals(), [], 0)
+    except ImportError:
+        print('This benchmark requires python-telegram-bot')
+        return
+
+    server = FakeBotApiServer(latency_s=LATENCY_S)
+    server.start()
+    folder = tempfile.mkdtemp(prefix='rs-bench-')
+    try:
+        settings = Settings()
+        settings.set_sender('telegram', 'base_url', server.base_url)
+        settings.set_sender('telegram', 'token', '123:benchmark')
+        settings.set_sender('telegram', 'chat_id', 1)
+        settings.set_sender('telegram', 'send_images', True)
+
+        print('{} ms Bot API latency'.format(1000 * LATENCY_S))
+        for nr_images in [int(arg) for arg in argv] or [4, 12]:
+            files = []
+            for i in range(nr_images):
+                name = 'rs-{}-{}.jpg'.format(nr_images, i)
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(os.urandom(IMAGE_SIZE))
+                files.append((os.path.join(folder, name), 'benchmark', name))
+            print('Event with {} images'.format(nr_images))
+            for label, event in [('single', False), ('album', True)]:
+                nr_sent, seconds, nr_requests = bench(settings, server, files, event)
+                print('\t{:<6} {:8.1f} ms, {:3} request(s), {} of {} image(s) sent'.format(
+                    label, 1000.0 * seconds, nr_requests, nr_sent, nr_images))
+
+        settings.set_sender('telegram', 'send_videos', True)
+        name = 'rs-video.mp4'
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(os.urandom(VIDEO_SIZE))
+        files = files[:4] + [(os.path.join(folder, name), 'benchmark', name)]
+        print('Event with {} images and a video to {} chats'.format(len(files) - 1, len(CHAT_IDS)))
+        for label, shared in [('per-chat', False), ('shared', True)]:
+            seconds, nr_requests, bytes_uploaded = bench_chats(settings, server, files, shared)
+            print('\t{:<8} {:8.1f} ms, {:3} request(s), {:8.2f} MB uploaded'.format(
+                label, 1000.0 * seconds, nr_requests, bytes_uploaded / (1024.0 * 1024.0)))
+    finally:
+        shutil.rmtree(folder)
+        server.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
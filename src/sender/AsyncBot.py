@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""An abstract async bot"""
+
+from abc import ABC, abstractmethod
+
+class AsyncBot(ABC):
+    """The async variant of Bot: the lifecycle and send methods are coroutines, run on the AsyncRuntime"""
+
+    def __init__(self, settings):
+        """Initialization"""
+        super().__init__()
+
+        self.settings = settings
+
+    @abstractmethod
+    async def init(self):
+        """Initializes the Bot
+
+        :return: Boolean flag whether this Bot has been initialized
+        """
+        return False
+
+    @abstractmethod
+    def is_finished(self):
+        """Returns a boolean flag whether this Bot is finished doing its tasks
+
+        :return: Boolean flag whether this Bot is finished doing its tasks
+        """
+        return True
+
+    @abstractmethod
+    async def start(self):
+        """Starts the Bot
+
+        :return: Boolean flag whether this Bot has been started
+        """
+        return False
+
+    @abstractmethod
+    async def stop(self):
+        """Stops the Bot
+
+        :return: Boolean flag whether this Bot has been stopped
+        """
+        return True
+
+    @abstractmethod
+    async def cleanup(self):
+        """Cleans up the Bot
+
+        :return: Boolean flag whether this Bot has been cleaned up
+        """
+        return False
+
+    @abstractmethod
+    async def send_message(self, msg):
+        """Sends a message
+
+        :param msg: The message
+        :return: True if successfully sent, False else
+        """
+        return False
+
+    @abstractmethod
+    async def send_image(self, fullname, subfolder, name):
+        """Sends an image
+
+        :param fullname: The full name
+        :param subfolder: The subfolder
+        :param name: The name
+        :return: True if successfully sent, False else
+        """
+        return False
+
+    @abstractmethod
+    async def send_video(self, fullname, subfolder, name):
+        """Sends a video
+
+        :param fullname: The full name
+        :param subfolder: The subfolder
+        :param name: The name
+        :return: True if successfully sent, False else
+        """
+        return False
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""The asyncio event loop of the async Senders"""
+
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+
+class AsyncRuntime:
+    """Runs one asyncio event loop in a dedicated thread, shared by all async Senders.
+
+    Coroutines are submitted from any thread (submit, run). Blocking calls of sync Senders and Bots
+    run on an executor with async_runtime::executor_workers threads (run_blocking).
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        self.settings = settings
+
+        runtime_settings = self.settings.get('async_runtime', {})
+        self.executor_workers = max(1, runtime_settings.get('executor_workers', 8))
+
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.started = threading.Event()
+
+        self.lock = threading.Lock()
+        self.nr_in_flight = 0
+        self.nr_in_flight_max = 0
+        self.nr_done = 0
+        self.nr_failed = 0
+
+    @classmethod
+    def get_shared(cls, settings):
+        """Returns the started runtime shared by all async Senders
+
+        :param settings: The settings, used on the first call
+        :return: The shared runtime
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = AsyncRuntime(settings)
+                cls._shared.start()
+            return cls._shared
+
+    @classmethod
+    def stop_shared(cls, timeout_s=None):
+        """Stops the shared runtime, if started
+
+        :param timeout_s: The maximum time to wait for the thread (in s), waits until finished if not set
+        """
+        with cls._shared_lock:
+            if cls._shared is not None:
+                cls._shared.stop(timeout_s)
+                cls._shared = None
+
+    def start(self):
+        """Starts the event loop thread"""
+        if self.thread:
+            return
+        logging.info('Starting async runtime')
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                              thread_name_prefix='AsyncRuntime')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self._run, name='AsyncRuntime', daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def stop(self, timeout_s=None):
+        """Stops the event loop thread, pending coroutines are cancelled
+
+        :param timeout_s: The maximum time to wait for the thread (in s), waits until finished if not set
+        """
+        if not self.thread:
+            return
+        logging.info('Stopping async runtime')
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout_s)
+        self.executor.shutdown(wait=False)
+        self.thread = None
+
+    def _run(self):
+        """Runs the event loop until stopped"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self.started.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    def _on_done(self, future):
+        """Counts a finished coroutine
+
+        :param future: The future of the coroutine
+        """
+        with self.lock:
+            self.nr_in_flight = self.nr_in_flight - 1
+            self.nr_done = self.nr_done + 1
+            if future.cancelled() or future.exception() is not None:
+                self.nr_failed = self.nr_failed + 1
+
+    def submit(self, coro):
+        """Schedules a coroutine on the event loop, does not block
+
+        :param coro: The coroutine
+        :return: A concurrent.futures.Future of the result
+        """
+        with self.lock:
+            self.nr_in_flight = self.nr_in_flight + 1
+            self.nr_in_flight_max = max(self.nr_in_flight_max, self.nr_in_flight)
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def run(self, coro, timeout_s=None):
+        """Runs a coroutine on the event loop and waits for its result. Must not be called from the event loop thread.
+
+        :param coro: The coroutine
+        :param timeout_s: The maximum time to wait (in s), waits until finished if not set
+        :return: The result of the coroutine
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout_s)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Runs a blocking function on the executor
+
+        :param func: The function
+        :return: The result of the function
+        """
+        return await self.loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    def get_stats(self):
+        """Returns the runtime counters
+
+        :return: Dict with the number of executor threads, coroutines in flight (current and maximum),
+            finished and failed coroutines
+        """
+        with self.lock:
+            return {
+                'executor_workers': self.executor_workers,
+                'nr_in_flight': self.nr_in_flight,
+                'nr_in_flight_max': self.nr_in_flight_max,
+                'nr_done': self.nr_done,
+                'nr_failed': self.nr_failed
+            }
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""An abstract async sender"""
+
+import logging
+from abc import ABC, abstractmethod
+
+from sender.Event import Event
+
+class AsyncSender(ABC):
+    """The async variant of Sender: the lifecycle and send methods are coroutines, run on the AsyncRuntime.
+    Wrap an AsyncSender in a SyncSenderAdapter to use it where a Sender is expected.
+    """
+
+    def __init__(self, settings):
+        """Initialization"""
+        super().__init__()
+
+        self.settings = settings
+        self.initialized = False
+        self.started = False
+
+    def is_initialized(self):
+        """Returns a boolean flag whether this Sender is initialized
+
+        :return: Boolean flag whether this Sender is initialized
+        """
+        return self.initialized
+
+    def is_started(self):
+        """Returns a boolean flag whether this Sender is started
+
+        :return: Boolean flag whether this Sender is started
+        """
+        return self.started
+
+    @abstractmethod
+    def is_finished(self):
+        """Returns a boolean flag whether this Sender is finished doing its tasks
+
+        :return: Boolean flag whether this Sender is finished doing its tasks
+        """
+        return True
+
+    @abstractmethod
+    def get_name(self):
+        """Returns the name of the Sender
+
+        :return: The name of the Sender
+        """
+        return 'AsyncSender'
+
+    @abstractmethod
+    async def init(self):
+        """Returns a boolean flag whether this Sender is initialized
+
+        :return: Boolean flag whether this Sender is initialized
+        """
+        return False
+
+    @abstractmethod
+    async def start(self):
+        """Starts the Sender"""
+        self.started = True
+
+    @abstractmethod
+    async def stop(self):
+        """Stops the Sender"""
+        self.started = False
+
+    @abstractmethod
+    async def cleanup(self):
+        """Cleans up the Sender, usually on end (destructor)"""
+        self.initialized = False
+
+    @abstractmethod
+    def can_send_msg(self):
+        """Returns whether this Sender can send a message
+
+        :return: Boolean flag whether this Sender can send a message
+        """
+        return False
+
+    @abstractmethod
+    def can_send_img(self):
+        """Returns whether this Sender can send an image
+
+        :return: Boolean flag whether this Sender can send an image
+        """
+        return False
+
+    @abstractmethod
+    def can_send_video(self):
+        """Returns whether this Sender can send a video
+
+        :return: Boolean flag whether this Sender can send a video
+        """
+        return False
+
+    @abstractmethod
+    async def send_msg(self, msg, subject='', force_send=False):
+        """Sends a message
+
+        :param msg: The message
+        :param subject: The subject
+        :param force_send: Boolean flag whether message should be forced to send
+        :return: Boolean flag whether message was sent
+        """
+        return False
+
+    @abstractmethod
+    async def send_image(self, fullname, subfolder, name):
+        """Sends an image
+
+        :param fullname: The full name
+        :param subfolder: The subfolder
+        :param name: The name
+        :return: Boolean flag whether message was sent
+        """
+        return False
+
+    @abstractmethod
+    async def send_video(self, fullname, subfolder, name):
+        """Sends a video
+
+        :param fullname: The full name
+        :param subfolder: The subfolder
+        :param name: The name
+        :return: Boolean flag whether message was sent
+        """
+        return False
+
+    async def send_batch(self, event):
+        """Sends all files of an event, the default sends the files one by one
+
+        :param event: The Event
+        :return: Dict full name -> Boolean flag whether the file was sent
+        """
+        results = {}
+        for fullname, subfolder, name in event.files:
+            func = self.send_video if Event.is_video(fullname) else self.send_image
+            try:
+                results[fullname] = await func(fullname, subfolder, name)
+            except Exception as e:
+                logging.error('Failed to send "{}": "{}"'.format(fullname, e))
+                results[fullname] = False
+        return results
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Presents a sync Sender as an AsyncSender"""
+
+from sender.AsyncSender import AsyncSender
+from sender.AsyncRuntime import AsyncRuntime
+
+
+class AsyncSenderAdapter(AsyncSender):
+    """Wraps a sync Sender: its blocking calls run on the executor of the AsyncRuntime,
+    so at most async_runtime::executor_workers of them are in flight at a time
+    """
+
+    def __init__(self, settings, sender, runtime=None):
+        """Initialization
+
+        :param settings: The settings
+        :param sender: The sync Sender
+        :param runtime: The AsyncRuntime, the shared one if not set
+        """
+        super().__init__(settings)
+
+        self.sender = sender
+        self.runtime = runtime if runtime else AsyncRuntime.get_shared(self.settings)
+
+    # @abstractmethod override
+    def is_initialized(self):
+        return self.sender.is_initialized()
+
+    # @abstractmethod override
+    def is_started(self):
+        return self.sender.is_started()
+
+    # @abstractmethod override
+    def is_finished(self):
+        return self.sender.is_finished()
+
+    # @abstractmethod override
+    def get_name(self):
+        return self.sender.get_name()
+
+    # @abstractmethod override
+    async def init(self):
+        return await self.runtime.run_blocking(self.sender.init)
+
+    # @abstractmethod override
+    async def start(self):
+        return await self.runtime.run_blocking(self.sender.start)
+
+    # @abstractmethod override
+    async def stop(self):
+        return await self.runtime.run_blocking(self.sender.stop)
+
+    # @abstractmethod override
+    async def cleanup(self):
+        return await self.runtime.run_blocking(self.sender.cleanup)
+
+    # @abstractmethod override
+    def can_send_msg(self):
+        return self.sender.can_send_msg()
+
+    # @abstractmethod override
+    def can_send_img(self):
+        return self.sender.can_send_img()
+
+    # @abstractmethod override
+    def can_send_video(self):
+        return self.sender.can_send_video()
+
+    # @abstractmethod override
+    async def send_msg(self, msg, subject='', force_send=False):
+        return await self.runtime.run_blocking(self.sender.send_msg, msg, subject=subject, force_send=force_send)
+
+    # @abstractmethod override
+    async def send_image(self, fullname, subfolder, name):
+        return await self.runtime.run_blocking(self.sender.send_image, fullname, subfolder, name)
+
+    # @abstractmethod override
+    async def send_video(self, fullname, subfolder, name):
+        return await self.runtime.run_blocking(self.sender.send_video, fullname, subfolder, name)
+
+    async def send_batch(self, event):
+        return await self.runtime.run_blocking(self.sender.send_batch, event)
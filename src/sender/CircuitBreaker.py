@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A circuit breaker in front of a Sender"""
+
+import time
+import logging
+import threading
+import collections
+
+
+class CircuitBreaker:
+    """Stops calling a failing Sender for a while, so callers fail fast instead of waiting for network timeouts.
+
+        * closed: calls pass. If at least min_calls calls within the last window_sec seconds were made
+          and at least failure_rate of them failed, the breaker opens.
+        * open: calls are rejected for open_sec seconds, then the breaker is half-open.
+        * half-open: up to half_open_probes calls pass as probes. A successful probe closes the breaker,
+          a failed probe opens it again.
+
+    Only transport errors (connection errors, timeouts, server errors) count as failures. A call that fails
+    for another reason, e.g. a full queue or a rejected file, says nothing about the health of the Sender.
+    The Bots catch their errors, so they report transport errors themselves via record_error.
+
+    The settings circuit_breaker::* apply to all Senders, senders::<name>::circuit_breaker overrides them.
+    """
+
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+
+    # Names of the exception classes (or their base classes) that are transport errors
+    _TRANSPORT_ERRORS = {'ConnectionError', 'TimeoutError', 'timeout', 'Timeout', 'TimedOut', 'NetworkError',
+                         'MaxRetryError', 'NewConnectionError', 'ProtocolError', 'RemoteDisconnected', 'gaierror',
+                         'InternalServerError', 'SMTPServerDisconnected', 'SMTPConnectError'}
+    # Names of the exception classes that are not transport errors, even if a base class is
+    _NO_TRANSPORT_ERRORS = {'BadRequest'}
+
+    _breakers = {}
+    _breakers_lock = threading.Lock()
+
+    def __init__(self, settings, name):
+        """Initialization
+
+        :param settings: The settings
+        :param name: The name of the Sender (the key in senders)
+        """
+        self.settings = settings
+        self.name = name
+
+        breaker_settings = dict(self.settings.get('circuit_breaker', {}))
+        breaker_settings.update(self.settings.get('senders').get(self.name, {}).get('circuit_breaker', {}))
+        self.active = breaker_settings.get('active', True)
+        self.window_s = breaker_settings.get('window_sec', 60)
+        self.min_calls = max(1, breaker_settings.get('min_calls', 5))
+        self.failure_rate = breaker_settings.get('failure_rate', 0.5)
+        self.open_s = breaker_settings.get('open_sec', 30)
+        self.half_open_probes = max(1, breaker_settings.get('half_open_probes', 1))
+
+        self.lock = threading.Lock()
+        self.state = CircuitBreaker.STATE_CLOSED
+        self.state_since = time.time()
+        # (time, success) of the calls within the window
+        self.outcomes = collections.deque()
+        self.nr_probes = 0
+
+        self.nr_calls = 0
+        self.nr_failures = 0
+        self.nr_rejected = 0
+        # 'from->to' -> number of transitions
+        self.nr_transitions = {}
+
+    @classmethod
+    def get_shared(cls, settings, name):
+        """Returns the CircuitBreaker of a Sender, shared by everything sending to the Sender
+
+        :param settings: The settings, used on the first call per Sender
+        :param name: The name of the Sender (the key in senders)
+        :return: The CircuitBreaker
+        """
+        with cls._breakers_lock:
+            if name not in cls._breakers:
+                cls._breakers[name] = CircuitBreaker(settings, name)
+            return cls._breakers[name]
+
+    @classmethod
+    def is_transport_error(cls, error):
+        """Returns whether an error is a transport error, by the names of its classes,
+        so the optional Sender libraries need not be imported
+
+        :param error: The exception
+        :return: True if a transport error, False else
+        """
+        names = {_cls.__name__ for _cls in type(error).__mro__}
+        return not names & cls._NO_TRANSPORT_ERRORS and bool(names & cls._TRANSPORT_ERRORS)
+
+    def _transition(self, state, now):
+        """Changes the state and records the transition. Call with the lock held.
+
+        :param state: The new state
+        :param now: The current time
+        """
+        transition = '{}->{}'.format(self.state, state)
+        logging.warning('Circuit breaker of Sender "{}": {} after {:.1f}s'.format(self.name, transition,
+                                                                                 now - self.state_since))
+        self.nr_transitions[transition] = self.nr_transitions.get(transition, 0) + 1
+        self.state = state
+        self.state_since = now
+        self.nr_probes = 0
+        if state == CircuitBreaker.STATE_CLOSED:
+            self.outcomes.clear()
+
+    def _trim(self, now):
+        """Forgets the outcomes outside of the window. Call with the lock held.
+
+        :param now: The current time
+        """
+        while self.outcomes and self.outcomes[0][0] < now - self.window_s:
+            self.outcomes.popleft()
+
+    def is_open(self, count_rejected=False):
+        """Returns whether calls are currently rejected, without taking a probe
+
+        :param count_rejected: Whether to count the call as rejected if open
+        :return: True if open (and not yet due for a probe), False else
+        """
+        with self.lock:
+            is_open = self.active and self.state == CircuitBreaker.STATE_OPEN \
+                and time.time() - self.state_since < self.open_s
+            if is_open and count_rejected:
+                self.nr_rejected = self.nr_rejected + 1
+            return is_open
+
+    def allow(self):
+        """Returns whether a call may pass. Every passed call must be followed by record.
+
+        :return: True if the call may pass, False if it is rejected
+        """
+        if not self.active:
+            return True
+        with self.lock:
+            now = time.time()
+            if self.state == CircuitBreaker.STATE_OPEN and now - self.state_since >= self.open_s:
+                self._transition(CircuitBreaker.STATE_HALF_OPEN, now)
+            if self.state == CircuitBreaker.STATE_CLOSED:
+                return True
+            if self.state == CircuitBreaker.STATE_HALF_OPEN and self.nr_probes < self.half_open_probes:
+                self.nr_probes = self.nr_probes + 1
+                return True
+            self.nr_rejected = self.nr_rejected + 1
+            return False
+
+    def record(self, success):
+        """Records the outcome of a passed call
+
+        :param success: Whether the call succeeded, None if it failed without a transport error
+            (only ends a probe)
+        """
+        if not self.active:
+            return
+        with self.lock:
+            now = time.time()
+            if success is None:
+                if self.state == CircuitBreaker.STATE_HALF_OPEN:
+                    self.nr_probes = max(0, self.nr_probes - 1)
+                return
+            self.nr_calls = self.nr_calls + 1
+            if not success:
+                self.nr_failures = self.nr_failures + 1
+            if self.state == CircuitBreaker.STATE_HALF_OPEN:
+                self._transition(CircuitBreaker.STATE_CLOSED if success else CircuitBreaker.STATE_OPEN, now)
+                return
+            if self.state == CircuitBreaker.STATE_OPEN:
+                return
+            self.outcomes.append((now, success))
+            self._trim(now)
+            nr_failed = sum(1 for _, _success in self.outcomes if not _success)
+            if len(self.outcomes) >= self.min_calls and nr_failed >= self.failure_rate * len(self.outcomes):
+                self._transition(CircuitBreaker.STATE_OPEN, now)
+
+    def record_error(self, error):
+        """Records a failed call if the error is a transport error
+
+        :param error: The exception
+        :return: True if recorded, False else
+        """
+        if not CircuitBreaker.is_transport_error(error):
+            return False
+        self.record(False)
+        return True
+
+    def record_result(self, success, error=None):
+        """Records the outcome of a passed call by its result.
+        A failure is recorded only for a transport error, the Bots record their own transport errors.
+
+        :param success: Whether the call succeeded
+        :param error: The exception raised by the call, if any
+        """
+        if success:
+            self.record(True)
+        elif error is None or not self.record_error(error):
+            self.record(None)
+
+    def get_stats(self):
+        """Returns the breaker counters
+
+        :return: Dict with the state, the time in the state (in s), the failure rate within the window,
+            the number of passed, failed and rejected calls and the number of transitions per 'from->to'
+        """
+        with self.lock:
+            now = time.time()
+            self._trim(now)
+            nr_failed = sum(1 for _, success in self.outcomes if not success)
+            return {
+                'state': self.state,
+                'state_for_s': now - self.state_since,
+                'failure_rate': (nr_failed / len(self.outcomes)) if self.outcomes else 0,
+                'nr_calls': self.nr_calls,
+                'nr_failures': self.nr_failures,
+                'nr_rejected': self.nr_rejected,
+                'nr_transitions': dict(self.nr_transitions)
+            }
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""The files of an event, sent in one batch"""
+
+import os
+
+
+class Event:
+    """Describes the files of an event (a capture folder) for Sender::send_batch"""
+
+    def __init__(self, name, files, sync_datetime=''):
+        """Initialization
+
+        :param name: The name of the event, the folder of the files relative to the local folder
+        :param files: List of tuples (full name, subfolder, name)
+        :param sync_datetime: The date time string of the sync that found the files
+        """
+        self.name = name
+        self.files = list(files)
+        self.sync_datetime = sync_datetime
+
+    def __len__(self):
+        return len(self.files)
+
+    def __repr__(self):
+        return 'Event(name="{}", files={})'.format(self.name, len(self.files))
+
+    @staticmethod
+    def is_video(fullname):
+        """Returns whether a file is a video
+
+        :param fullname: The full name
+        :return: True if the file is a video, False if it is an image
+        """
+        return fullname.endswith('.mp4')
+
+    def get_images(self):
+        """Returns the images of the event
+
+        :return: List of tuples (full name, subfolder, name)
+        """
+        return [f for f in self.files if not Event.is_video(f[0])]
+
+    def get_videos(self):
+        """Returns the videos of the event
+
+        :return: List of tuples (full name, subfolder, name)
+        """
+        return [f for f in self.files if Event.is_video(f[0])]
+
+    def get_size(self):
+        """Returns the total size of the files of the event
+
+        :return: The size (in bytes), files that do not exist (anymore) are not counted
+        """
+        size = 0
+        for fullname, _, _ in self.files:
+            try:
+                size = size + os.path.getsize(fullname)
+            except OSError:
+                pass
+        return size
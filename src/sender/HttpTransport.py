@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""The HTTP transport shared by the network Senders"""
+
+import logging
+import threading
+
+
+class HttpTransport:
+    """Sizes, warms up and monitors the keep-alive connection pools of the HTTP Senders.
+
+    Every Sender registers its connection pool under its name: a requests Session (see create_session)
+    or a urllib3 PoolManager (e.g. the one of python-telegram-bot, see create_telegram_request).
+    The settings http::pool_maxsize, http::connect_timeout_sec and http::read_timeout_sec apply to all pools.
+    With http::prewarm_active, connections to the hosts of a Sender are opened in the background on start,
+    so the first upload of an event does not pay the TLS handshake.
+    The number of connections opened (handshakes) and requests per host tell how well connections are reused.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        self.settings = settings
+
+        http_settings = self.settings.get('http', {})
+        self.pool_maxsize = max(1, http_settings.get('pool_maxsize', 8))
+        self.connect_timeout_s = http_settings.get('connect_timeout_sec', 5)
+        self.read_timeout_s = http_settings.get('read_timeout_sec', 30)
+        self.prewarm_active = http_settings.get('prewarm_active', True)
+
+        self.lock = threading.Lock()
+        # Name -> requests Session or urllib3 PoolManager
+        self.managers = {}
+        self.nr_prewarmed = {}
+
+    @classmethod
+    def get_shared(cls, settings):
+        """Returns the transport shared by all Senders
+
+        :param settings: The settings, used on the first call
+        :return: The shared transport
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = HttpTransport(settings)
+            return cls._shared
+
+    def get_timeout(self):
+        """Returns the request timeout
+
+        :return: Tuple (connect timeout, read timeout) (in s)
+        """
+        return (self.connect_timeout_s, self.read_timeout_s)
+
+    def register(self, name, manager):
+        """Registers the connection pool of a Sender
+
+        :param name: The name of the Sender
+        :param manager: The requests Session or urllib3 PoolManager
+        :return: The manager
+        """
+        with self.lock:
+            self.managers[name] = manager
+        return manager
+
+    def create_session(self, name):
+        """Creates and registers a requests Session with a keep-alive connection pool
+
+        :param name: The name of the Sender
+        :return: The session
+        """
+        requests = __import__('requests', globals(), locals(), ['adapters'], 0)
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return self.register(name, session)
+
+    def create_telegram_request(self, name, telegram, con_pool_size):
+        """Creates a python-telegram-bot Request with the transport timeouts and registers its connection pool
+
+        :param name: The name of the Sender
+        :param telegram: The telegram module
+        :param con_pool_size: The minimum number of connections
+        :return: The Request
+        """
+        request = telegram.utils.request.Request(con_pool_size=max(con_pool_size, self.pool_maxsize),
+                                                 connect_timeout=self.connect_timeout_s,
+                                                 read_timeout=self.read_timeout_s)
+        manager = getattr(request, '_con_pool', None)
+        if manager is not None:
+            self.register(name, manager)
+        return request
+
+    def prewarm(self, name, urls):
+        """Opens connections to the hosts of a Sender in the background
+
+        :param name: The name of the Sender
+        :param urls: The URLs to send a HEAD request to, one per host
+        """
+        if not self.prewarm_active:
+            return
+        with self.lock:
+            manager = self.managers.get(name)
+        if manager is None:
+            return
+
+        def run():
+            for url in urls:
+                try:
+                    manager.request('HEAD', url, timeout=self.connect_timeout_s)
+                    with self.lock:
+                        self.nr_prewarmed[name] = self.nr_prewarmed.get(name, 0) + 1
+                except Exception as e:
+                    logging.debug('Failed to prewarm a connection to "{}": "{}"'.format(url, e))
+
+        threading.Thread(target=run, name='HttpPrewarm-{}'.format(name), daemon=True).start()
+
+    def _get_pools(self, manager):
+        """Returns the connection pools of a manager
+
+        :param manager: The requests Session or urllib3 PoolManager
+        :return: List of urllib3 HTTPConnectionPools
+        """
+        if hasattr(manager, 'adapters'):
+            pool_managers = [adapter.poolmanager for adapter in set(manager.adapters.values())
+                             if getattr(adapter, 'poolmanager', None) is not None]
+        else:
+            pool_managers = [manager]
+        pools = []
+        for pool_manager in pool_managers:
+            for key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(key)
+                if pool is not None:
+                    pools.append(pool)
+        return pools
+
+    def get_stats(self, name=None):
+        """Returns the connection counters per host
+
+        :param name: Only return the counters of this Sender, of all Senders if not set
+        :return: Dict Sender name -> Dict with the number of prewarm requests and
+            dict host -> Dict with the number of connections opened (handshakes), requests and reused connections
+        """
+        with self.lock:
+            managers = {n: m for n, m in self.managers.items() if name is None or n == name}
+            nr_prewarmed = dict(self.nr_prewarmed)
+        stats = {}
+        for _name, manager in managers.items():
+            hosts = {}
+            for pool in self._get_pools(manager):
+                host = '{}://{}:{}'.format(pool.scheme, pool.host, pool.port)
+                counts = hosts.setdefault(host, {'nr_connections': 0, 'nr_requests': 0, 'nr_reused': 0})
+                counts['nr_connections'] = counts['nr_connections'] + pool.num_connections
+                counts['nr_requests'] = counts['nr_requests'] + pool.num_requests
+                counts['nr_reused'] = max(0, counts['nr_requests'] - counts['nr_connections'])
+            stats[_name] = {'nr_prewarmed': nr_prewarmed.get(_name, 0), 'hosts': hosts}
+        return stats.get(name, {'nr_prewarmed': 0, 'hosts': {}}) if name is not None else stats
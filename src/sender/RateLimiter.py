@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Rate limits of a Sender: messages, bytes and requests"""
+
+import logging
+import threading
+
+from sender.TokenBucket import TokenBucket
+
+
+class RateLimiter:
+    """One TokenBucket per kind, configured in senders::<name>::rate_limits:
+        * messages: messages_per_sec and messages_burst, applied to every message
+        * bytes: bytes_per_sec and bytes_burst, applied to the size of every uploaded file or event
+        * requests: requests_per_sec and requests_burst, applied to every upload (a file or a batch)
+    A rate of 0 does not limit. Without messages_per_sec, the message rate is one per
+    senders::<name>::interval_messages_send_sec (if set). Excess waits for its tokens, it is not dropped.
+    """
+
+    MESSAGES = 'messages'
+    BYTES = 'bytes'
+    REQUESTS = 'requests'
+
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+
+    def __init__(self, settings, name):
+        """Initialization
+
+        :param settings: The settings
+        :param name: The name of the Sender (the key in senders)
+        """
+        self.settings = settings
+        self.name = name
+
+        limits = self.settings.get('senders').get(self.name, {}).get('rate_limits', {})
+
+        messages_per_s = limits.get('messages_per_sec')
+        if messages_per_s is None:
+            interval_s = self.settings.get('senders').get(self.name, {}).get('interval_messages_send_sec', 0)
+            messages_per_s = (1.0 / interval_s) if interval_s and interval_s > 0 else 0
+        bytes_per_s = limits.get('bytes_per_sec', 0)
+
+        self.buckets = {
+            RateLimiter.MESSAGES: TokenBucket(messages_per_s, limits.get('messages_burst', 1)),
+            RateLimiter.BYTES: TokenBucket(bytes_per_s, limits.get('bytes_burst', max(1, int(bytes_per_s)))),
+            RateLimiter.REQUESTS: TokenBucket(limits.get('requests_per_sec', 0), limits.get('requests_burst', 1))
+        }
+
+    @classmethod
+    def get_shared(cls, settings, name):
+        """Returns the RateLimiter of a Sender, shared by everything sending to the Sender
+
+        :param settings: The settings, used on the first call per Sender
+        :param name: The name of the Sender (the key in senders)
+        :return: The RateLimiter
+        """
+        with cls._limiters_lock:
+            if name not in cls._limiters:
+                cls._limiters[name] = RateLimiter(settings, name)
+            return cls._limiters[name]
+
+    def get_bucket(self, kind):
+        """Returns the bucket of a kind
+
+        :param kind: MESSAGES, BYTES or REQUESTS
+        :return: The TokenBucket
+        """
+        return self.buckets[kind]
+
+    def acquire(self, kind, amount=1):
+        """Blocks until the rate limit of a kind allows amount more
+
+        :param kind: MESSAGES, BYTES or REQUESTS
+        :param amount: The amount (number of messages or requests, bytes)
+        :return: The time waited (in s)
+        """
+        waited_s = self.buckets[kind].acquire(amount)
+        if waited_s > 0:
+            logging.debug('Sender "{}" waited {:.2f}s for the {} rate limit'.format(self.name, waited_s, kind))
+        return waited_s
+
+    def acquire_upload(self, size):
+        """Blocks until the rate limits allow one more upload of size bytes
+
+        :param size: The size of the upload (in bytes)
+        :return: The time waited (in s)
+        """
+        return self.acquire(RateLimiter.REQUESTS) + self.acquire(RateLimiter.BYTES, size)
+
+    def get_stats(self):
+        """Returns the bucket counters
+
+        :return: Dict kind -> Dict with the bucket counters
+        """
+        return {kind: bucket.get_stats() for kind, bucket in self.buckets.items()}
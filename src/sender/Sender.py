@@ -9,8 +9,11 @@
 
 """An abstract sender"""
 
+import logging
 from abc import ABC, abstractmethod
 
+from sender.Event import Event
+
 class Sender(ABC):
     """Senders need to be registered BY HAND in SenderRegister::_SENDER_INFO"""
 
@@ -133,3 +136,28 @@ class Sender(ABC):
         :return: Boolean flag whether message was sent
         """
         return False
+
+    def send_batch(self, event):
+        """Sends all files of an event. Senders that can optimize across the files of an event
+        (e.g. albums, batch commits) override this, the default sends the files one by one.
+
+        :param event: The Event
+        :return: Dict full name -> Boolean flag whether the file was sent
+        """
+        results = {}
+        for fullname, subfolder, name in event.files:
+            func = self.send_video if Event.is_video(fullname) else self.send_image
+            try:
+                results[fullname] = func(fullname, subfolder, name)
+            except Exception as e:
+                logging.error('Failed to send "{}": "{}"'.format(fullname, e))
+                results[fullname] = False
+        return results
+
+    def records_send_results(self):
+        """Returns whether the Sender records the outcome of sending a message in its CircuitBreaker itself,
+        e.g. because send_msg only queues the message
+
+        :return: Boolean flag whether the Sender records the outcome of sending a message itself
+        """
+        return False
@@ -13,6 +13,8 @@ import logging
 
 from tools.Helper import get_subclasses_of
 import sender.Sender
+import sender.AsyncSender
+from sender.SyncSenderAdapter import SyncSenderAdapter
 
 
 class SenderRegister:
@@ -44,21 +46,40 @@ class SenderRegister:
         }
     ]
 
-    def __init__(self):
-        """Initialization"""
+    def __init__(self, sender_info=None):
+        """Initialization
+
+        :param sender_info: The Sender info, _SENDER_INFO if not set
+        """
         logging.info('Initializing SenderRegister')
 
         logging.info('Searching for senders')
 
-        for s_info in self._SENDER_INFO:
+        self.sender_info = sender_info if sender_info is not None else self._SENDER_INFO
+        for s_info in self.sender_info:
             __import__(s_info['fullpackage'], globals(), locals(), [s_info['name']], 0)
 
-        # Make sure the given class is a subclass of Sender
+        # Make sure the given class is a subclass of Sender or AsyncSender
         self.sender_classes = get_subclasses_of(sender.Sender.Sender)
-        for s_class in self.sender_classes:
-            for s_info in self._SENDER_INFO:
+        self.async_sender_classes = get_subclasses_of(sender.AsyncSender.AsyncSender)
+        for s_class in self.sender_classes + self.async_sender_classes:
+            for s_info in self.sender_info:
                 if s_info['name'] == s_class.__name__:
                     s_info['class'] = s_class
-        self.senders = [s for s in self._SENDER_INFO if s['class'] != None]
+        self.senders = [s for s in self.sender_info if s['class'] != None]
 
         logging.info('Found {} Senders'.format(len(self.senders)))
+
+    def create(self, s_info, settings):
+        """Creates a Sender. AsyncSenders are wrapped in a SyncSenderAdapter,
+        so they plug into the FileSyncer and the MessageDispatcher like sync Senders
+
+        :param s_info: The Sender info
+        :param settings: The settings
+        :return: The Sender
+        """
+        s_class = s_info['class']
+        if issubclass(s_class, sender.AsyncSender.AsyncSender):
+            logging.debug('Wrapping AsyncSender "{}" in a SyncSenderAdapter'.format(s_info['name']))
+            return SyncSenderAdapter(settings, s_class(settings))
+        return s_class(settings)
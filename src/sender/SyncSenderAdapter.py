@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Presents an AsyncSender as a sync Sender"""
+
+from sender.Sender import Sender
+from sender.AsyncRuntime import AsyncRuntime
+
+
+class SyncSenderAdapter(Sender):
+    """Wraps an AsyncSender: every call runs on the AsyncRuntime and blocks the calling thread until done,
+    so async Senders plug into the FileSyncer and the MessageDispatcher like sync Senders
+    """
+
+    def __init__(self, settings, sender, runtime=None):
+        """Initialization
+
+        :param settings: The settings
+        :param sender: The AsyncSender
+        :param runtime: The AsyncRuntime, the shared one if not set
+        """
+        super().__init__(settings)
+
+        self.sender = sender
+        self.runtime = runtime if runtime else AsyncRuntime.get_shared(self.settings)
+
+    def get_stats(self):
+        """Returns the counters of the AsyncSender (if it has any) and of the runtime
+
+        :return: Dict with the counters
+        """
+        stats = self.sender.get_stats() if callable(getattr(self.sender, 'get_stats', None)) else {}
+        return dict(stats, runtime=self.runtime.get_stats())
+
+    # @abstractmethod override
+    def is_initialized(self):
+        return self.sender.is_initialized()
+
+    # @abstractmethod override
+    def is_started(self):
+        return self.sender.is_started()
+
+    # @abstractmethod override
+    def is_finished(self):
+        return self.sender.is_finished()
+
+    # @abstractmethod override
+    def get_name(self):
+        return self.sender.get_name()
+
+    # @abstractmethod override
+    def init(self):
+        return self.runtime.run(self.sender.init())
+
+    # @abstractmethod override
+    def start(self):
+        return self.runtime.run(self.sender.start())
+
+    # @abstractmethod override
+    def stop(self):
+        return self.runtime.run(self.sender.stop())
+
+    # @abstractmethod override
+    def cleanup(self):
+        return self.runtime.run(self.sender.cleanup())
+
+    # @abstractmethod override
+    def can_send_msg(self):
+        return self.sender.can_send_msg()
+
+    # @abstractmethod override
+    def can_send_img(self):
+        return self.sender.can_send_img()
+
+    # @abstractmethod override
+    def can_send_video(self):
+        return self.sender.can_send_video()
+
+    # @abstractmethod override
+    def send_msg(self, msg, subject='', force_send=False):
+        return self.runtime.run(self.sender.send_msg(msg, subject=subject, force_send=force_send))
+
+    # @abstractmethod override
+    def send_image(self, fullname, subfolder, name):
+        return self.runtime.run(self.sender.send_image(fullname, subfolder, name))
+
+    # @abstractmethod override
+    def send_video(self, fullname, subfolder, name):
+        return self.runtime.run(self.sender.send_video(fullname, subfolder, name))
+
+    def send_batch(self, event):
+        return self.runtime.run(self.sender.send_batch(event))
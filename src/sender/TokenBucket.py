@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A thread-safe token bucket"""
+
+import time
+import threading
+
+
+class TokenBucket:
+    """Refills at rate_per_s tokens per second up to burst tokens. acquire blocks until enough tokens are
+    available, so excess is delayed instead of dropped. A rate of 0 (or None) does not limit.
+
+    An amount larger than the burst is granted once the bucket is full and leaves the bucket in debt,
+    so large files are delayed by their size but never blocked forever.
+    """
+
+    def __init__(self, rate_per_s, burst=1):
+        """Initialization
+
+        :param rate_per_s: The refill rate (in tokens/s), 0 or None for no limit
+        :param burst: The maximum number of tokens
+        """
+        self.rate = rate_per_s or 0
+        self.burst = max(1, burst)
+
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.last_refill = time.time()
+        # No tokens before this time
+        self.blocked_until = 0
+
+        self.nr_acquired = 0
+        self.amount_acquired = 0
+        self.nr_delayed = 0
+        self.wait_s = 0
+
+    def _refill(self, now):
+        """Refills the bucket. Call with the lock held.
+
+        :param now: The current time
+        """
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _take(self, now, amount, waited_s):
+        """Takes tokens and counts the acquisition. Call with the lock held.
+
+        :param now: The current time
+        :param amount: The number of tokens
+        :param waited_s: The time waited (in s)
+        """
+        if self.rate > 0:
+            self.tokens = self.tokens - amount
+        self.nr_acquired = self.nr_acquired + 1
+        self.amount_acquired = self.amount_acquired + amount
+        if waited_s > 0:
+            self.nr_delayed = self.nr_delayed + 1
+            self.wait_s = self.wait_s + waited_s
+
+    def acquire(self, amount=1):
+        """Blocks until amount tokens are available and takes them
+
+        :param amount: The number of tokens
+        :return: The time waited (in s)
+        """
+        waited_s = 0
+        while True:
+            with self.lock:
+                now = time.time()
+                self._refill(now)
+                needed = min(amount, self.burst)
+                if now >= self.blocked_until and (self.rate <= 0 or self.tokens >= needed):
+                    self._take(now, amount, waited_s)
+                    return waited_s
+                delay_s = self.blocked_until - now
+                if self.rate > 0:
+                    delay_s = max(delay_s, (needed - self.tokens) / self.rate)
+            time.sleep(delay_s)
+            waited_s = waited_s + delay_s
+
+    def set_rate(self, rate_per_s):
+        """Changes the refill rate
+
+        :param rate_per_s: The refill rate (in tokens/s), 0 or None for no limit
+        """
+        with self.lock:
+            self._refill(time.time())
+            self.rate = rate_per_s or 0
+
+    def get_rate(self):
+        """Returns the refill rate
+
+        :return: The refill rate (in tokens/s), 0 for no limit
+        """
+        with self.lock:
+            return self.rate
+
+    def block(self, duration_s):
+        """Empties the bucket and grants no tokens for a while
+
+        :param duration_s: The time to grant no tokens (in s)
+        """
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0)
+            self.blocked_until = max(self.blocked_until, now + duration_s)
+
+    def get_stats(self):
+        """Returns the bucket counters
+
+        :return: Dict with the rate, the burst, the available tokens, the time tokens are still blocked for,
+            the number of acquisitions and acquired tokens, the number of delayed acquisitions and the total wait time
+        """
+        with self.lock:
+            now = time.time()
+            self._refill(now)
+            return {
+                'rate_per_s': self.rate,
+                'burst': self.burst,
+                'tokens': self.tokens,
+                'blocked_for_s': max(0, self.blocked_until - now),
+                'nr_acquired': self.nr_acquired,
+                'amount_acquired': self.amount_acquired,
+                'nr_delayed': self.nr_delayed,
+                'wait_s': self.wait_s
+            }
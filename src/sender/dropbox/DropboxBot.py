@@ -13,11 +13,42 @@ import logging
 import os
 import datetime
 import time
+import threading
+import concurrent.futures
 
 from sender.Bot import Bot
+from sender.HttpTransport import HttpTransport
+from sender.CircuitBreaker import CircuitBreaker
+from sender.dropbox.RequestGovernor import RequestGovernor
 
 
 class DropboxBot(Bot):
+    """Files larger than senders::dropbox::upload_session_threshold_mb are uploaded in an upload session,
+    in chunks of senders::dropbox::upload_chunk_mb, so only one chunk is held in memory at a time.
+
+    The files of a batch (e.g. a motion event) are uploaded in up to senders::dropbox::batch_sessions concurrent
+    upload sessions and committed in one operation.
+
+    With senders::dropbox::governor_active, every API request passes the RequestGovernor.
+    Connections are kept alive in the pool of the shared HttpTransport.
+    """
+
+    # Maximum number of entries of files_upload_session_finish_batch
+    _BATCH_MAX_FILES = 1000
+    _BATCH_CHECK_INTERVAL_MAX_S = 2
+    # One request per API host to open its connection before the first upload
+    _PREWARM_URLS = ['https://api.dropboxapi.com/', 'https://content.dropboxapi.com/']
+
+    _BACKEND_INFO = {
+        'dropbox': {
+            'fullpackage': 'dropbox',
+            'name': 'dropbox'
+        },
+        'fake': {
+            'fullpackage': 'sender.dropbox.FakeDropbox',
+            'name': 'FakeDropbox'
+        }
+    }
 
     def __init__(self, settings):
         """Initialization
@@ -29,17 +60,49 @@ class DropboxBot(Bot):
         logging.info('Initializing Dropbox Bot')
 
         #import dropbox
-        self.dropbox = __import__('dropbox', globals(), locals(), [], 0)
+        self.dropbox = self._load_backend(self.settings.get_sender('dropbox', 'backend', 'dropbox'))
 
-        self.cloud_folder = self.settings.get('dropbox', 'remote_folder_name')
+        self.cloud_folder = self.settings.get_sender('dropbox', 'remote_folder_name')
         self.access_token = self.settings.get_sender('dropbox', 'access_token')
+        self.session_threshold = int(
+            self.settings.get_sender('dropbox', 'upload_session_threshold_mb', 8) * 1024 * 1024)
+        self.chunk_size = max(1, int(self.settings.get_sender('dropbox', 'upload_chunk_mb', 4) * 1024 * 1024))
+        self.batch_sessions = self.settings.get_sender('dropbox', 'batch_sessions', 4)
+        self.batch_check_interval_s = self.settings.get_sender('dropbox', 'batch_check_interval_sec', 0.1)
+
+        self.governor = None
+        if self.settings.get_sender('dropbox', 'governor_active', True):
+            self.governor = RequestGovernor(self.settings,
+                                            rate_limit_error=getattr(self.dropbox.exceptions, 'RateLimitError', None))
+
+        self.circuit_breaker = CircuitBreaker.get_shared(self.settings, 'dropbox')
+
+        self.lock = threading.Lock()
+        self.nr_api_calls = {}
+        self.nr_batches = 0
+        self.nr_batch_files = 0
+        self.nr_batch_api_calls = 0
 
         self.cleaned_up = True
         self.initialized = False
         self.started = False
 
+        self.transport = None
         self.bot = None
 
+    def _load_backend(self, name):
+        """Loads the dropbox module
+
+        :param name: The backend name, see _BACKEND_INFO
+        :return: The module
+        """
+        b_info = self._BACKEND_INFO.get(name)
+        if not b_info:
+            logging.error('Unknown Dropbox backend "{}", falling back to "dropbox"'.format(name))
+            b_info = self._BACKEND_INFO['dropbox']
+        logging.info('Loading Dropbox backend "{}"'.format(b_info['name']))
+        return __import__(b_info['fullpackage'], globals(), locals(), [b_info['name']], 0)
+
     # @abstractmethod override
     def init(self):
         """Manual initialization"""
@@ -50,7 +113,19 @@ class DropboxBot(Bot):
         logging.debug('Initializing')
 
         try:
-            self.bot = self.dropbox.Dropbox(self.access_token)
+            self.transport = HttpTransport.get_shared(self.settings)
+            session = None
+            if hasattr(self.dropbox, 'create_session'):
+                # The SDK session pins the Dropbox certificates, only its pool is sized and monitored
+                session = self.transport.register(
+                    'dropbox', self.dropbox.create_session(max_connections=self.transport.pool_maxsize))
+            # Rate limits are handled by the governor, not retried by the SDK
+            self.bot = self.dropbox.Dropbox(self.access_token,
+                                            session=session,
+                                            timeout=self.transport.get_timeout(),
+                                            max_retries_on_rate_limit=0)
+            if session is not None:
+                self.transport.prewarm('dropbox', self._PREWARM_URLS)
             self.initialized = True
         except Exception as e:
             logging.error('Error initializing: "{}"'.format(e))
@@ -129,6 +204,77 @@ class DropboxBot(Bot):
     def send_message(self, msg, subject=''):
         return True
 
+    def get_stats(self):
+        """Returns the API call counters
+
+        :return: Dict with the number of API calls per call name (including requeued calls), the number of
+            uploaded batches and their files, the mean number of API calls per batch, the governor counters
+            and the connection counters per host
+        """
+        with self.lock:
+            stats = {
+                'nr_api_calls': dict(self.nr_api_calls),
+                'nr_batches': self.nr_batches,
+                'nr_batch_files': self.nr_batch_files,
+                'api_calls_per_batch': (self.nr_batch_api_calls / self.nr_batches) if self.nr_batches else 0
+            }
+        if self.governor:
+            stats['governor'] = self.governor.get_stats()
+        if self.transport:
+            stats['http'] = self.transport.get_stats('dropbox')
+        return stats
+
+    def _api(self, name, *args, counter=None, **kwargs):
+        """Calls and counts an API function
+
+        :param name: The name of the API function
+        :param counter: List with a single counter to increment, e.g. the API calls of a batch
+        :return: The result of the API function
+        """
+        func = getattr(self.bot, name)
+
+        def request():
+            with self.lock:
+                self.nr_api_calls[name] = self.nr_api_calls.get(name, 0) + 1
+                if counter is not None:
+                    counter[0] = counter[0] + 1
+            return func(*args, **kwargs)
+
+        try:
+            return self.governor.call(request) if self.governor else request()
+        except Exception as e:
+            self.circuit_breaker.record_error(e)
+            raise
+
+    def _get_path(self, subfolder, name):
+        """Returns the remote path of a file
+
+        :param subfolder: The subfolder
+        :param name: The name
+        :return: The remote path
+        """
+        path = '/{}/{}/{}'.format(self.cloud_folder,
+                                  subfolder.replace(os.path.sep, '/'), name)
+        while '//' in path:
+            path = path.replace('//', '/')
+        return path
+
+    def _get_commit_info(self, fullname, path):
+        """Returns the commit info of a file
+
+        :param fullname: The full name
+        :param path: The remote path
+        :return: The commit info
+        """
+        overwrite = True
+        mode = (
+            self.dropbox.files.WriteMode.overwrite if overwrite else self.dropbox.files.WriteMode.add)
+        mtime = os.path.getmtime(fullname)
+        return self.dropbox.files.CommitInfo(path=path,
+                                             mode=mode,
+                                             client_modified=datetime.datetime(*time.gmtime(mtime)[:6]),
+                                             mute=True)
+
     # @abstractmethod override
     def send_image(self, fullname, subfolder, name):
         if not self.initialized:
@@ -139,30 +285,28 @@ class DropboxBot(Bot):
             logging.error('Not started')
             return False
 
-        path = '/{}/{}/{}'.format(self.cloud_folder,
-                                  subfolder.replace(os.path.sep, '/'), name)
-        while '//' in path:
-            path = path.replace('//', '/')
+        path = self._get_path(subfolder, name)
         logging.info('Uploading to "{}"'.format(path))
 
         try:
-            with open(fullname, 'rb') as f:
-                data = f.read()
+            f = open(fullname, 'rb')
         except Exception as e:
             logging.error('Failed to open file "{}": "{}"'.format(fullname, e))
             return False
 
         try:
-            overwrite = True
-            mode = (
-                self.dropbox.files.WriteMode.overwrite if overwrite else self.dropbox.files.WriteMode.add)
-            mtime = os.path.getmtime(fullname)
-            res = self.bot.files_upload(data,
-                                        path,
-                                        mode,
-                                        client_modified=datetime.datetime(
-                                            *time.gmtime(mtime)[:6]),
-                                        mute=True)
+            commit = self._get_commit_info(fullname, path)
+            size = os.fstat(f.fileno()).st_size
+            if size > self.session_threshold:
+                cursor = self._upload_session(f, size)
+                res = self._api('files_upload_session_finish', f.read(self.chunk_size), cursor, commit)
+            else:
+                res = self._api('files_upload',
+                                f.read(),
+                                commit.path,
+                                commit.mode,
+                                client_modified=commit.client_modified,
+                                mute=commit.mute)
             logging.debug('Uploaded as "{}"'.format(res.name.encode('utf8')))
             return True
         except self.dropbox.exceptions.ApiError as err:
@@ -172,7 +316,121 @@ class DropboxBot(Bot):
             logging.error(
                 'Failed to upload file "{}": "{}"'.format(fullname, e))
             return False
+        finally:
+            f.close()
+
+    def _upload_session(self, f, size, close=False, counter=None):
+        """Uploads a file in chunks via an upload session, up to the last chunk if the session is not closed
+
+        :param f: The opened file
+        :param size: The file size
+        :param close: Whether to upload all chunks and close the session
+        :param counter: API call counter, see _api
+        :return: The upload session cursor
+        """
+        logging.debug('Uploading {} bytes in chunks of {} bytes'.format(size, self.chunk_size))
+        session = self._api('files_upload_session_start', f.read(self.chunk_size),
+                            close=close and (size - f.tell()) <= 0, counter=counter)
+        cursor = self.dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=f.tell())
+        while (size - f.tell()) > (0 if close else self.chunk_size):
+            data = f.read(self.chunk_size)
+            self._api('files_upload_session_append_v2', data, cursor, close=close and (size - f.tell()) <= 0,
+                      counter=counter)
+            cursor.offset = f.tell()
+        return cursor
 
     # @abstractmethod override
     def send_video(self, fullname, subfolder, name):
-        self.send_image(fullname, subfolder, name)
+        return self.send_image(fullname, subfolder, name)
+
+    def _upload_batch_file(self, fullname, subfolder, name, counter):
+        """Uploads a file of a batch into a closed upload session
+
+        :param fullname: The full name
+        :param subfolder: The subfolder
+        :param name: The name
+        :param counter: API call counter, see _api
+        :return: The finish argument of the session
+        """
+        path = self._get_path(subfolder, name)
+        logging.info('Uploading to "{}" (batch)'.format(path))
+        with open(fullname, 'rb') as f:
+            commit = self._get_commit_info(fullname, path)
+            cursor = self._upload_session(f, os.fstat(f.fileno()).st_size, close=True, counter=counter)
+        return self.dropbox.files.UploadSessionFinishArg(cursor, commit)
+
+    def _finish_batch(self, entries, counter):
+        """Commits closed upload sessions in one batch
+
+        :param entries: The finish arguments of the sessions
+        :param counter: API call counter, see _api
+        :return: List of the result entries, in the order of the finish arguments
+        """
+        if hasattr(self.bot, 'files_upload_session_finish_batch_v2'):
+            return self._api('files_upload_session_finish_batch_v2', entries, counter=counter).entries
+
+        launch = self._api('files_upload_session_finish_batch', entries, counter=counter)
+        if launch.is_complete():
+            return launch.get_complete().entries
+        async_job_id = launch.get_async_job_id()
+        interval_s = self.batch_check_interval_s
+        while True:
+            time.sleep(interval_s)
+            status = self._api('files_upload_session_finish_batch_check', async_job_id, counter=counter)
+            if status.is_complete():
+                return status.get_complete().entries
+            interval_s = min(2 * interval_s, self._BATCH_CHECK_INTERVAL_MAX_S)
+
+    def send_files(self, files):
+        """Uploads files concurrently in upload sessions and commits them in one batch
+
+        :param files: List of tuples (full name, subfolder, name)
+        :return: Dict full name -> Boolean flag whether the file was uploaded
+        """
+        results = {fullname: False for fullname, _, _ in files}
+        if not self.initialized:
+            logging.error('Not initialized')
+            return results
+
+        if not self.started:
+            logging.error('Not started')
+            return results
+
+        counter = [0]
+        entries = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(len(files), self.batch_sessions)),
+                                                   thread_name_prefix='DropboxBatch') as executor:
+            futures = [(fullname, executor.submit(self._upload_batch_file, fullname, subfolder, name, counter))
+                       for fullname, subfolder, name in files]
+            for fullname, future in futures:
+                try:
+                    entries.append((fullname, future.result()))
+                except self.dropbox.exceptions.ApiError as err:
+                    logging.error('API error uploading "{}": "{}"'.format(fullname, err))
+                except Exception as e:
+                    logging.error('Failed to upload file "{}": "{}"'.format(fullname, e))
+
+        for i in range(0, len(entries), self._BATCH_MAX_FILES):
+            batch = entries[i:i + self._BATCH_MAX_FILES]
+            try:
+                result_entries = self._finish_batch([entry for _, entry in batch], counter)
+            except self.dropbox.exceptions.ApiError as err:
+                logging.error('API error committing {} file(s): "{}"'.format(len(batch), err))
+                continue
+            except Exception as e:
+                logging.error('Failed to commit {} file(s): "{}"'.format(len(batch), e))
+                continue
+            for (fullname, _), result_entry in zip(batch, result_entries):
+                if result_entry.is_success():
+                    logging.debug('Uploaded as "{}"'.format(result_entry.get_success().name.encode('utf8')))
+                    results[fullname] = True
+                else:
+                    logging.error('Failed to commit file "{}": "{}"'.format(fullname, result_entry.get_failure()))
+
+        with self.lock:
+            self.nr_batches = self.nr_batches + 1
+            self.nr_batch_files = self.nr_batch_files + len(files)
+            self.nr_batch_api_calls = self.nr_batch_api_calls + counter[0]
+        logging.info('Uploaded {} of {} file(s) in one batch, {} API call(s)'.format(
+            sum(results.values()), len(files), counter[0]))
+        return results
@@ -12,6 +12,7 @@
 import logging
 
 from sender.Sender import Sender
+from sender.Event import Event
 from sender.dropbox.DropboxBot import DropboxBot
 
 
@@ -111,3 +112,36 @@ class DropboxSender(Sender):
 
         logging.debug('Sending video to dropbox')
         return self.dropbox_bot.send_video(fullname, subfolder, name)
+
+    def send_batch(self, event):
+        """Sends all files of an event in one batch
+
+        :param event: The Event
+        :return: Dict full name -> Boolean flag whether the file was sent
+        """
+        results = {}
+        to_send = []
+        for fullname, subfolder, name in event.files:
+            if not (self.can_send_video() if Event.is_video(fullname) else self.can_send_img()):
+                logging.debug('This sender is configured not to send "{}"'.format(name))
+                results[fullname] = True
+            else:
+                to_send.append((fullname, subfolder, name))
+        if not to_send:
+            return results
+
+        if not self.is_initialized() or not self.is_started():
+            logging.debug('Not sending event to dropbox')
+            results.update({fullname: False for fullname, _, _ in to_send})
+            return results
+
+        logging.debug('Sending event with {} file(s) to dropbox'.format(len(to_send)))
+        results.update(self.dropbox_bot.send_files(to_send))
+        return results
+
+    def get_stats(self):
+        """Returns the API call counters of the Dropbox Bot
+
+        :return: Dict with the API call counters
+        """
+        return self.dropbox_bot.get_stats()
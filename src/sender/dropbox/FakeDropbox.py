@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A fake of the parts of the dropbox module used by the DropboxBot - for running and benchmarking without Dropbox.
+
+Select it via the setting senders::dropbox::backend = "fake". Uploaded files are not stored,
+only their size and SHA-256 hash are kept (see FakeDropbox.uploads).
+"""
+
+import time
+import uuid
+import types
+import hashlib
+import logging
+import threading
+
+
+class ApiError(Exception):
+
+    def __init__(self, request_id=None, error=None, user_message_text=None, user_message_locale=None):
+        super().__init__(request_id, error, user_message_text, user_message_locale)
+        self.request_id = request_id
+        self.error = error
+
+
+class RateLimitError(Exception):
+
+    def __init__(self, request_id=None, error=None, backoff=None):
+        super().__init__(request_id, error, backoff)
+        self.request_id = request_id
+        self.error = error
+        self.backoff = backoff
+
+
+class WriteMode:
+    overwrite = 'overwrite'
+    add = 'add'
+
+
+class UploadSessionCursor:
+
+    def __init__(self, session_id=None, offset=0):
+        self.session_id = session_id
+        self.offset = offset
+
+
+class CommitInfo:
+
+    def __init__(self, path=None, mode=WriteMode.add, autorename=False, client_modified=None, mute=False):
+        self.path = path
+        self.mode = mode
+        self.autorename = autorename
+        self.client_modified = client_modified
+        self.mute = mute
+
+
+class FileMetadata:
+
+    def __init__(self, path, size, content_hash, client_modified=None):
+        self.path_display = path
+        self.name = path.rsplit('/', 1)[-1]
+        self.size = size
+        self.content_hash = content_hash
+        self.client_modified = client_modified
+
+
+class UploadSessionStartResult:
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+
+class UploadSessionFinishArg:
+
+    def __init__(self, cursor=None, commit=None):
+        self.cursor = cursor
+        self.commit = commit
+
+
+class UploadSessionFinishBatchResultEntry:
+
+    def __init__(self, success=None, failure=None):
+        self._success = success
+        self._failure = failure
+
+    def is_success(self):
+        return self._success is not None
+
+    def get_success(self):
+        return self._success
+
+    def is_failure(self):
+        return self._failure is not None
+
+    def get_failure(self):
+        return self._failure
+
+
+class UploadSessionFinishBatchResult:
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+class UploadSessionFinishBatchJobStatus:
+    """Used for both the launch and the check result of files_upload_session_finish_batch"""
+
+    def __init__(self, async_job_id=None, complete=None):
+        self._async_job_id = async_job_id
+        self._complete = complete
+
+    def is_async_job_id(self):
+        return self._async_job_id is not None
+
+    def get_async_job_id(self):
+        return self._async_job_id
+
+    def is_in_progress(self):
+        return self._complete is None
+
+    def is_complete(self):
+        return self._complete is not None
+
+    def get_complete(self):
+        return self._complete
+
+
+# Namespaces as in the dropbox module
+files = types.SimpleNamespace(WriteMode=WriteMode,
+                              UploadSessionCursor=UploadSessionCursor,
+                              CommitInfo=CommitInfo,
+                              UploadSessionFinishArg=UploadSessionFinishArg,
+                              FileMetadata=FileMetadata)
+exceptions = types.SimpleNamespace(ApiError=ApiError, RateLimitError=RateLimitError)
+
+
+class Dropbox:
+    """Fake Dropbox client, files_upload is limited to MAX_UPLOAD_SIZE bytes like the real API.
+
+    Batches finished by files_upload_session_finish_batch complete on the first check.
+    With a rate limit, calls exceeding it within a second raise a RateLimitError with a retry-after hint.
+    """
+
+    MAX_UPLOAD_SIZE = 150 * 1024 * 1024
+
+    # Class level, shared by all clients
+    uploads = {}
+    nr_api_calls = {}
+    max_request_size = 0
+    latency_s = 0
+    rate_limit = None
+    call_times = []
+    nr_rate_limited = 0
+    lock = threading.Lock()
+
+    def __init__(self, oauth2_access_token=None, **kwargs):
+        self.oauth2_access_token = oauth2_access_token
+        self.sessions = {}
+        self.batch_jobs = {}
+        self.sessions_lock = threading.Lock()
+
+    @classmethod
+    def reset(cls, latency_s=0, rate_limit=None):
+        """Forgets all uploads and counters
+
+        :param latency_s: Simulated latency of every API call (in s)
+        :param rate_limit: Maximum number of API calls per second, unlimited if not set
+        """
+        with cls.lock:
+            cls.uploads = {}
+            cls.nr_api_calls = {}
+            cls.max_request_size = 0
+            cls.latency_s = latency_s
+            cls.rate_limit = rate_limit
+            cls.call_times = []
+            cls.nr_rate_limited = 0
+
+    def _call(self, name, data=b''):
+        """Counts an API call
+
+        :param name: The API call name
+        :param data: The request body
+        """
+        with self.lock:
+            self.nr_api_calls[name] = self.nr_api_calls.get(name, 0) + 1
+            if self.rate_limit:
+                now = time.time()
+                Dropbox.call_times = [t for t in self.call_times if t > now - 1]
+                if len(self.call_times) >= self.rate_limit:
+                    Dropbox.nr_rate_limited = self.nr_rate_limited + 1
+                    raise RateLimitError(error='too_many_requests', backoff=self.call_times[0] + 1 - now)
+                self.call_times.append(now)
+            Dropbox.max_request_size = max(Dropbox.max_request_size, len(data))
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def _store(self, path, size, hasher, client_modified=None):
+        """Stores the metadata of an uploaded file
+
+        :return: The file metadata
+        """
+        metadata = FileMetadata(path, size, hasher.hexdigest(), client_modified=client_modified)
+        with self.lock:
+            self.uploads[path] = metadata
+        logging.debug('Fake Dropbox: stored "{}" ({} bytes)'.format(path, size))
+        return metadata
+
+    def files_upload(self, f, path, mode=WriteMode.add, autorename=False, client_modified=None, mute=False):
+        self._call('files_upload', f)
+        if len(f) > self.MAX_UPLOAD_SIZE:
+            raise ApiError(error='payload_too_large')
+        return self._store(path, len(f), hashlib.sha256(f), client_modified=client_modified)
+
+    def files_upload_session_start(self, f, close=False):
+        self._call('files_upload_session_start', f)
+        session_id = uuid.uuid4().hex
+        with self.sessions_lock:
+            self.sessions[session_id] = {'size': len(f), 'hasher': hashlib.sha256(f), 'closed': close}
+        return UploadSessionStartResult(session_id)
+
+    def _get_session(self, cursor, pop=False):
+        with self.sessions_lock:
+            session = self.sessions.pop(cursor.session_id, None) if pop else self.sessions.get(cursor.session_id)
+        if not session:
+            raise ApiError(error='not_found')
+        if session['size'] != cursor.offset:
+            raise ApiError(error='incorrect_offset')
+        return session
+
+    def files_upload_session_append_v2(self, f, cursor, close=False):
+        self._call('files_upload_session_append_v2', f)
+        session = self._get_session(cursor)
+        if session['closed']:
+            raise ApiError(error='closed')
+        session['size'] = session['size'] + len(f)
+        session['hasher'].update(f)
+        session['closed'] = close
+
+    def files_upload_session_finish(self, f, cursor, commit):
+        self._call('files_upload_session_finish', f)
+        session = self._get_session(cursor, pop=True)
+        session['hasher'].update(f)
+        return self._store(commit.path, session['size'] + len(f), session['hasher'],
+                           client_modified=commit.client_modified)
+
+    def files_upload_session_finish_batch(self, entries):
+        self._call('files_upload_session_finish_batch')
+        result_entries = []
+        for entry in entries:
+            try:
+                session = self._get_session(entry.cursor, pop=True)
+                if not session['closed']:
+                    raise ApiError(error='not_closed')
+                result_entries.append(UploadSessionFinishBatchResultEntry(success=self._store(
+                    entry.commit.path, session['size'], session['hasher'],
+                    client_modified=entry.commit.client_modified)))
+            except ApiError as e:
+                result_entries.append(UploadSessionFinishBatchResultEntry(failure=e.error))
+        async_job_id = uuid.uuid4().hex
+        with self.sessions_lock:
+            self.batch_jobs[async_job_id] = UploadSessionFinishBatchResult(result_entries)
+        return UploadSessionFinishBatchJobStatus(async_job_id=async_job_id)
+
+    def files_upload_session_finish_batch_check(self, async_job_id):
+        self._call('files_upload_session_finish_batch_check')
+        with self.sessions_lock:
+            result = self.batch_jobs.pop(async_job_id, None)
+        if result is None:
+            raise ApiError(error='invalid_async_job_id')
+        return UploadSessionFinishBatchJobStatus(complete=result)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Governs the request rate of the Dropbox API, honors rate limits and retry-after hints"""
+
+import time
+import logging
+import threading
+
+from sender.TokenBucket import TokenBucket
+
+class RequestGovernor:
+    """A TokenBucket in front of every API request.
+
+    The rate starts at senders::dropbox::governor_max_rate_per_sec with a burst of senders::dropbox::governor_burst.
+    A rate-limited request waits for its retry-after hint (senders::dropbox::governor_retry_after_sec if there
+    is none), the rate is cut down to the rate observed before the limit was hit and the request is requeued,
+    up to senders::dropbox::governor_max_retries times. Every successful request raises the rate again.
+    """
+
+    # Multiplicative decrease on a rate limit, additive increase (in requests/s) per successful request
+    _RATE_DECREASE = 0.5
+    _RATE_INCREASE = 0.1
+    # Window (in s) for the observed request rate
+    _OBSERVE_WINDOW_S = 5
+
+    def __init__(self, settings, rate_limit_error=None):
+        """Initialization
+
+        :param settings: The settings
+        :param rate_limit_error: The exception class signalling a rate limit, with the attribute backoff (in s)
+        """
+        self.settings = settings
+        self.rate_limit_error = rate_limit_error
+
+        self.max_rate = self.settings.get_sender('dropbox', 'governor_max_rate_per_sec', 20)
+        self.min_rate = min(self.max_rate, self.settings.get_sender('dropbox', 'governor_min_rate_per_sec', 0.5))
+        self.burst = max(1, self.settings.get_sender('dropbox', 'governor_burst', 10))
+        self.retry_after_s = self.settings.get_sender('dropbox', 'governor_retry_after_sec', 1)
+        self.max_retries = self.settings.get_sender('dropbox', 'governor_max_retries', 5)
+
+        self.lock = threading.Lock()
+        self.rate = self.max_rate
+        self.bucket = TokenBucket(self.rate, self.burst)
+        # Start times of the recent requests
+        self.request_times = []
+
+        self.nr_throttled = 0
+        self.nr_requeued = 0
+        self.nr_given_up = 0
+
+    def acquire(self):
+        """Blocks until a request may be sent"""
+        self.bucket.acquire()
+        with self.lock:
+            now = time.time()
+            self.request_times.append(now)
+            self.request_times = [t for t in self.request_times if t > now - self._OBSERVE_WINDOW_S]
+
+    def _on_success(self):
+        """Raises the rate after a successful request"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self._RATE_INCREASE)
+            self.bucket.set_rate(self.rate)
+
+    def _on_rate_limited(self, backoff_s):
+        """Blocks requests for the retry-after time and cuts the rate down
+
+        :param backoff_s: The retry-after hint (in s), None if there is none
+        :return: The time to wait (in s)
+        """
+        wait_s = backoff_s if backoff_s is not None else self.retry_after_s
+        with self.lock:
+            now = time.time()
+            window_s = min(self._OBSERVE_WINDOW_S, max(1, now - self.request_times[0])) if self.request_times else 1
+            observed_rate = len(self.request_times) / window_s
+            self.rate = max(self.min_rate, min(self.rate, observed_rate) * self._RATE_DECREASE)
+            self.bucket.set_rate(self.rate)
+            self.bucket.block(wait_s)
+            self.nr_throttled = self.nr_throttled + 1
+        logging.warning('Dropbox rate limit hit, waiting {:.1f}s, request rate now {:.2f}/s'.format(wait_s, self.rate))
+        return wait_s
+
+    def call(self, func, *args, **kwargs):
+        """Sends a request, requeues it while rate-limited
+
+        :param func: The request function
+        :return: The result of the request function
+        """
+        retries = 0
+        while True:
+            self.acquire()
+            try:
+                res = func(*args, **kwargs)
+            except Exception as e:
+                if self.rate_limit_error is None or not isinstance(e, self.rate_limit_error):
+                    raise
+                self._on_rate_limited(getattr(e, 'backoff', None))
+                if retries >= self.max_retries:
+                    with self.lock:
+                        self.nr_given_up = self.nr_given_up + 1
+                    logging.error('Dropbox request still rate-limited after {} retries'.format(retries))
+                    raise
+                retries = retries + 1
+                with self.lock:
+                    self.nr_requeued = self.nr_requeued + 1
+                continue
+            self._on_success()
+            return res
+
+    def get_stats(self):
+        """Returns the governor counters
+
+        :return: Dict with the current rate, the time requests are still blocked for, the number of requests,
+            throttled, requeued and given up requests and the total wait time
+        """
+        bucket_stats = self.bucket.get_stats()
+        with self.lock:
+            return {
+                'rate_per_s': self.rate,
+                'blocked_for_s': bucket_stats['blocked_for_s'],
+                'nr_requests': bucket_stats['nr_acquired'],
+                'nr_throttled': self.nr_throttled,
+                'nr_requeued': self.nr_requeued,
+                'nr_given_up': self.nr_given_up,
+                'wait_s': bucket_stats['wait_s']
+            }
@@ -9,14 +9,27 @@
 
 """A Mail bot"""
 
+import time
+import queue
+import datetime
 import logging
 import threading
-import smtplib
 
 from sender.Bot import Bot
+from sender.CircuitBreaker import CircuitBreaker
+from sender.mail.SmtpPool import SmtpPool
 
 
 class MailBot(Bot):
+    """Messages are queued (at most senders::mail::queue_size) and sent by senders::mail::workers worker threads.
+    A message is sent right away unless a mail was sent within the last senders::mail::digest_window_sec seconds.
+    Messages arriving within the window after a mail are folded into one digest mail, sent when the window ends.
+    On stop, the workers send the queued messages for at most senders::mail::stop_timeout_sec seconds,
+    the messages still queued after that are dropped.
+    """
+
+    # Interval to check whether to stop (in s)
+    _STOP_POLL_S = 1
 
     def __init__(self, settings):
         """Initialization
@@ -27,16 +40,34 @@ class MailBot(Bot):
 
         logging.info('Initializing mail Bot')
 
-        self.mail_server = self.settings.get_sender('mail', 'server')
-        self.mail_server_port = self.settings.get_sender('mail', 'server_port')
         self.mail_address = self.settings.get_sender('mail', 'address')
-        self.mail_password = self.settings.get_sender('mail', 'password')
 
         self.cleaned_up = True
         self.initialized = False
         self.started = False
 
-        self.running_threads = 0
+        self.nr_workers = max(1, self.settings.get_sender('mail', 'workers', 1))
+        self.digest_window_s = self.settings.get_sender('mail', 'digest_window_sec', 0)
+        self.stop_timeout_s = self.settings.get_sender('mail', 'stop_timeout_sec', 10)
+
+        # Queued (time, subject, message), None to stop a worker
+        self.queue = queue.Queue(maxsize=self.settings.get_sender('mail', 'queue_size', 100))
+        # Guards digest and digest_window_end
+        self.digest_lock = threading.Lock()
+        # Messages folded into the next digest, None if no digest is being collected
+        self.digest = None
+        # Messages arriving before this time are folded into a digest
+        self.digest_window_end = 0
+        self.workers = []
+        # Set to stop the workers once the queue is empty
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.circuit_breaker = CircuitBreaker.get_shared(self.settings, 'mail')
+
+        self.nr_messages = 0
+        self.nr_dropped = 0
+        self.nr_mails = 0
+        self.nr_mails_failed = 0
 
         self.bot = None
 
@@ -48,15 +79,14 @@ class MailBot(Bot):
 
         logging.info('Initializing')
 
-        try:
-            logging.info('Logging in to "{}:{}"'.format(self.mail_server, self.mail_server_port))
-            self.bot = smtplib.SMTP_SSL(self.mail_server, self.mail_server_port)
-            self.bot.ehlo()
-            self.bot.login(self.mail_address, self.mail_password)
-            self.initialized = True
-        except Exception as e:
-            logging.error('Failed to log in: "{}"'.format(e))
-            self.initialized = False
+        self.bot = SmtpPool(self.settings, circuit_breaker=self.circuit_breaker)
+        self.bot.start()
+        self.initialized = self.bot.connect()
+        if not self.initialized:
+            logging.error('Failed to log in')
+            self.bot.close()
+
+        self.cleaned_up = False
 
         return self.initialized
 
@@ -72,6 +102,12 @@ class MailBot(Bot):
 
         logging.info('Starting')
 
+        self.stopping.clear()
+        for nr in range(self.nr_workers):
+            worker = threading.Thread(target=self._work, name='Mail-{}'.format(nr), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
         self.started = True
 
         return self.started
@@ -92,11 +128,25 @@ class MailBot(Bot):
 
         logging.info('Stopping')
 
-        if self.bot:
+        # Queued messages are sent before the workers stop
+        self.stopping.set()
+        for _ in self.workers:
             try:
-                self.bot.quit()
-            except:
-                pass
+                self.queue.put_nowait(None)
+            except queue.Full:
+                # The workers stop once they have emptied the queue
+                break
+        end_time = time.time() + self.stop_timeout_s
+        for worker in self.workers:
+            worker.join(max(0, end_time - time.time()))
+        if any(worker.is_alive() for worker in self.workers):
+            nr_dropped = self._drop_queued()
+            logging.error('Mail workers not finished within {}s, dropped {} queued message(s)'.format(
+                self.stop_timeout_s, nr_dropped))
+        self.workers = []
+
+        if self.bot:
+            self.bot.close()
 
         self.started = False
         self.initialized = False
@@ -117,36 +167,181 @@ class MailBot(Bot):
 
     # @abstractmethod override
     def is_finished(self):
-        return self.running_threads <= 0
-
-    def _cb_internal(self, success):
-        """Internal callback"""
-        self.running_threads = self.running_threads - 1
+        with self.queue.mutex:
+            return self.queue.unfinished_tasks == 0
 
     # @abstractmethod override
     def send_message(self, msg, subject=''):
-        """Sends a mail
+        """Queues a mail
 
         :param msg: The message
         :param subject: The subject
+        :return: True if queued, False else
         """
         if not self.initialized:
             logging.error('Not initialized')
-            return
+            return False
 
-        self.running_threads = self.running_threads + 1
+        try:
+            self.queue.put_nowait((time.time(), subject, msg))
+        except queue.Full:
+            logging.error('Mail queue full, dropping message "{}"'.format(subject))
+            with self.lock:
+                self.nr_dropped = self.nr_dropped + 1
+            return False
+        with self.lock:
+            self.nr_messages = self.nr_messages + 1
+        return True
 
+    def _drop_queued(self):
+        """Empties the queue, counts the messages as dropped
+
+        :return: The number of dropped messages
+        """
+        nr_dropped = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.queue.task_done()
+            if item is not None:
+                nr_dropped = nr_dropped + 1
+        with self.lock:
+            self.nr_dropped = self.nr_dropped + nr_dropped
+        return nr_dropped
+
+    def _get(self):
+        """Takes the next message, waits until one is queued or the worker is to stop
+
+        :return: The next queue item, None to stop the worker
+        """
+        while True:
+            try:
+                if self.stopping.is_set():
+                    item = self.queue.get_nowait()
+                else:
+                    item = self.queue.get(timeout=self._STOP_POLL_S)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return None
+                continue
+            if item is None:
+                self.queue.task_done()
+            return item
+
+    def _collect(self):
+        """Takes the next message. Sends it right away if the digest window is over,
+        else collects it and all messages arriving until the window ends into one digest.
+
+        :return: Tuple (list of (time, subject, message), whether the worker is to stop)
+        """
+        item = self._get()
+        if item is None:
+            return [], True
+        if self.digest_window_s <= 0:
+            return [item], False
+        with self.digest_lock:
+            now = time.time()
+            if self.digest is not None:
+                # Another worker collects the digest and sends it
+                self.digest.append(item)
+                return [], False
+            if now >= self.digest_window_end:
+                self.digest_window_end = now + self.digest_window_s
+                return [item], False
+            self.digest = [item]
+            window_end = self.digest_window_end
+        stop = False
+        while True:
+            timeout = window_end - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.task_done()
+                stop = True
+                break
+            with self.digest_lock:
+                self.digest.append(item)
+        with self.digest_lock:
+            items = self.digest
+            self.digest = None
+            # The digest opens the next window
+            self.digest_window_end = time.time() + self.digest_window_s
+        return items, stop
+
+    def _format(self, items):
+        """Formats the messages of a digest as one mail
+
+        :param items: List of (time, subject, message)
+        :return: Tuple (subject, message)
+        """
+        if len(items) == 1:
+            _, subject, msg = items[0]
+            return subject, msg
+        subject = '{} ({} messages)'.format(items[0][1], len(items))
+        lines = ['{:%Y-%m-%d %H:%M:%S} - {}: {}'.format(datetime.datetime.fromtimestamp(t), _subject, _msg)
+                 for t, _subject, _msg in items]
+        return subject, '\n'.join(lines)
+
+    def _work(self):
+        """Runs a worker, sends digests until stopped"""
+        stop = False
+        while not stop:
+            items, stop = self._collect()
+            if not items:
+                continue
+            try:
+                subject, msg = self._format(items)
+                success = self._send(subject, msg)
+                with self.lock:
+                    if success:
+                        self.nr_mails = self.nr_mails + 1
+                    else:
+                        self.nr_mails_failed = self.nr_mails_failed + 1
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def _send(self, subject, msg):
+        """Sends a mail
+
+        :param subject: The subject
+        :param msg: The message
+        :return: True if sent, False else
+        """
         _subject = '{}{}'.format(self.settings.get_sender('mail', 'prefix'), subject)
         _msg = '{}{}'.format(self.settings.get_sender('mail', 'prefix'), msg)
-        m_thread = MailSenderThread(mail_server=self.bot,
-                                    mail_address=self.mail_address,
-                                    str_from=self.mail_address,
-                                    str_subject=_subject,
-                                    str_to=self.mail_address,
-                                    str_msg=_msg,
-                                    callbacks = [self._cb_internal])
+        logging.info('Sending email to email address "{}"'.format(self.mail_address))
+        logging.debug('Sending message with subject "{}": "{}"'.format(_subject, _msg))
+        _mail = 'From:{}\nSubject:{}\nTo:{}\n\n{}'.format(self.mail_address, _subject, self.mail_address, _msg)
+        try:
+            return self.bot.sendmail(self.mail_address, self.mail_address, _mail)
+        except Exception as exc:
+            logging.error('Unable to send email: "{}"'.format(exc))
+            return False
+
+    def get_stats(self):
+        """Returns the mail counters
 
-        m_thread.start()
+        :return: Dict with the queue depth, the number of queued, dropped and folded messages,
+            sent and failed mails and the SMTP connection pool counters
+        """
+        with self.lock:
+            stats = {
+                'queue_depth': self.queue.qsize(),
+                'nr_messages': self.nr_messages,
+                'nr_dropped': self.nr_dropped,
+                'nr_mails': self.nr_mails,
+                'nr_mails_failed': self.nr_mails_failed
+            }
+        if self.bot:
+            stats['smtp'] = self.bot.get_stats()
+        return stats
 
     # @abstractmethod override
     def send_image(self, fullname, subfolder, name):
@@ -155,45 +350,3 @@ class MailBot(Bot):
     # @abstractmethod override
     def send_video(self, fullname, subfolder, name):
         return True
-
-class MailSenderThread(threading.Thread):
-    def __init__(self, mail_server, mail_address, str_from, str_subject, str_to, str_msg, callbacks=[]):
-        """Initializes the thread
-
-        :param mail_server: The server
-        :param mail_address: The email address
-        :param str_from: From address
-        :param str_subject: The Subject
-        :param str_to: To address
-        :param str_msg: The message
-        :param callbacks: List of callbacks
-        """
-        threading.Thread.__init__(self)
-
-        self.mail_server = mail_server
-        self.mail_address = mail_address
-        self.str_from = str_from
-        self.str_subject = str_subject
-        self.str_to = str_to
-        self.str_msg = str_msg
-        self.callbacks = callbacks
-
-    def run(self):
-        """Runs the thread"""
-        logging.debug('Starting thread')
-
-        success = False
-        try:
-            logging.info('Sending email to email address "{}"'.format(self.mail_address))
-
-            _msg = 'From:{}\nSubject:{}\nTo:{}\n\n{}'.format(self.str_from, self.str_subject, self.str_to, self.str_msg)
-            logging.debug('Sending message with subject "{}": "{}"'.format(self.str_subject, self.str_msg))
-            self.mail_server.sendmail(self.mail_address, self.mail_address, _msg)
-            success = True
-        except Exception as exc:
-            logging.error('Unable to send email: "{}"'.format(exc))
-        finally:
-            logging.info('Done sending email')
-            for cb in self.callbacks:
-                if cb:
-                    cb(success)
@@ -10,7 +10,6 @@
 """A mail Sender"""
 
 import logging
-import time
 
 from sender.Sender import Sender
 from sender.mail.MailBot import MailBot
@@ -21,8 +20,6 @@ class MailSender(Sender):
         """Initialization"""
         super().__init__(settings)
 
-        self.last_sent_time_msg = None
-
         self.mail_bot = MailBot(self.settings)
 
     # @abstractmethod override
@@ -76,6 +73,10 @@ class MailSender(Sender):
     def can_send_video(self):
         return False
 
+    def records_send_results(self):
+        # Messages are only queued here, the SMTP connection pool records the outcome of sending the mails
+        return True
+
     # @abstractmethod override
     def send_msg(self, msg, subject='', force_send=False):
         if not self.can_send_msg():
@@ -86,14 +87,10 @@ class MailSender(Sender):
             logging.debug('Not sending mail message')
             return False
 
-        if force_send or self._is_time_to_send():
-            logging.debug('Sending mail')
-            logging.debug('Mail message: "{}"'.format(msg))
-            self.mail_bot.send_message(subject, msg)
-            return True
-        else:
-            logging.debug('Time interval since last message is too small, not sending telegram message')
-            return False
+        # Rate limited by the RateLimiter, messages within the digest window are folded into one mail
+        logging.debug('Sending mail')
+        logging.debug('Mail message: "{}"'.format(msg))
+        return self.mail_bot.send_message(msg, subject=subject)
 
     # @abstractmethod override
     def send_image(self, fullname, subfolder, name):
@@ -111,22 +108,9 @@ class MailSender(Sender):
 
         return False
 
-    def _is_time_to_send(self):
-        """Checks whether to send a mail message
+    def get_stats(self):
+        """Returns the mail counters of the Mail Bot
 
-        :return: True if it is time to send, False else
+        :return: Dict with the mail counters
         """
-        if not self.can_send_msg():
-            return False
-
-        curr_time = time.time()
-
-        if not self.last_sent_time_msg:
-            self.last_sent_time_msg = curr_time
-            return True
-
-        if (curr_time - self.last_sent_time_msg) > self.settings.get_sender('mail', 'interval_messages_send_sec'):
-            self.last_sent_time_msg = curr_time
-            return True
-
-        return False
+        return self.mail_bot.get_stats()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A thread-safe pool of SMTP connections"""
+
+import time
+import smtplib
+import logging
+import threading
+
+
+class SmtpPool:
+    """Keeps up to senders::mail::pool_size logged-in SMTP connections.
+
+    An idle connection is checked with a NOOP before it is handed out and replaced by a new one
+    (connect, EHLO, login) if the server dropped it. Connections idle for more than
+    senders::mail::idle_timeout_sec are closed. A mail failing on a dropped connection is sent again
+    once on a new connection.
+    The connection security senders::mail::security is one of "ssl", "starttls" or "none".
+    The outcome of every mail is recorded in the CircuitBreaker (if set): sent, failed to connect
+    (if a transport error) or failed on a dropped connection.
+    """
+
+    SECURITY_SSL = 'ssl'
+    SECURITY_STARTTLS = 'starttls'
+    SECURITY_NONE = 'none'
+
+    def __init__(self, settings, circuit_breaker=None):
+        """Initialization
+
+        :param settings: The settings
+        :param circuit_breaker: The CircuitBreaker of the mail Sender
+        """
+        self.settings = settings
+        self.circuit_breaker = circuit_breaker
+
+        self.server = self.settings.get_sender('mail', 'server')
+        self.server_port = self.settings.get_sender('mail', 'server_port')
+        self.address = self.settings.get_sender('mail', 'address')
+        self.password = self.settings.get_sender('mail', 'password')
+        self.security = self.settings.get_sender('mail', 'security', self.SECURITY_SSL)
+        self.pool_size = max(1, self.settings.get_sender('mail', 'pool_size', 2))
+        self.idle_timeout_s = self.settings.get_sender('mail', 'idle_timeout_sec', 60)
+        self.timeout_s = self.settings.get_sender('mail', 'timeout_sec', 30)
+
+        self.condition = threading.Condition()
+        # Idle connections (connection, time of the last use), the most recently used last
+        self.idle = []
+        self.nr_in_use = 0
+        self.closed = False
+        self.reaper = None
+
+        self.nr_connects = 0
+        self.nr_reconnects = 0
+        self.nr_idle_closed = 0
+        self.nr_sent = 0
+        self.nr_failed = 0
+        self.send_s_total = 0
+        self.send_s_max = 0
+
+    def start(self):
+        """Starts closing idle connections"""
+        with self.condition:
+            self.closed = False
+            if self.reaper:
+                return
+            self.reaper = threading.Thread(target=self._reap, name='SmtpPool', daemon=True)
+        self.reaper.start()
+
+    def close(self):
+        """Closes all connections, connections in use are closed when returned"""
+        with self.condition:
+            self.closed = True
+            idle = self.idle
+            self.idle = []
+            self.condition.notify_all()
+        for connection, _ in idle:
+            self._quit(connection)
+        if self.reaper:
+            self.reaper.join()
+            self.reaper = None
+
+    def connect(self):
+        """Opens a connection to check the server and the credentials, keeps it as idle connection
+
+        :return: True if connected, False else
+        """
+        try:
+            connection, _ = self._checkout()
+        except Exception as e:
+            logging.error('Failed to connect to "{}:{}": "{}"'.format(self.server, self.server_port, e))
+            return False
+        self._checkin(connection)
+        return True
+
+    def _connect(self):
+        """Opens a new connection and logs in
+
+        :return: The connection
+        """
+        logging.info('Connecting to "{}:{}"'.format(self.server, self.server_port))
+        if self.security == self.SECURITY_SSL:
+            connection = smtplib.SMTP_SSL(self.server, self.server_port, timeout=self.timeout_s)
+        else:
+            connection = smtplib.SMTP(self.server, self.server_port, timeout=self.timeout_s)
+        try:
+            connection.ehlo()
+            if self.security == self.SECURITY_STARTTLS:
+                connection.starttls()
+                connection.ehlo()
+            if connection.has_extn('auth'):
+                connection.login(self.address, self.password)
+        except Exception:
+            self._quit(connection)
+            raise
+        with self.condition:
+            self.nr_connects = self.nr_connects + 1
+        return connection
+
+    def _quit(self, connection):
+        """Closes a connection, ignores errors
+
+        :param connection: The connection
+        """
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, connection):
+        """Checks a connection with a NOOP
+
+        :param connection: The connection
+        :return: True if the connection is alive, False else
+        """
+        try:
+            return connection.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _checkout(self):
+        """Takes an idle connection or opens a new one, blocks while all connections are in use
+
+        :return: Tuple (connection, whether it is a new connection)
+        """
+        with self.condition:
+            while not self.idle and self.nr_in_use >= self.pool_size:
+                self.condition.wait()
+            self.nr_in_use = self.nr_in_use + 1
+            connection = self.idle.pop()[0] if self.idle else None
+        if connection is not None:
+            if self._is_alive(connection):
+                return connection, False
+            logging.info('SMTP connection dropped by the server, reconnecting')
+            self._quit(connection)
+            with self.condition:
+                self.nr_reconnects = self.nr_reconnects + 1
+        try:
+            return self._connect(), True
+        except Exception:
+            self._checkin(None)
+            raise
+
+    def _checkin(self, connection):
+        """Returns a connection to the pool
+
+        :param connection: The connection, None if it has been discarded
+        """
+        with self.condition:
+            self.nr_in_use = self.nr_in_use - 1
+            if connection is not None and not self.closed:
+                self.idle.append((connection, time.time()))
+                connection = None
+            self.condition.notify_all()
+        if connection is not None:
+            self._quit(connection)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Sends a mail, sends it again on a new connection if the connection was dropped
+
+        :param from_addr: The sender address
+        :param to_addrs: The receiver address(es)
+        :param msg: The message
+        :return: True if the mail has been sent, False else
+        """
+        t0 = time.time()
+        success = False
+        for attempt in range(2):
+            try:
+                connection, new = self._checkout()
+            except Exception as e:
+                logging.error('Failed to connect to "{}:{}": "{}"'.format(self.server, self.server_port, e))
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_error(e)
+                break
+            try:
+                connection.sendmail(from_addr, to_addrs, msg)
+                self._checkin(connection)
+                success = True
+                break
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                self._quit(connection)
+                self._checkin(None)
+                if new or attempt > 0:
+                    logging.error('Unable to send email: "{}"'.format(e))
+                    if self.circuit_breaker:
+                        self.circuit_breaker.record(False)
+                    break
+                logging.info('SMTP connection lost while sending, reconnecting')
+                with self.condition:
+                    self.nr_reconnects = self.nr_reconnects + 1
+            except Exception as e:
+                self._checkin(connection)
+                logging.error('Unable to send email: "{}"'.format(e))
+                break
+        send_s = time.time() - t0
+        with self.condition:
+            if success:
+                self.nr_sent = self.nr_sent + 1
+                self.send_s_total = self.send_s_total + send_s
+                self.send_s_max = max(self.send_s_max, send_s)
+            else:
+                self.nr_failed = self.nr_failed + 1
+        if success and self.circuit_breaker:
+            self.circuit_breaker.record(True)
+        return success
+
+    def get_stats(self):
+        """Returns the pool counters
+
+        :return: Dict with the number of idle and used connections, connects, reconnects, connections closed
+            for being idle, sent and failed mails and the mean and maximum send latency
+        """
+        with self.condition:
+            return {
+                'nr_idle': len(self.idle),
+                'nr_in_use': self.nr_in_use,
+                'nr_connects': self.nr_connects,
+                'nr_reconnects': self.nr_reconnects,
+                'nr_idle_closed': self.nr_idle_closed,
+                'nr_sent': self.nr_sent,
+                'nr_failed': self.nr_failed,
+                'send_s_mean': (self.send_s_total / self.nr_sent) if self.nr_sent else 0,
+                'send_s_max': self.send_s_max
+            }
+
+    def _reap(self):
+        """Closes connections idle for more than the idle timeout until the pool is closed"""
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                now = time.time()
+                expired = [entry for entry in self.idle if now - entry[1] >= self.idle_timeout_s]
+                self.idle = [entry for entry in self.idle if now - entry[1] < self.idle_timeout_s]
+                self.nr_idle_closed = self.nr_idle_closed + len(expired)
+                next_s = min([self.idle_timeout_s - (now - t) for _, t in self.idle] + [self.idle_timeout_s])
+            for connection, _ in expired:
+                logging.debug('Closing idle SMTP connection')
+                self._quit(connection)
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(timeout=max(0.01, next_s))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A local fake of the parts of the Telegram Bot API used by the TelegramBot - for running and benchmarking
+without Telegram.
+
+Start a FakeBotApiServer and set senders::telegram::base_url to its base_url. Uploaded files are not stored,
+only their size and a generated file_id are kept.
+"""
+
+import json
+import time
+import uuid
+import email
+import logging
+import threading
+import email.policy
+import http.server
+
+
+class FakeBotApiHandler(http.server.BaseHTTPRequestHandler):
+    """Handles the requests of a FakeBotApiServer"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logging.debug('Fake Bot API: {}'.format(format % args))
+
+    def _read_fields(self):
+        """Reads the form fields of the request
+
+        :return: Tuple (dict field name -> value, dict field name -> uploaded bytes)
+        """
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content_type = self.headers.get('Content-Type', '')
+        fields = {}
+        uploads = {}
+        if content_type.startswith('application/json'):
+            fields = json.loads(body.decode('utf-8')) if body else {}
+        elif content_type.startswith('multipart/form-data'):
+            message = email.message_from_bytes(
+                'Content-Type: {}\r\n\r\n'.format(content_type).encode('utf-8') + body, policy=email.policy.HTTP)
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename() is not None:
+                    uploads[name] = part.get_payload(decode=True)
+                else:
+                    fields[name] = part.get_payload(decode=True).decode('utf-8')
+        return fields, uploads
+
+    def _respond(self, result, ok=True, description=None):
+        """Sends a Bot API response
+
+        :param result: The result
+        :param ok: Whether the request succeeded
+        :param description: The error description
+        """
+        response = {'ok': ok, 'result': result} if ok else {'ok': False, 'error_code': 400, 'description': description}
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(200 if ok else 400)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        fields, uploads = self._read_fields()
+        result = self.server.handle(method, fields, uploads)
+        if isinstance(result, Exception):
+            self._respond(None, ok=False, description=str(result))
+        else:
+            self._respond(result)
+
+    do_GET = do_POST
+
+
+class FakeBotApiServer(http.server.ThreadingHTTPServer):
+    """Fake Bot API server on a free local port, counts the requests and the uploaded bytes"""
+
+    daemon_threads = True
+
+    def __init__(self, latency_s=0, max_media_group_size=10):
+        """Initialization
+
+        :param latency_s: Simulated latency of every request (in s)
+        :param max_media_group_size: Maximum number of items of a media group
+        """
+        super().__init__(('127.0.0.1', 0), FakeBotApiHandler)
+        self.latency_s = latency_s
+        self.max_media_group_size = max_media_group_size
+        self.base_url = 'http://127.0.0.1:{}/bot'.format(self.server_address[1])
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.message_id = 0
+        # file_id -> size
+        self.files = {}
+        # Method -> number of requests
+        self.nr_requests = {}
+        self.nr_uploads = 0
+        self.bytes_uploaded = 0
+
+    def start(self):
+        """Serves in a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, name='FakeBotApi', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops serving"""
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def reset(self, latency_s=None):
+        """Forgets all counters
+
+        :param latency_s: The new latency (in s), unchanged if not set
+        """
+        with self.lock:
+            self.nr_requests = {}
+            self.nr_uploads = 0
+            self.bytes_uploaded = 0
+            if latency_s is not None:
+                self.latency_s = latency_s
+
+    def get_stats(self):
+        """Returns the counters
+
+        :return: Dict with the number of requests per method, the total number of requests,
+            the number of uploaded files and the uploaded bytes
+        """
+        with self.lock:
+            return {
+                'nr_requests': dict(self.nr_requests),
+                'nr_requests_total': sum(self.nr_requests.values()),
+                'nr_uploads': self.nr_uploads,
+                'bytes_uploaded': self.bytes_uploaded
+            }
+
+    def _get_file(self, value, uploads):
+        """Resolves a file field: an upload (field name or attach://<name>) or a known file_id
+
+        :param value: The field value
+        :param uploads: The uploaded files
+        :return: The file dict, None if the file is unknown
+        """
+        name = value[len('attach://'):] if isinstance(value, str) and value.startswith('attach://') else None
+        with self.lock:
+            if name is not None and name in uploads:
+                data = uploads[name]
+                file_id = uuid.uuid4().hex
+                self.files[file_id] = len(data)
+                self.nr_uploads = self.nr_uploads + 1
+                self.bytes_uploaded = self.bytes_uploaded + len(data)
+                return {'file_id': file_id, 'file_unique_id': file_id[:16], 'file_size': len(data)}
+            if value in self.files:
+                return {'file_id': value, 'file_unique_id': value[:16], 'file_size': self.files[value]}
+        return None
+
+    def _message(self, chat_id, media_type=None, media=None):
+        """Returns a new message
+
+        :param chat_id: The chat ID
+        :param media_type: The media type, photo or video
+        :param media: The file dict
+        :return: The message
+        """
+        with self.lock:
+            self.message_id = self.message_id + 1
+            message = {
+                'message_id': self.message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(chat_id), 'type': 'private'}
+            }
+        if media_type == 'photo':
+            message['photo'] = [dict(media, width=640, height=480)]
+        elif media_type == 'video':
+            message['video'] = dict(media, width=640, height=480, duration=1)
+        return message
+
+    def handle(self, method, fields, uploads):
+        """Handles a Bot API method
+
+        :param method: The method
+        :param fields: The form fields
+        :param uploads: The uploaded files
+        :return: The result, an exception on error
+        """
+        with self.lock:
+            self.nr_requests[method] = self.nr_requests.get(method, 0) + 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method == 'sendMessage':
+            return dict(self._message(fields.get('chat_id')), text=fields.get('text', ''))
+        if method in ['sendPhoto', 'sendVideo']:
+            media_type = 'photo' if method == 'sendPhoto' else 'video'
+            media = self._get_file(fields.get(media_type, 'attach://{}'.format(media_type)), uploads)
+            if media is None:
+                return ValueError('Bad Request: wrong file identifier')
+            return self._message(fields.get('chat_id'), media_type, media)
+        if method == 'sendMediaGroup':
+            items = fields.get('media')
+            items = json.loads(items) if isinstance(items, str) else items
+            if not items or not (2 <= len(items) <= self.max_media_group_size):
+                return ValueError('Bad Request: wrong number of media in the group')
+            messages = []
+            for item in items:
+                media = self._get_file(item.get('media'), uploads)
+                if media is None:
+                    return ValueError('Bad Request: wrong file identifier')
+                messages.append(self._message(fields.get('chat_id'), item.get('type'), media))
+            return messages
+        return ValueError('Not Found: method not found')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A bounded cache of Telegram file IDs, keyed by the content hash of the files"""
+
+import hashlib
+import threading
+import collections
+
+
+class FileIdCache:
+    """Least recently used cache content hash -> file_id with at most max_size entries"""
+
+    def __init__(self, max_size):
+        """Initialization
+
+        :param max_size: The maximum number of entries
+        """
+        self.max_size = max(1, max_size)
+
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+        self.nr_hits = 0
+        self.nr_misses = 0
+        self.nr_evictions = 0
+
+    @staticmethod
+    def get_key(fullname, chunk_size=1024 * 1024):
+        """Returns the content hash of a file
+
+        :param fullname: The full file name
+        :param chunk_size: The size of the chunks read
+        :return: The SHA-256 hex digest
+        """
+        hasher = hashlib.sha256()
+        with open(fullname, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def get(self, key):
+        """Returns the file_id of a content hash
+
+        :param key: The content hash
+        :return: The file_id, None if not cached
+        """
+        with self.lock:
+            file_id = self.entries.get(key)
+            if file_id is None:
+                self.nr_misses = self.nr_misses + 1
+                return None
+            self.entries.move_to_end(key)
+            self.nr_hits = self.nr_hits + 1
+            return file_id
+
+    def put(self, key, file_id):
+        """Caches the file_id of a content hash, evicts the least recently used entry if full
+
+        :param key: The content hash
+        :param file_id: The file_id
+        """
+        with self.lock:
+            self.entries[key] = file_id
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.nr_evictions = self.nr_evictions + 1
+
+    def get_stats(self):
+        """Returns the cache counters
+
+        :return: Dict with the number of entries, hits, misses and evictions
+        """
+        with self.lock:
+            return {
+                'nr_entries': len(self.entries),
+                'nr_hits': self.nr_hits,
+                'nr_misses': self.nr_misses,
+                'nr_evictions': self.nr_evictions
+            }
@@ -9,12 +9,35 @@
 
 """A telegram bot - encapsulates calls to the telegram API"""
 
+import os
+import math
 import logging
+import threading
+import contextlib
+import collections
+import concurrent.futures
 
 from sender.Bot import Bot
+from sender.HttpTransport import HttpTransport
+from sender.CircuitBreaker import CircuitBreaker
+from sender.telegram.FileIdCache import FileIdCache
 
 
 class TelegramBot(Bot):
+    """The images of an event are sent as albums of up to senders::telegram::media_group_size images.
+    If sending an album fails, its images are sent one by one.
+
+    Messages and files are sent to all chats senders::telegram::chat_ids (or the single chat_id).
+    A file is uploaded only once - to the first chat - and sent to the other chats concurrently
+    by the returned file_id. The file_ids are cached by content hash (at most
+    senders::telegram::file_id_cache_size entries), so resending a file does not upload it again.
+    The chats a file could not be sent to are remembered, so resending the file (or sending the images
+    of a failed album one by one) only sends it to these chats.
+    """
+
+    # Limits of sendMediaGroup
+    _MEDIA_GROUP_MIN = 2
+    _MEDIA_GROUP_MAX = 10
 
     def __init__(self, settings):
         """Initialization
@@ -30,11 +53,30 @@ class TelegramBot(Bot):
 
         self.token = self.settings.get_sender('telegram', 'token')
         self.chat_id = self.settings.get_sender('telegram', 'chat_id')
+        self.chat_ids = self.settings.get_sender('telegram', 'chat_ids', []) or [self.chat_id]
+        self.fan_out_workers = max(1, self.settings.get_sender('telegram', 'fan_out_workers', 4))
+        self.base_url = self.settings.get_sender('telegram', 'base_url', None)
+        self.media_group_size = min(self._MEDIA_GROUP_MAX,
+                                    max(self._MEDIA_GROUP_MIN,
+                                        self.settings.get_sender('telegram', 'media_group_size', self._MEDIA_GROUP_MAX)))
+
+        self.lock = threading.Lock()
+        self.nr_requests = {}
+        self.nr_media_groups = 0
+        self.nr_media_group_fallbacks = 0
+        self.bytes_uploaded = 0
+
+        self.file_id_cache = FileIdCache(self.settings.get_sender('telegram', 'file_id_cache_size', 256))
+        # Full name -> chat IDs the file still has to be sent to, at most file_id_cache_size entries
+        self.pending_chat_ids = collections.OrderedDict()
+        self.executor = None
+        self.circuit_breaker = CircuitBreaker.get_shared(self.settings, 'telegram')
 
         self.cleaned_up = True
         self.initialized = False
         self.started = False
 
+        self.transport = None
         self.bot = None
         self.bot_info = []
 
@@ -47,7 +89,13 @@ class TelegramBot(Bot):
         logging.info('Initializing')
 
         try:
-            self.bot = self.telegram.Bot(token=self.token)
+            # At least one connection per concurrent request
+            self.transport = HttpTransport.get_shared(self.settings)
+            request = self.transport.create_telegram_request('telegram', self.telegram, self.fan_out_workers + 1)
+            self.bot = self.telegram.Bot(token=self.token, base_url=self.base_url or None, request=request)
+            self.transport.prewarm('telegram', [self.base_url or 'https://api.telegram.org/'])
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.fan_out_workers,
+                                                                  thread_name_prefix='Telegram')
             self.initialized = True
         except Exception as e:
             logging.error('Error initializing: "{}"'.format(e))
@@ -78,7 +126,7 @@ class TelegramBot(Bot):
             self.bot_info = self.bot.get_me()
             logging.info('Bot info: {}'.format(self.bot_info))
             logging.info(
-                'Sending messages to telegram chat[ID={}]'.format(self.chat_id))
+                'Sending messages to telegram chat[ID={}]'.format(', '.join(str(c) for c in self.chat_ids)))
             self.started = True
         except Exception as e:
             logging.error('Error starting: "{}"'.format(e))
@@ -102,6 +150,10 @@ class TelegramBot(Bot):
 
         logging.info('Stopping')
 
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
         self.started = False
         self.initialized = False
 
@@ -127,11 +179,47 @@ class TelegramBot(Bot):
         self.bot_info = []
         self.token = ''
         self.chat_id = ''
+        self.chat_ids = []
 
         self.cleaned_up = True
 
         return self.cleaned_up
 
+    def _fan_out(self, func, chat_ids):
+        """Calls a send function for every chat, concurrently if there is more than one chat
+
+        :param func: The send function, called with the chat ID, returns True if sent
+        :param chat_ids: The chat IDs
+        :return: List of the chat IDs not sent to, empty if sent to all chats
+        """
+        if len(chat_ids) <= 1:
+            return [chat_id for chat_id in chat_ids if not func(chat_id)]
+        futures = [(chat_id, self.executor.submit(func, chat_id)) for chat_id in chat_ids]
+        return [chat_id for chat_id, future in futures if not future.result()]
+
+    def _get_pending_chat_ids(self, fullname):
+        """Returns the chat IDs a file has to be sent to
+
+        :param fullname: The full name
+        :return: The chat IDs not sent to before if sending the file failed, all chat IDs else
+        """
+        with self.lock:
+            return list(self.pending_chat_ids.get(fullname, self.chat_ids))
+
+    def _set_pending_chat_ids(self, fullname, chat_ids):
+        """Remembers the chat IDs a file still has to be sent to
+
+        :param fullname: The full name
+        :param chat_ids: The chat IDs not sent to, empty if sent to all chats
+        """
+        with self.lock:
+            self.pending_chat_ids.pop(fullname, None)
+            if not chat_ids:
+                return
+            self.pending_chat_ids[fullname] = list(chat_ids)
+            while len(self.pending_chat_ids) > self.file_id_cache.max_size:
+                self.pending_chat_ids.popitem(last=False)
+
     # @abstractmethod override
     def send_message(self, msg, subject=''):
         if not self.initialized:
@@ -142,15 +230,88 @@ class TelegramBot(Bot):
             logging.error('Not started')
             return False
 
+        _msg = '{}{}'.format(self.settings.get_sender('telegram', 'prefix'), msg)
+
+        def send(chat_id):
+            try:
+                logging.debug('Sending message {}@{}: "{}"'.format(
+                    self.bot_info['username'], chat_id, _msg))
+                self._count('send_message')
+                self.bot.send_message(chat_id=chat_id, text=_msg)
+                return True
+            except Exception as e:
+                logging.error('Failed to send message: "{}"'.format(e))
+                self.circuit_breaker.record_error(e)
+                return False
+
+        return not self._fan_out(send, self.chat_ids)
+
+    def _send_media(self, method, media_type, chat_id, fullname, file_id=None):
+        """Sends a photo or video, uploads the file if there is no file_id
+
+        :param method: The Bot API method, send_photo or send_video
+        :param media_type: The media type, photo or video
+        :param chat_id: The chat ID
+        :param fullname: The full name
+        :param file_id: The file_id of the file, if already uploaded
+        :return: The sent message, None on error
+        """
         try:
-            _msg = '{}{}'.format(self.settings.get_sender('telegram', 'prefix'), msg)
             logging.debug('Sending message {}@{}: "{}"'.format(
-                self.bot_info['username'], self.chat_id, _msg))
-            self.bot.send_message(chat_id=self.chat_id, text=_msg)
-            return True
+                self.bot_info['username'], chat_id, fullname))
+            self._count(method)
+            if file_id:
+                return getattr(self.bot, method)(chat_id=chat_id, **{media_type: file_id})
+            with open(fullname, 'rb') as f:
+                message = getattr(self.bot, method)(chat_id=chat_id, **{media_type: f})
+            with self.lock:
+                self.bytes_uploaded = self.bytes_uploaded + os.path.getsize(fullname)
+            return message
         except Exception as e:
-            logging.error('Failed to send message: "{}"'.format(e))
+            logging.error('Failed to send {}: "{}"'.format(media_type, e))
+            self.circuit_breaker.record_error(e)
+            return None
+
+    def _get_file_id(self, message, media_type):
+        """Returns the file_id of the photo or video of a message
+
+        :param message: The message
+        :param media_type: The media type, photo or video
+        :return: The file_id, None if there is none
+        """
+        if media_type == 'photo':
+            return message.photo[-1].file_id if message and message.photo else None
+        return message.video.file_id if message and message.video else None
+
+    def _send_file(self, method, media_type, fullname):
+        """Sends a photo or video to all chats it was not sent to yet, uploads it only once
+
+        :param method: The Bot API method, send_photo or send_video
+        :param media_type: The media type, photo or video
+        :param fullname: The full name
+        :return: True if sent to all chats, False else
+        """
+        try:
+            key = self.file_id_cache.get_key(fullname)
+        except OSError as e:
+            logging.error('Failed to read file "{}": "{}"'.format(fullname, e))
             return False
+        file_id = self.file_id_cache.get(key)
+        chat_ids = self._get_pending_chat_ids(fullname)
+        if file_id is None and chat_ids:
+            message = self._send_media(method, media_type, chat_ids[0], fullname)
+            if message is None:
+                self._set_pending_chat_ids(fullname, chat_ids)
+                return False
+            file_id = self._get_file_id(message, media_type)
+            if file_id:
+                self.file_id_cache.put(key, file_id)
+            chat_ids = chat_ids[1:]
+        failed_chat_ids = self._fan_out(
+            lambda chat_id: self._send_media(method, media_type, chat_id, fullname, file_id=file_id) is not None,
+            chat_ids)
+        self._set_pending_chat_ids(fullname, failed_chat_ids)
+        return not failed_chat_ids
 
     # @abstractmethod override
     def send_image(self, fullname, subfolder, name):
@@ -163,22 +324,14 @@ class TelegramBot(Bot):
         """
         if not self.initialized:
             logging.error('Not initialized')
-            return
+            return False
 
         if not self.started:
             logging.error('Not started')
-            return
-
-        try:
-            logging.debug('Sending message {}@{}: "{}"'.format(
-                self.bot_info['username'], self.chat_id, fullname))
-            self.bot.send_photo(chat_id=self.chat_id,
-                                photo=open(fullname, 'rb'))
-            return True
-        except Exception as e:
-            logging.error('Failed to send image: "{}"'.format(e))
             return False
 
+        return self._send_file('send_photo', 'photo', fullname)
+
     # @abstractmethod override
     def send_video(self, fullname, subfolder, name):
         """Sends a video
@@ -190,18 +343,132 @@ class TelegramBot(Bot):
         """
         if not self.initialized:
             logging.error('Not initialized')
-            return
+            return False
 
         if not self.started:
             logging.error('Not started')
-            return
+            return False
+
+        return self._send_file('send_video', 'video', fullname)
+
+    def _count(self, method):
+        """Counts a request
 
+        :param method: The Bot API method
+        """
+        with self.lock:
+            self.nr_requests[method] = self.nr_requests.get(method, 0) + 1
+
+    def get_stats(self):
+        """Returns the request counters
+
+        :return: Dict with the number of requests per method, the number of albums sent,
+            the number of albums sent image by image after an error, the uploaded bytes, the file_id cache counters
+            and the connection counters per host
+        """
+        with self.lock:
+            stats = {
+                'nr_requests': dict(self.nr_requests),
+                'nr_media_groups': self.nr_media_groups,
+                'nr_media_group_fallbacks': self.nr_media_group_fallbacks,
+                'bytes_uploaded': self.bytes_uploaded,
+                'file_id_cache': self.file_id_cache.get_stats()
+            }
+        if self.transport:
+            stats['http'] = self.transport.get_stats('telegram')
+        return stats
+
+    def _split_media_groups(self, fullnames):
+        """Splits images into evenly sized albums of at most media_group_size images
+
+        :param fullnames: The full names
+        :return: List of lists of full names
+        """
+        nr_groups = math.ceil(len(fullnames) / self.media_group_size)
+        size, remainder = divmod(len(fullnames), nr_groups)
+        groups = []
+        start = 0
+        for i in range(nr_groups):
+            end = start + size + (1 if i < remainder else 0)
+            groups.append(fullnames[start:end])
+            start = end
+        return groups
+
+    def _send_media_group_to(self, chat_id, fullnames, file_ids):
+        """Sends images as one album to a chat, uploads the images without file_id
+
+        :param chat_id: The chat ID
+        :param fullnames: The full names
+        :param file_ids: The file_ids of the images, None for images to upload
+        :return: The sent messages, None on error
+        """
         try:
-            logging.debug('Sending message {}@{}: "{}"'.format(
-                self.bot_info['username'], self.chat_id, fullname))
-            self.bot.send_video(chat_id=self.chat_id,
-                                video=open(fullname, 'rb'))
-            return True
+            logging.debug('Sending album {}@{}: {} images'.format(
+                self.bot_info['username'], chat_id, len(fullnames)))
+            with contextlib.ExitStack() as stack:
+                media = [self.telegram.InputMediaPhoto(file_id or stack.enter_context(open(fullname, 'rb')))
+                         for fullname, file_id in zip(fullnames, file_ids)]
+                self._count('send_media_group')
+                messages = self.bot.send_media_group(chat_id=chat_id, media=media)
+            with self.lock:
+                self.nr_media_groups = self.nr_media_groups + 1
+                self.bytes_uploaded = self.bytes_uploaded + sum(
+                    os.path.getsize(fullname) for fullname, file_id in zip(fullnames, file_ids) if not file_id)
+            return messages
         except Exception as e:
-            logging.error('Failed to send video: "{}"'.format(e))
-            return False
+            logging.error('Failed to send album: "{}"'.format(e))
+            self.circuit_breaker.record_error(e)
+            return None
+
+    def _send_media_group(self, fullnames, chat_ids):
+        """Sends images as one album to chats, uploads the images only once
+
+        :param fullnames: The full names
+        :param chat_ids: The chat IDs
+        :return: List of the chat IDs not sent to, empty if sent to all chats
+        """
+        try:
+            keys = [self.file_id_cache.get_key(fullname) for fullname in fullnames]
+        except OSError as e:
+            logging.error('Failed to read files: "{}"'.format(e))
+            return chat_ids
+        file_ids = [self.file_id_cache.get(key) for key in keys]
+        if not all(file_ids) and chat_ids:
+            messages = self._send_media_group_to(chat_ids[0], fullnames, file_ids)
+            if messages is None:
+                return chat_ids
+            for i, message in enumerate(messages[:len(fullnames)]):
+                file_id = self._get_file_id(message, 'photo')
+                if file_id:
+                    self.file_id_cache.put(keys[i], file_id)
+                    file_ids[i] = file_id
+            chat_ids = chat_ids[1:]
+        return self._fan_out(lambda chat_id: self._send_media_group_to(chat_id, fullnames, file_ids) is not None,
+                             chat_ids)
+
+    def send_images(self, fullnames):
+        """Sends images as albums, falls back to sending the images of an album one by one on error
+
+        :param fullnames: The full names
+        :return: Dict full name -> True if sent, False else
+        """
+        if not self.initialized or not self.started:
+            logging.error('Not initialized or not started')
+            return {fullname: False for fullname in fullnames}
+
+        results = {}
+        for group in self._split_media_groups(fullnames) if fullnames else []:
+            if len(group) >= self._MEDIA_GROUP_MIN:
+                failed_chat_ids = self._send_media_group(group, self.chat_ids)
+                if not failed_chat_ids:
+                    results.update({fullname: True for fullname in group})
+                    continue
+                logging.info('Sending {} images one by one to {} chats'.format(len(group), len(failed_chat_ids)))
+                with self.lock:
+                    self.nr_media_group_fallbacks = self.nr_media_group_fallbacks + 1
+                # Only to the chats the album was not sent to
+                for fullname in group:
+                    self._set_pending_chat_ids(fullname, failed_chat_ids)
+            for fullname in group:
+                results[fullname] = self.send_image(fullname, '', '')
+        return results
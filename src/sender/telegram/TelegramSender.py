@@ -10,9 +10,9 @@
 """A Telegram Sender"""
 
 import logging
-import time
 
 from sender.Sender import Sender
+from sender.Event import Event
 from sender.telegram.TelegramBot import TelegramBot
 
 
@@ -22,8 +22,6 @@ class TelegramSender(Sender):
         """Initialization"""
         super().__init__(settings)
 
-        self.last_sent_time_msg = None
-
         self.telegram_bot = TelegramBot(self.settings)
 
     # @abstractmethod override
@@ -89,14 +87,10 @@ class TelegramSender(Sender):
             logging.debug('Not sending telegram message')
             return False
 
-        if force_send or self._is_time_to_send():
-            logging.debug('Sending telegram message')
-            logging.debug('Telegram message "{}"'.format(msg))
-            return self.telegram_bot.send_message(msg, subject)
-        else:
-            logging.debug(
-                'Time interval since last message is too small, not sending telegram message')
-            return False
+        # Rate limited by the RateLimiter
+        logging.debug('Sending telegram message')
+        logging.debug('Telegram message "{}"'.format(msg))
+        return self.telegram_bot.send_message(msg, subject)
 
     # @abstractmethod override
     def send_image(self, fullname, subfolder, name):
@@ -126,22 +120,37 @@ class TelegramSender(Sender):
         logging.debug('Sending telegram video')
         return self.telegram_bot.send_video(fullname, subfolder, name)
 
-    def _is_time_to_send(self):
-        """Checks whether to send a telegram message
+    def send_batch(self, event):
+        """Sends all files of an event, the images as albums
 
-        :return: True if it is time to send, False else
+        :param event: The Event
+        :return: Dict full name -> Boolean flag whether the file was sent
         """
-        if not self.can_send_msg():
-            return False
+        results = {}
+        images = []
+        for fullname, subfolder, name in event.files:
+            if Event.is_video(fullname):
+                results[fullname] = self.send_video(fullname, subfolder, name)
+            elif not self.can_send_img():
+                logging.debug('This sender cannot send images or is configured not to send images')
+                results[fullname] = True
+            else:
+                images.append(fullname)
+        if not images:
+            return results
 
-        curr_time = time.time()
+        if not self.is_initialized() or not self.is_started():
+            logging.debug('Not sending telegram images')
+            results.update({fullname: False for fullname in images})
+            return results
 
-        if not self.last_sent_time_msg:
-            self.last_sent_time_msg = curr_time
-            return True
+        logging.debug('Sending {} telegram image(s)'.format(len(images)))
+        results.update(self.telegram_bot.send_images(images))
+        return results
 
-        if (curr_time - self.last_sent_time_msg) > self.settings.get_sender('telegram', 'interval_messages_send_sec'):
-            self.last_sent_time_msg = curr_time
-            return True
+    def get_stats(self):
+        """Returns the request counters of the Telegram Bot
 
-        return False
+        :return: Dict with the request counters
+        """
+        return self.telegram_bot.get_stats()
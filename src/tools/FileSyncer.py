@@ -10,6 +10,7 @@
 """Uploads file to Senders. Files get deleted after all uploads are done."""
 
 import os
+import queue
 import shutil
 import logging
 import threading
@@ -18,14 +19,64 @@ import datetime
 import contextlib
 from pathlib import Path
 
+from sender.Event import Event
+from tools.SenderWorkerPool import SenderWorkerPool
+from tools.UploadJournal import UploadJournal
+from tools.RetryScheduler import RetryScheduler
+
+
+def _matches(fname, prefixes, suffixes, names):
+    """Checks whether a file or folder name matches one of the given prefixes, suffixes or names
+
+    :param fname: The file or folder name
+    :param prefixes: The prefixes (case insensitive)
+    :param suffixes: The suffixes (case insensitive)
+    :param names: The names
+    :return: True if the name matches, False else
+    """
+    for prefix in prefixes:
+        if fname.lower().startswith(prefix.lower()):
+            return True
+    for suffix in suffixes:
+        if fname.lower().endswith(suffix.lower()):
+            return True
+    return fname in names
+
 
 class FileSyncer:
+    """Syncs in one of two modes (setting sync::mode):
+
+    - walk: Every sync walks the full local folder tree
+    - watch: A file watcher (setting sync::watcher, inotify with a polling fallback) keeps an index
+      of completely written files, a sync only uploads the files indexed since the last sync.
+
+    Every Sender uploads through its own bounded worker pool, see SenderWorkerPool.
+    Failed uploads get retried per Sender by the RetryScheduler, a file is deleted as soon as all Senders
+    uploaded it or gave up on it.
+    With sync::journal_active, the upload states are persisted in an UploadJournal: unfinished uploads
+    are resumed after a restart, Senders already done with a file are skipped and the initial cleanup
+    keeps unfinished files.
+    """
 
     INVALID_LOCAL_FOLDERS = [
         '',
         '/'
     ]
 
+    SYNC_MODE_WALK = 'walk'
+    SYNC_MODE_WATCH = 'watch'
+
+    _WATCHER_INFO = {
+        'inotify': {
+            'fullpackage': 'tools.watcher.InotifyWatcher',
+            'name': 'InotifyWatcher'
+        },
+        'polling': {
+            'fullpackage': 'tools.watcher.PollingWatcher',
+            'name': 'PollingWatcher'
+        }
+    }
+
     def __init__(self, settings, sender_list=[]):
         """Initialization. Senders must all be active (successfully initialized and started).
 
@@ -44,8 +95,32 @@ class FileSyncer:
         self.blacklist_folder_suffixes = self.settings.sync_blacklist_folder_suffixes
         self.blacklist_folder_names = self.settings.sync_blacklist_folder_names
 
+        sync_settings = self.settings.get('sync', {})
+        self.sync_mode = sync_settings.get('mode', self.SYNC_MODE_WALK)
+        self.watcher_name = sync_settings.get('watcher', 'inotify')
+        self.journal_active = sync_settings.get('journal_active', False)
+
+        self.worker_pools = []
+        self.journal = None
+        self.retry_scheduler = None
+        self.watcher = None
+        # Whether the file watcher is running its initial scan
+        self.initial_scan = False
+        # Index of completely written files not yet synced (insertion ordered)
+        self.pending_files = {}
+        # Uploads in flight, shared by all syncs, so a sync handles the uploads an earlier sync stopped waiting for
+        self.fan_outs = {}
+        self.fan_outs_completed = queue.Queue()
+        self.fan_outs_lock = threading.Lock()
+
         self.initialized = False
         self.syncing = False
+        # Sync requested while syncing, runs as soon as the current sync is done
+        self.sync_pending = False
+        self.lock = threading.Lock()
+
+        self.nr_syncs = 0
+        self.nr_syncs_coalesced = 0
 
     def _assert_local_folder(self):
         """Asserts the local folder structure
@@ -77,7 +152,79 @@ class FileSyncer:
         return True
 
     def cleanup(self):
-        pass
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        if self.retry_scheduler:
+            self.retry_scheduler.stop()
+            self.retry_scheduler = None
+        for pool in self.worker_pools:
+            pool.stop()
+        self.worker_pools = []
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def _is_folder_watched(self, name):
+        """Checks whether a folder is synced
+
+        :param name: The folder name
+        :return: False if the folder is blacklisted, True else
+        """
+        return not _matches(name,
+                            self.blacklist_folder_prefixes,
+                            self.blacklist_folder_suffixes,
+                            self.blacklist_folder_names)
+
+    def _start_watcher(self):
+        """Starts the file watcher, falls back to polling and then to walking the folder tree
+
+        :return: True if a watcher has been started, False else
+        """
+        names = [self.watcher_name] + [name for name in ['polling'] if name != self.watcher_name]
+        for name in names:
+            w_info = self._WATCHER_INFO.get(name)
+            if not w_info:
+                logging.error('Unknown file watcher "{}"'.format(name))
+                continue
+            logging.info('Starting file watcher "{}"'.format(w_info['name']))
+            _module = __import__(w_info['fullpackage'], globals(), locals(), [w_info['name']], 0)
+            watcher = getattr(_module, w_info['name'])(self.settings,
+                                                       self.local_folder,
+                                                       self._cb_file_ready,
+                                                       is_folder_watched=self._is_folder_watched)
+            # Leftover files reported by the initial scan are not journaled, so the initial cleanup removes them
+            self.initial_scan = True
+            try:
+                initialized = watcher.init()
+            finally:
+                self.initial_scan = False
+            if initialized:
+                watcher.start()
+                self.watcher = watcher
+                return True
+            logging.error('Failed to initialize file watcher "{}"'.format(w_info['name']))
+        return False
+
+    def _cb_file_ready(self, fullname):
+        """Callback on a completely written file, adds the file to the index
+
+        :param fullname: The full file name
+        """
+        if self.journal and not self.initial_scan and not self.journal.get_states(fullname):
+            for pool in self.worker_pools:
+                self.journal.record(fullname, pool.name, UploadJournal.STATE_PENDING)
+        with self.lock:
+            self.pending_files[fullname] = None
+
+    def _take_pending_files(self):
+        """Takes all indexed files. Call with the lock held.
+
+        :return: List of full file names
+        """
+        files = list(self.pending_files)
+        self.pending_files = {}
+        return files
 
     def init(self):
         """Initialization, checks
@@ -93,18 +240,83 @@ class FileSyncer:
             logging.error('Local folder could not be asserted')
             return False
 
+        if not self.worker_pools:
+            self.worker_pools = [SenderWorkerPool(self.settings, sender) for sender in self.sender_list]
+            for pool in self.worker_pools:
+                pool.start()
+
+        if self.journal_active and not self.journal:
+            journal = UploadJournal(self.settings)
+            if journal.open():
+                self.journal = journal
+                with self.lock:
+                    for fullname in self._get_unfinished_files():
+                        self.pending_files[fullname] = None
+            else:
+                logging.error('Failed to open the upload journal, upload states are not persisted')
+
+        if not self.retry_scheduler:
+            self.retry_scheduler = RetryScheduler(self.settings, self.local_folder, self.worker_pools,
+                                                  journal=self.journal)
+            self.retry_scheduler.start()
+
+        if self.sync_mode == self.SYNC_MODE_WATCH and not self.watcher and not self._start_watcher():
+            logging.error('No file watcher available, falling back to sync mode "{}"'.format(self.SYNC_MODE_WALK))
+            self.sync_mode = self.SYNC_MODE_WALK
+
         self.initialized = True
 
         return self.initialized
 
+    def _get_unfinished_files(self):
+        """Returns the journaled files not yet uploaded to all active Senders
+
+        :return: List of full file names
+        """
+        if not self.journal:
+            return []
+        return self.journal.get_unfinished(senders=[pool.name for pool in self.worker_pools])
+
+    def get_stats(self):
+        """Returns the sync counters
+
+        :return: Dict with the number of syncs run, the number of sync requests coalesced into a pending sync
+            and - in watch mode - the number of indexed and failed files and the watcher counters,
+            and the upload counters per Sender, the journal and the retry counters
+        """
+        with self.lock:
+            stats = {
+                'sync_mode': self.sync_mode,
+                'syncing': self.syncing,
+                'sync_pending': self.sync_pending,
+                'nr_syncs': self.nr_syncs,
+                'nr_syncs_coalesced': self.nr_syncs_coalesced,
+                'nr_pending_files': len(self.pending_files)
+            }
+        if self.watcher:
+            stats['watcher'] = self.watcher.get_stats()
+        stats['senders'] = {pool.name: pool.get_stats() for pool in self.worker_pools}
+        if self.journal:
+            stats['journal'] = self.journal.get_stats()
+        if self.retry_scheduler:
+            stats['retries'] = self.retry_scheduler.get_stats()
+        return stats
+
     def _cb_sync_done(self):
-        """Callback on sync done"""
-        self.syncing = False
+        """Callback on sync done, starts the pending sync if there is one"""
+        with self.lock:
+            self.syncing = False
+            run_pending = self.sync_pending
+            self.sync_pending = False
+        if run_pending:
+            logging.info('Running pending sync')
+            self.sync()
 
     def sync(self, cleanup=False):
         """Synchronization logic.
         Iterates over files and directories under local file directory and uploads all found files. 
         Skips some temporary files and directories.
+        If a sync is already in progress, a single pending sync is recorded and run as soon as the current one is done.
 
         :param cleanup: Boolean flag whether to clean up the local directory
         """
@@ -112,19 +324,38 @@ class FileSyncer:
             logging.error('Not initialized')
             return
 
-        if self.syncing:
-            logging.info('Sync already in progress')
-            return
-
         if not self.sender_list:
             logging.info('No active senders found. Skipping upload...')
             return
 
+        with self.lock:
+            if self.syncing:
+                if not cleanup:
+                    if self.sync_pending:
+                        self.nr_syncs_coalesced = self.nr_syncs_coalesced + 1
+                    self.sync_pending = True
+                logging.info('Sync already in progress, {}'.format(
+                    'skipping cleanup' if cleanup else 'marked as pending'))
+                return
+            files = None
+            file_ignore_list = []
+            if cleanup:
+                file_ignore_list = self._get_unfinished_files() + [self.retry_scheduler.dead_letter_folder]
+            if self.sync_mode == self.SYNC_MODE_WATCH:
+                if cleanup:
+                    self.pending_files = {fullname: None for fullname in self._get_unfinished_files()}
+                else:
+                    files = self._take_pending_files()
+                    if not files and self.fan_outs_completed.empty():
+                        logging.debug('No new files to sync')
+                        return
+            self.syncing = True
+            self.nr_syncs = self.nr_syncs + 1
+
         logging.info('Syncing')
-        self.syncing = True
 
         s_thread = ImageSyncThread(self.settings,
-                                   self.sender_list,
+                                   self.worker_pools,
                                    local_folder=self.local_folder,
                                    whitelist_file_prefixes=self.whitelist_file_prefixes,
                                    whitelist_file_suffixes=self.whitelist_file_suffixes,
@@ -133,7 +364,14 @@ class FileSyncer:
                                    blacklist_folder_suffixes=self.blacklist_folder_suffixes,
                                    blacklist_folder_names=self.blacklist_folder_names,
                                    cb_sync_done=self._cb_sync_done,
-                                   cleanup=cleanup)
+                                   cleanup=cleanup,
+                                   files=files,
+                                   journal=self.journal,
+                                   retry_scheduler=self.retry_scheduler,
+                                   file_ignore_list=file_ignore_list,
+                                   fan_outs=self.fan_outs,
+                                   fan_outs_completed=self.fan_outs_completed,
+                                   fan_outs_lock=self.fan_outs_lock)
         s_thread.start()
 
 
@@ -141,7 +379,7 @@ class ImageSyncThread(threading.Thread):
 
     def __init__(self,
                  settings,
-                 sender_list,
+                 worker_pools,
                  local_folder,
                  whitelist_file_prefixes=[],
                  whitelist_file_suffixes=[],
@@ -150,11 +388,18 @@ class ImageSyncThread(threading.Thread):
                  blacklist_folder_suffixes=[],
                  blacklist_folder_names=[],
                  cb_sync_done=None,
-                 cleanup=False):
+                 cleanup=False,
+                 files=None,
+                 journal=None,
+                 retry_scheduler=None,
+                 file_ignore_list=[],
+                 fan_outs=None,
+                 fan_outs_completed=None,
+                 fan_outs_lock=None):
         """Initializes the thread
 
         :param settings: The settings
-        :param sender_list: The sender list
+        :param worker_pools: The upload worker pools, one per Sender
         :param local_folder: The local folder
         :param whitelist_file_prefixes: 
         :param whitelist_file_suffixes: 
@@ -164,11 +409,18 @@ class ImageSyncThread(threading.Thread):
         :param blacklist_folder_names: 
         :param cb_sync_done: Callback on sync done
         :param cleanup: Whether to clean up the local folder
+        :param files: The full file names to sync, walks the local folder if not set
+        :param journal: The upload journal
+        :param retry_scheduler: The retry scheduler, takes over files that failed to upload to a Sender
+        :param file_ignore_list: Files to keep in cleanup mode
+        :param fan_outs: The uploads in flight, shared by all syncs
+        :param fan_outs_completed: The queue of finished uploads, shared by all syncs
+        :param fan_outs_lock: The lock guarding fan_outs, shared by all syncs
         """
         threading.Thread.__init__(self)
 
         self.settings = settings
-        self.sender_list = sender_list
+        self.worker_pools = worker_pools
         self.local_folder = local_folder
         self.whitelist_file_prefixes = whitelist_file_prefixes
         self.whitelist_file_suffixes = whitelist_file_suffixes
@@ -178,6 +430,18 @@ class ImageSyncThread(threading.Thread):
         self.blacklist_folder_names = blacklist_folder_names
         self.cb_sync_done = cb_sync_done
         self.cleanup = cleanup
+        self.files = files
+        self.journal = journal
+        self.retry_scheduler = retry_scheduler
+        self.file_ignore_list = file_ignore_list
+
+        self.lock = fan_outs_lock if fan_outs_lock is not None else threading.Lock()
+        # Full file name -> Dict with subfolder, name, the Senders with pending uploads and the failed Senders
+        self.fan_outs = fan_outs if fan_outs is not None else {}
+        # (time, full file name) of the files uploaded by all Senders
+        self.completed = fan_outs_completed if fan_outs_completed is not None else queue.Queue()
+        # Store failed files for every Sender
+        self.failed_files = {}
 
     @contextlib.contextmanager
     def _stopwatch(self, name):
@@ -204,16 +468,7 @@ class ImageSyncThread(threading.Thread):
         """
         logging.debug('Processing fname="{}"'.format(fname))
 
-        for prefix in prefixes:
-            if fname.lower().startswith(prefix.lower()):
-                return whitelist
-        for suffix in suffixes:
-            if fname.lower().endswith(suffix.lower()):
-                return whitelist
-        if fname in names:
-            return whitelist
-
-        return not whitelist
+        return whitelist if _matches(fname, prefixes, suffixes, names) else not whitelist
 
     def _process_file(self, fname):
         """Checks the given file
@@ -245,7 +500,7 @@ class ImageSyncThread(threading.Thread):
             self.blacklist_folder_names,
             whitelist=False)
 
-    def _delete(self, fname):
+    def _remove(self, fname):
         """Deletes a file or full folder
 
         :param fname: File or folder name
@@ -266,37 +521,159 @@ class ImageSyncThread(threading.Thread):
         """Cleans a full folder
 
         :param folder: Folder name
-        :param file_ignore_list: File ignore list
+        :param file_ignore_list: File ignore list, folders containing one of the files are kept as well
         """
         logging.debug('Deleting [folder="{}", ignoring="{}"]'.format(
             folder, file_ignore_list))
 
+        path_ignore_list = [Path(p).as_posix() for p in file_ignore_list]
         for the_file in os.listdir(folder):
             file_path = os.path.join(folder, the_file)
             try:
-                path_ignore_list = []
-                for p in file_ignore_list:
-                    _path = Path(p).parent.as_posix()
-                    while '//' in _path:
-                        _path = _path.replace('//', '/')
-                    path_ignore_list.append(_path)
-                folder_path = Path(folder).as_posix()
-                while '//' in folder_path:
-                    folder_path = folder_path.replace('//', '/')
-                if folder_path in path_ignore_list:
+                _path = Path(file_path).as_posix()
+                if any(p == _path or p.startswith(_path + '/') for p in path_ignore_list):
                     logging.debug('Skipping "{}"'.format(file_path))
                 else:
                     logging.debug('Deleting "{}"'.format(file_path))
-                    self._delete(file_path)
+                    self._remove(file_path)
             except Exception as e:
                 logging.error('Error deleting "{}"'.format(e))
 
+    def _sync_files(self, dn, subfolder, names, curr_datetime):
+        """Queues the upload of the files of a folder (an event) to all Senders,
+        deletes files that are not whitelisted.
+        The files of the folder are sent to every Sender as one Event (see Sender::send_batch).
+
+        :param dn: The folder of the files
+        :param subfolder: The folder of the files, relative to the local folder
+        :param names: The file names
+        :param curr_datetime: The current date time string
+        """
+        subfolder_drpbx = os.path.join(
+            subfolder, curr_datetime)
+        # Pool -> List of (fullname, subfolder, name)
+        pool_files = {pool: [] for pool in self.worker_pools}
+        for name in names:
+            fullname = os.path.join(dn, name)
+            if not self._process_file(name):
+                logging.debug(
+                    'Deleting file "{}" without upload'.format(name))
+                self._remove(fullname)
+                if self.journal:
+                    self.journal.forget(fullname)
+                continue
+            logging.debug('Uploading [fullname="{}", subfolder="{}", name="{}"]'
+                          .format(fullname, subfolder_drpbx, name))
+            if self.retry_scheduler and self.retry_scheduler.is_scheduled(fullname):
+                logging.debug('Skipping "{}", retries scheduled'.format(fullname))
+                continue
+            # Skip Senders that already uploaded the file (before a restart)
+            states = self.journal.get_states(fullname) if self.journal else {}
+            pools = [pool for pool in self.worker_pools if states.get(pool.name) != UploadJournal.STATE_DONE]
+            with self.lock:
+                if fullname in self.fan_outs:
+                    continue
+                self.fan_outs[fullname] = {'subfolder': subfolder_drpbx, 'name': name,
+                                           'pending': {pool.name for pool in pools}, 'failed': []}
+            if not pools:
+                self.completed.put((time.time(), fullname))
+            for pool in pools:
+                if self.journal and states.get(pool.name) != UploadJournal.STATE_PENDING:
+                    self.journal.record(fullname, pool.name, UploadJournal.STATE_PENDING)
+                pool_files[pool].append((fullname, subfolder_drpbx, name))
+        for pool, files in pool_files.items():
+            if files:
+                pool.submit_batch(Event(subfolder, files, sync_datetime=curr_datetime), self._cb_upload_done)
+
+    def _cb_upload_done(self, pool, fullname, success):
+        """Callback of the worker pools after an upload
+
+        :param pool: The worker pool
+        :param fullname: The full file name
+        :param success: Whether the upload succeeded
+        """
+        if success:
+            logging.debug('Successfully uploaded "{}" to Sender "{}"'.format(fullname, pool.name))
+        else:
+            logging.warn('Failed to send "{}" to Sender "{}"'.format(fullname, pool.name))
+        if self.journal:
+            self.journal.record(fullname, pool.name,
+                                UploadJournal.STATE_DONE if success else UploadJournal.STATE_FAILED)
+        with self.lock:
+            fan_out = self.fan_outs[fullname]
+            fan_out['pending'].discard(pool.name)
+            if not success:
+                fan_out['failed'].append(pool.name)
+                self.failed_files.setdefault(pool.name, []).append(fullname)
+            if fan_out['pending']:
+                return
+        self.completed.put((time.time(), fullname))
+
+    def _wait_fan_outs(self):
+        """Waits for all uploads in flight, including the ones earlier syncs stopped waiting for.
+        Deletes every file uploaded by all Senders sync_done_sec after its last upload,
+        hands files that failed to upload to a Sender over to the retry scheduler.
+        Stops waiting for uploads if none finished within sync::upload_wait_sec. The uploads stay in flight
+        (and are not started again), their results are handled by a later sync.
+        """
+        sync_done_s = self.settings.get('sleep')['sync_done_sec']
+        upload_wait_s = self.settings.get('sync', {}).get('upload_wait_sec', 300)
+        to_delete = []
+        waiting = True
+        last_done_time = time.time()
+        while True:
+            with self.lock:
+                waiting = waiting and len(self.fan_outs) > 0
+            if waiting and time.time() - last_done_time > upload_wait_s:
+                self._log_pending_fan_outs(upload_wait_s)
+                waiting = False
+            if not waiting and not to_delete and self.completed.empty():
+                break
+            timeouts = [to_delete[0][0]] if to_delete else []
+            if waiting:
+                timeouts.append(last_done_time + upload_wait_s)
+            timeout = max(0, min(timeouts) - time.time()) if timeouts else 0
+            try:
+                done_time, fullname = self.completed.get(timeout=timeout) if timeout > 0 \
+                    else self.completed.get_nowait()
+                last_done_time = time.time()
+                with self.lock:
+                    fan_out = self.fan_outs.pop(fullname)
+                if not fan_out['failed']:
+                    # Wait for a certain amount of time to avoid deletion conflicts
+                    to_delete.append((done_time + sync_done_s, fullname))
+                elif self.retry_scheduler:
+                    self.retry_scheduler.schedule(fullname, fan_out['subfolder'], fan_out['name'], fan_out['failed'])
+            except queue.Empty:
+                pass
+            while to_delete and to_delete[0][0] <= time.time():
+                _, fullname = to_delete.pop(0)
+                logging.debug('Deleting "{}", uploaded by all Senders'.format(fullname))
+                self._remove(fullname)
+                if self.journal:
+                    self.journal.forget(fullname)
+
+    def _log_pending_fan_outs(self, upload_wait_s):
+        """Logs the files still waiting for uploads, per Sender
+
+        :param upload_wait_s: The time waited without a finished upload (in s)
+        """
+        with self.lock:
+            pending_files = {}
+            for fullname, fan_out in self.fan_outs.items():
+                for name in fan_out['pending']:
+                    pending_files.setdefault(name, []).append(fullname)
+        logging.error('No upload finished within {}s, not waiting for {} Sender(s) in this sync anymore'.format(
+            upload_wait_s, len(pending_files)))
+        for name, fullnames in pending_files.items():
+            logging.error('\t- Sender "{}": {} file(s) pending, e.g. "{}"'.format(name, len(fullnames), fullnames[0]))
+
     def run(self):
         """Runs the thread"""
         if self.cleanup:
             logging.info('Starting file sync thread in cleanup mode')
             try:
-                self._clean_folder(self.local_folder)
+                self._clean_folder(self.local_folder, file_ignore_list=self.file_ignore_list)
             finally:
                 logging.info('Done cleanup')
                 if self.cb_sync_done:
@@ -305,75 +682,51 @@ class ImageSyncThread(threading.Thread):
             logging.info('Starting file sync thread')
 
             try:
-                # Store failed files for every Sender
-                failed_files = {}
-                # Store files that have been successfully uploaded at least by one sender
-                uploaded_at_least_once = []
                 curr_datetime = '{:%Y-%m-%d-%H-%M-%S}'.format(
                     datetime.datetime.now())
-                for dn, dirs, files in os.walk(self.local_folder):
-                    subfolder = dn[len(self.local_folder):].strip(os.path.sep)
-                    logging.debug('Descending into "{}"...'.format(
-                        subfolder if subfolder else '/'))
-
-                    # Files of the (sub-)directory
-                    for name in files:
-                        fullname = os.path.join(dn, name)
-                        if not self._process_file(name):
-                            logging.debug(
-                                'Deleting file "{}" without upload'.format(name))
-                            self._delete(fullname)
-                        else:
-                            with self._stopwatch('Upload image to Senders'):
-                                subfolder_drpbx = os.path.join(
-                                    subfolder, curr_datetime)
-                                logging.debug('Uploading [fullname="{}", subfolder="{}", name="{}"]'
-                                              .format(fullname, subfolder_drpbx, name))
-                                for sender in self.sender_list:
-                                    func = sender.send_video if fullname.endswith(
-                                        '.mp4') else sender.send_image
-                                    if not func(fullname, subfolder_drpbx, name):
-                                        logging.warn('Failed to send "{}" to Sender "{}"'
-                                                     .format(fullname, sender.get_name()))
-                                        if not sender.get_name() in failed_files:
-                                            failed_files[sender.get_name()] = [
-                                            ]
-                                        failed_files[sender.get_name()].append(
-                                            fullname)
-                                    else:
-                                        logging.debug('Successfully uploaded "{}" to Sender "{}"'
-                                                      .format(fullname, sender.get_name()))
-                                        if not fullname in uploaded_at_least_once:
-                                            uploaded_at_least_once.append(
-                                                fullname)
-
-                    # Subdirectories of the (sub-)directory
-                    keep = []
-                    for name in dirs:
-                        if not self._process_folder(name):
-                            logging.debug('Skipping folder "{}"'.format(name))
-                        else:
-                            logging.debug('Keeping folder {}'.format(name))
-                            keep.append(name)
-                    dirs[:] = keep
+                with self._stopwatch('Upload files to Senders'):
+                    if self.files is None:
+                        for dn, dirs, files in os.walk(self.local_folder):
+                            subfolder = dn[len(self.local_folder):].strip(os.path.sep)
+                            logging.debug('Descending into "{}"...'.format(
+                                subfolder if subfolder else '/'))
+
+                            # Files of the (sub-)directory
+                            self._sync_files(dn, subfolder, files, curr_datetime)
+
+                            # Subdirectories of the (sub-)directory
+                            keep = []
+                            for name in dirs:
+                                if not self._process_folder(name):
+                                    logging.debug('Skipping folder "{}"'.format(name))
+                                else:
+                                    logging.debug('Keeping folder {}'.format(name))
+                                    keep.append(name)
+                            dirs[:] = keep
+                    else:
+                        logging.debug('Syncing {} indexed file(s)'.format(len(self.files)))
+                        # Folder -> File names, insertion ordered
+                        folders = {}
+                        for fullname in self.files:
+                            if not os.path.isfile(fullname):
+                                logging.debug('Skipping vanished file "{}"'.format(fullname))
+                                continue
+                            dn, name = os.path.split(fullname)
+                            folders.setdefault(dn, []).append(name)
+                        for dn, names in folders.items():
+                            subfolder = dn[len(self.local_folder):].strip(os.path.sep)
+                            self._sync_files(dn, subfolder, names, curr_datetime)
+
+                    # Files get deleted as soon as all Senders uploaded them
+                    self._wait_fan_outs()
 
                 # Log files that have not been successfully uploaded, per sender
-                if failed_files:
-                    logging.info('Files failed to upload:')
-                    for key, value in failed_files.items():
+                if self.failed_files:
+                    logging.info('Files failed to upload, retries scheduled:')
+                    for key, value in self.failed_files.items():
                         logging.info('\t- Sender "{}"'.format(key))
                         for v in value:
                             logging.info('\t\t- "{}"'.format(v))
-
-                # Sleep for a certain amount of time to avoid deletion conflicts
-                time.sleep(self.settings.get('sleep')['sync_done_sec'])
-
-                # Delete files that have been successfully uploaded at least by one sender
-                if uploaded_at_least_once:
-                    logging.info(
-                        'Deleting files that have been uploaded at least by one Sender')
-                    for fname in uploaded_at_least_once:
-                        self._delete(fname)
             finally:
                 logging.info('Done syncing')
                 if self.cb_sync_done:
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Hands messages to all Senders concurrently, without blocking the caller"""
+
+import time
+import queue
+import logging
+import itertools
+import threading
+
+from sender.RateLimiter import RateLimiter
+from sender.CircuitBreaker import CircuitBreaker
+
+
+class MessageDispatcher:
+    """Every Sender gets its own worker thread and a queue bounded by dispatch::queue_size,
+    so a slow Sender only delays its own messages. dispatch returns immediately.
+
+    A message still queued senders::<name>::message_deadline_sec (default dispatch::deadline_sec)
+    after it was dispatched is dropped. The deadline does not limit the send itself:
+    a message that is already being sent is not aborted, it is counted as late if it was sent after the deadline.
+    Messages wait for the message rate limit of their Sender (see RateLimiter), except forced messages,
+    which are also sent before all other queued messages.
+    Messages of a rate-limited Sender are delayed, not expired.
+    While the CircuitBreaker of a Sender is open, its messages fail fast.
+    The delivery latency (dispatch to sent) is recorded per Sender.
+
+    Failover rules circuit_breaker::failover map a Sender to a standby Sender, e.g. {"telegram": "mail"}.
+    A standby Sender gets its own messages and the messages its Sender failed to send,
+    i.e. while its circuit breaker is open or when sending raised an error.
+    Messages a Sender declines (e.g. messages disabled in the settings) are not failed over.
+    """
+
+    _PRIORITY_FORCED = 0
+    _PRIORITY_NEW = 1
+    _PRIORITY_STOP = 2
+
+    def __init__(self, settings, senders):
+        """Initialization
+
+        :param settings: The settings
+        :param senders: The Senders
+        """
+        self.settings = settings
+        self.senders = senders
+
+        dispatch_settings = self.settings.get('dispatch', {})
+        self.queue_size = dispatch_settings.get('queue_size', 20)
+        self.deadline_s = dispatch_settings.get('deadline_sec', 30)
+        # Sender name -> standby Sender name (keys in senders)
+        self.failover = self.settings.get('circuit_breaker', {}).get('failover', {})
+
+        self.lock = threading.Lock()
+        # Sender name -> queued (priority, sequence, (dispatch time, message, subject, force_send, failed over)),
+        # None instead of the message to stop the worker
+        self.queues = {}
+        self.sequence = itertools.count()
+        # Set to stop the workers once their queues are empty
+        self.stopping = threading.Event()
+        # Key in senders -> Sender name
+        self.names = {}
+        self.deadlines = {}
+        self.workers = []
+        self.stats = {}
+
+    def start(self):
+        """Starts one worker per Sender"""
+        if self.workers:
+            return
+        for sender in self.senders:
+            name = sender.get_name()
+            self.names[name.lower()] = name
+            self.queues[name] = queue.PriorityQueue(maxsize=self.queue_size)
+            self.deadlines[name] = self.settings.get_sender(name.lower(), 'message_deadline_sec', self.deadline_s)
+            self.stats[name] = {
+                'nr_sent': 0,
+                'nr_not_sent': 0,
+                'nr_failed': 0,
+                'nr_expired': 0,
+                'nr_late': 0,
+                'nr_dropped': 0,
+                'nr_rejected': 0,
+                'nr_failed_over': 0,
+                'latency_s': 0,
+                'latency_max_s': 0
+            }
+            worker = threading.Thread(target=self._work, args=(sender, self.queues[name]),
+                                      name='Dispatch-{}'.format(name), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        for _name, standby_name in self.failover.items():
+            if _name in self.names and standby_name in self.names:
+                logging.info('Sender "{}" is the standby of Sender "{}"'.format(self.names[standby_name],
+                                                                              self.names[_name]))
+
+    def stop(self, timeout_s=None):
+        """Stops the workers after the queued messages are sent
+
+        :param timeout_s: The maximum time to wait for the workers (in s), waits until finished if not set
+        :return: True if all workers finished, False else
+        """
+        self.stopping.set()
+        for _queue in self.queues.values():
+            try:
+                _queue.put_nowait((self._PRIORITY_STOP, next(self.sequence), None))
+            except queue.Full:
+                # The worker stops once it has emptied its queue
+                pass
+        end_time = None if timeout_s is None else time.time() + timeout_s
+        for worker in self.workers:
+            worker.join(None if end_time is None else max(0, end_time - time.time()))
+        finished = not any(worker.is_alive() for worker in self.workers)
+        self.workers = []
+        return finished
+
+    def dispatch(self, msg, subject='', force_send=False):
+        """Queues a message for all Senders, does not block
+
+        :param msg: The message
+        :param subject: The subject
+        :param force_send: Whether to send the message regardless of the message rate limit of a Sender
+        """
+        if self.stopping.is_set():
+            logging.error('Stopping, not dispatching message "{}"'.format(subject))
+            return
+        item = (time.time(), msg, subject, force_send, False)
+        for name in self.queues:
+            self._put(name, item)
+
+    def _put(self, name, item):
+        """Queues a message for a Sender, drops it if the queue is full
+
+        :param name: The name of the Sender
+        :param item: The queue item
+        """
+        priority = self._PRIORITY_FORCED if item[3] else self._PRIORITY_NEW
+        try:
+            self.queues[name].put_nowait((priority, next(self.sequence), item))
+        except queue.Full:
+            logging.error('Message queue of Sender "{}" full, dropping message "{}"'.format(name, item[2]))
+            with self.lock:
+                self.stats[name]['nr_dropped'] = self.stats[name]['nr_dropped'] + 1
+
+    def _fail_over(self, name, item):
+        """Queues a message a Sender failed to send for its standby Sender (if it has one)
+
+        :param name: The name of the Sender
+        :param item: The queue item
+        """
+        standby_name = self.names.get(self.failover.get(name.lower()))
+        if not standby_name or item[4]:
+            return
+        logging.info('Failing over message "{}" from Sender "{}" to Sender "{}"'.format(item[2], name, standby_name))
+        with self.lock:
+            self.stats[name]['nr_failed_over'] = self.stats[name]['nr_failed_over'] + 1
+        self._put(standby_name, item[:4] + (True,))
+
+    def get_stats(self):
+        """Returns the dispatch counters
+
+        :return: Dict Sender name -> Dict with the queue depth, the number of sent, not sent (e.g. messages disabled),
+            failed, expired (dropped after the deadline), late (sent after the deadline), dropped (queue full),
+            rejected (circuit breaker open) and failed over messages, the mean and maximum delivery latency
+            of the sent messages (in s) and the circuit breaker counters
+        """
+        with self.lock:
+            stats = {}
+            for name, _stats in self.stats.items():
+                stats[name] = dict(_stats, queue_depth=self.queues[name].qsize())
+                stats[name]['latency_s'] = (_stats['latency_s'] / _stats['nr_sent']) if _stats['nr_sent'] else 0
+        for name in stats:
+            stats[name]['circuit_breaker'] = CircuitBreaker.get_shared(self.settings, name.lower()).get_stats()
+        return stats
+
+    def _work(self, sender, _queue):
+        """Runs the worker of a Sender
+
+        :param sender: The Sender
+        :param _queue: The message queue of the Sender
+        """
+        name = sender.get_name()
+        deadline_s = self.deadlines[name]
+        rate_limiter = RateLimiter.get_shared(self.settings, name.lower())
+        rate_limited = rate_limiter.get_bucket(RateLimiter.MESSAGES).get_rate() > 0
+        circuit_breaker = CircuitBreaker.get_shared(self.settings, name.lower())
+        while True:
+            if self.stopping.is_set() and _queue.empty():
+                return
+            _, _, item = _queue.get()
+            if item is None:
+                return
+            dispatch_time, msg, subject, force_send, _ = item
+            if not sender.can_send_msg():
+                logging.debug('Sender "{}" does not send messages, not sending message "{}"'.format(name, subject))
+                with self.lock:
+                    self.stats[name]['nr_not_sent'] = self.stats[name]['nr_not_sent'] + 1
+                continue
+            if circuit_breaker.is_open(count_rejected=True):
+                logging.debug('Circuit breaker of Sender "{}" open, not sending message "{}"'.format(name, subject))
+                with self.lock:
+                    self.stats[name]['nr_rejected'] = self.stats[name]['nr_rejected'] + 1
+                self._fail_over(name, item)
+                continue
+            if not force_send:
+                rate_limiter.acquire(RateLimiter.MESSAGES)
+            if not rate_limited and time.time() - dispatch_time > deadline_s:
+                logging.info('Message "{}" not sent to Sender "{}" within {}s, dropping'.format(subject, name,
+                                                                                                 deadline_s))
+                with self.lock:
+                    self.stats[name]['nr_expired'] = self.stats[name]['nr_expired'] + 1
+                continue
+            if not circuit_breaker.allow():
+                with self.lock:
+                    self.stats[name]['nr_rejected'] = self.stats[name]['nr_rejected'] + 1
+                self._fail_over(name, item)
+                continue
+            error = None
+            try:
+                sent = sender.send_msg(msg, subject=subject, force_send=force_send)
+                failed = False
+            except Exception as e:
+                logging.error('Failed to send message to Sender "{}": "{}"'.format(name, e))
+                sent = False
+                failed = True
+                error = e
+            if sender.records_send_results():
+                circuit_breaker.record(None)
+            else:
+                circuit_breaker.record_result(sent, error)
+            latency_s = time.time() - dispatch_time
+            with self.lock:
+                stats = self.stats[name]
+                if sent:
+                    stats['nr_sent'] = stats['nr_sent'] + 1
+                    stats['latency_s'] = stats['latency_s'] + latency_s
+                    stats['latency_max_s'] = max(stats['latency_max_s'], latency_s)
+                    if latency_s > deadline_s:
+                        stats['nr_late'] = stats['nr_late'] + 1
+                elif failed:
+                    stats['nr_failed'] = stats['nr_failed'] + 1
+                else:
+                    stats['nr_not_sent'] = stats['nr_not_sent'] + 1
+            if not sent and not failed:
+                logging.info('Message not sent to Sender "{}"'.format(name))
+            if failed:
+                self._fail_over(name, item)
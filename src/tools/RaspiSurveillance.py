@@ -15,7 +15,9 @@ import logging
 
 from tools.GracefulKiller import GracefulKiller
 from sender.SenderRegister import SenderRegister
+from sender.AsyncRuntime import AsyncRuntime
 from tools.FileSyncer import FileSyncer
+from tools.MessageDispatcher import MessageDispatcher
 from i18n.I18n import I18n
 from tools.Helper import parse_args
 
@@ -55,6 +57,11 @@ class RaspiSurveillance:
         logging.debug('Filtering active sensors')
         self.active_senders = self._init_and_start_senders()
 
+        # Initialize MessageDispatcher
+        logging.info('Initializing MessageDispatcher')
+        self.message_dispatcher = MessageDispatcher(self.settings, self.active_senders)
+        self.message_dispatcher.start()
+
         # Initialize FileSyncer
         logging.info('Initializing FileSyncer')
         self.file_syncer = FileSyncer(self.settings, self.active_senders)
@@ -122,7 +129,7 @@ class RaspiSurveillance:
             logging.debug(sender)
             if self.settings.get_sender(sender['package'], 'active'):
                 logging.debug('Status: Active')
-                self.list_senders.append(sender['class'](self.settings))
+                self.list_senders.append(s_register.create(sender, self.settings))
             else:
                 logging.debug('Status: Inactive')
 
@@ -142,16 +149,23 @@ class RaspiSurveillance:
         return l
 
     def _send_msg_to_senders(self, msg, subject='', force_send=False):
-        """Sends a message to all senders
+        """Sends a message to all senders concurrently, does not wait for the senders
 
         :param msg: The message
         """
         logging.debug('Sending message to Senders')
 
-        for sender in self.active_senders:
-            if not sender.send_msg(msg, subject=subject, force_send=force_send):
-                logging.info(
-                    'Message not sent to Sender "{}"'.format(sender.get_name()))
+        self.message_dispatcher.dispatch(msg, subject=subject, force_send=force_send)
+
+    def _cleanup_wait_messages_sent(self):
+        """Waits for the MessageDispatcher to send the queued messages until a max amount of time"""
+        logging.info('Waiting for MessageDispatcher to send the queued messages')
+        if self.message_dispatcher.stop(timeout_s=self.settings.get('max_wait')['finish_sender_tasks_sec']):
+            logging.info('MessageDispatcher sent the queued messages')
+        else:
+            logging.info('MessageDispatcher did not send all queued messages. Forcing to stop.')
+        for name, stats in self.message_dispatcher.get_stats().items():
+            logging.info('Messages of Sender "{}": {}'.format(name, stats))
 
     def _init(self):
         """Manual initialization"""
@@ -212,16 +226,24 @@ class RaspiSurveillance:
             logging.info(
                 'Not all senders finished its tasks. Forcing to stop.')
 
+    def _file_syncer_busy(self):
+        """Checks whether the FileSyncer is syncing or has a pending sync
+
+        :return: True if busy, False else
+        """
+        stats = self.file_syncer.get_stats()
+        return stats['syncing'] or stats['sync_pending']
+
     def _cleanup_wait_filesyncer_finish(self):
         """Waits for FilySyncer to finish until a max amount of time"""
         logging.info('Waiting for FileSyncer to finish its tasks')
         curr_time = time.time()
         max_wait_s = self.settings.get(
             'max_wait')['finish_filesyncer_tasks_sec']
-        while self.file_syncer.syncing and not ((time.time() - curr_time) > max_wait_s):
+        while self._file_syncer_busy() and not ((time.time() - curr_time) > max_wait_s):
             logging.info('FileSyncer not yet finished')
             time.sleep(self.settings.get('sleep')['file_sync_finished_sec'])
-        if not self.file_syncer.syncing:
+        if not self._file_syncer_busy():
             logging.info('FileSyncer finished its tasks')
         else:
             logging.info(
@@ -238,21 +260,22 @@ class RaspiSurveillance:
             subject=self.i18n.get('sender.stopped.subject'),
             force_send=True)
 
-        self.file_syncer.cleanup()
-
         if self.settings.get('use_sensors') and self.sensors:
             self.sensors.cleanup()
 
-        # Wait for Senders to finish
+        # Wait for the messages to be sent, then for Senders to finish
+        self._cleanup_wait_messages_sent()
         self._cleanup_wait_senders_finish()
 
         # Wait for FileSyncer to finish
         self._cleanup_wait_filesyncer_finish()
+        self.file_syncer.cleanup()
 
         # Cleanup
         for sender in self.active_senders:
             sender.stop()
             sender.cleanup()
+        AsyncRuntime.stop_shared(timeout_s=self.settings.get('max_wait')['finish_sender_tasks_sec'])
 
         self.running = False
 
@@ -277,12 +300,16 @@ class RaspiSurveillance:
 
         logging.info('Starting surveillance loop')
 
+        main_loop_s = self.settings.get('sleep')['main_loop_sec']
         try:
             while not self.g_killer.kill_now:
                 try:
-                    if self._check_sensors():
-                        self.sensors.tick()
-                    time.sleep(self.settings.get('sleep')['main_loop_sec'])
+                    if use_sensors:
+                        # Blocks until a sensor edge arrives, at most main_loop_s.
+                        # Sensors are read during the cooldown as well, so motion extends or queues captures.
+                        self.sensors.tick(timeout=main_loop_s)
+                    else:
+                        time.sleep(main_loop_s)
                 except:
                     self.g_killer.kill_now = True
                     logging.info('Stopping surveillance loop')
@@ -300,14 +327,16 @@ class RaspiSurveillance:
         """Callback on motion detected"""
         logging.info('Motion detected')
 
-        logging.info('Not reading sensor data for about {} seconds'.format(
-            self.settings.get('sleep')['check_sensors_sec']))
-
-        self.last_detection_time = time.time()
-        # Take some images
+        # Take some images, the camera service merges the capture into an in-flight one or queues it
         if self.settings.get('use_sensors'):
             self.sensors.capture_camera_image(cb=self._on_images_captured)
 
+        if not self._is_cooldown_over():
+            logging.info('Motion detected within {} seconds after the last message, not sending a message'.format(
+                self.settings.get('sleep')['check_sensors_sec']))
+            return
+        self.last_detection_time = time.time()
+
         # Send a notification message
         logging.debug('Sending motion detected message')
         msg = self.i18n.get('sensors.motion.detected_timestamp.message').format(datetime.datetime.now())
@@ -317,14 +346,11 @@ class RaspiSurveillance:
         """Callback on motion ended"""
         logging.debug('Motion ended')
 
-    def _check_sensors(self):
-        """Checks whether to check the sensors
+    def _is_cooldown_over(self):
+        """Checks whether the last motion detected message was sent more than check_sensors_sec ago
 
         :return: True if it is time to send, False else
         """
-        if not self.settings.get('use_sensors'):
-            return False
-
         curr_time = time.time()
 
         if not self.last_detection_time:
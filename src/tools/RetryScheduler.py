@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Retries failed uploads per Sender with exponential backoff, moves files to a dead-letter folder after too many attempts"""
+
+import os
+import time
+import heapq
+import random
+import shutil
+import logging
+import threading
+
+from tools.UploadJournal import UploadJournal
+
+
+class RetryScheduler(threading.Thread):
+    """The n-th retry of a file for a Sender is due after
+    min(sync::retry_backoff_max_sec, sync::retry_backoff_base_sec * 2^(n-1)), randomized by +/- sync::retry_jitter.
+
+    After sync::retry_max_attempts failed attempts the Sender gives up on the file. As soon as no Sender
+    is left to retry a file, the file gets deleted - or, if a Sender gave up on it,
+    moved to the dead-letter folder sync::dead_letter_folder_name.
+    Retries are queued with a lower priority than new uploads.
+    """
+
+    def __init__(self, settings, local_folder, worker_pools, journal=None):
+        """Initialization
+
+        :param settings: The settings
+        :param local_folder: The local folder
+        :param worker_pools: The upload worker pools, one per Sender
+        :param journal: The upload journal
+        """
+        threading.Thread.__init__(self, name='RetryScheduler', daemon=True)
+
+        self.settings = settings
+        self.local_folder = local_folder
+        self.worker_pools = {pool.name: pool for pool in worker_pools}
+        self.journal = journal
+
+        sync_settings = self.settings.get('sync', {})
+        self.max_attempts = sync_settings.get('retry_max_attempts', 5)
+        self.backoff_base_s = sync_settings.get('retry_backoff_base_sec', 10)
+        self.backoff_max_s = sync_settings.get('retry_backoff_max_sec', 600)
+        self.jitter = sync_settings.get('retry_jitter', 0.5)
+        self.dead_letter_folder = os.path.join(self.local_folder,
+                                               sync_settings.get('dead_letter_folder_name', '@dead-letter'))
+
+        self.condition = threading.Condition()
+        self.stopped = False
+        # Heap of (due time, sequence number, full file name, Sender name)
+        self.due = []
+        self.sequence = 0
+        # Full file name -> Dict with subfolder, name, Sender name -> attempts, Sender names given up
+        self.files = {}
+
+        self.nr_retries = 0
+        self.nr_retries_succeeded = 0
+        self.nr_given_up = {}
+        self.nr_dead_lettered = 0
+
+    def get_backoff(self, attempts):
+        """Returns the randomized delay before the next attempt
+
+        :param attempts: Number of failed attempts so far
+        :return: The delay (in s)
+        """
+        delay_s = min(self.backoff_max_s, self.backoff_base_s * (2 ** max(0, attempts - 1)))
+        return max(0, delay_s * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def is_scheduled(self, fullname):
+        """Checks whether retries of a file are scheduled
+
+        :param fullname: The full file name
+        :return: True if scheduled, False else
+        """
+        with self.condition:
+            return fullname in self.files
+
+    def schedule(self, fullname, subfolder, name, senders):
+        """Schedules retries of a file
+
+        :param fullname: The full file name
+        :param subfolder: The remote subfolder
+        :param name: The file name
+        :param senders: The names of the Senders that failed to upload the file
+        """
+        with self.condition:
+            entry = self.files.setdefault(fullname, {
+                'subfolder': subfolder,
+                'name': name,
+                'attempts': {},
+                'given_up': []
+            })
+            for sender in senders:
+                entry['attempts'][sender] = 1
+                self._push(fullname, sender, 1)
+            logging.info('Scheduled retries of "{}" for Sender(s) {}'.format(fullname, ', '.join(senders)))
+            self.condition.notify()
+
+    def _push(self, fullname, sender, attempts):
+        """Pushes a due retry. Call with the condition held.
+
+        :param fullname: The full file name
+        :param sender: The Sender name
+        :param attempts: Number of failed attempts so far
+        """
+        self.sequence = self.sequence + 1
+        heapq.heappush(self.due, (time.time() + self.get_backoff(attempts), self.sequence, fullname, sender))
+
+    def stop(self):
+        """Stops retrying, files scheduled for retries are kept"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def get_stats(self):
+        """Returns the retry counters
+
+        :return: Dict with the backlog (files and retries scheduled per Sender),
+            the number of retries, succeeded retries, give-ups per Sender and dead-lettered files
+        """
+        with self.condition:
+            backlog = {}
+            for entry in self.files.values():
+                for sender in entry['attempts']:
+                    backlog[sender] = backlog.get(sender, 0) + 1
+            return {
+                'nr_files_scheduled': len(self.files),
+                'backlog': backlog,
+                'next_retry_in_s': max(0, self.due[0][0] - time.time()) if self.due else None,
+                'nr_retries': self.nr_retries,
+                'nr_retries_succeeded': self.nr_retries_succeeded,
+                'nr_given_up': dict(self.nr_given_up),
+                'nr_dead_lettered': self.nr_dead_lettered
+            }
+
+    def run(self):
+        """Submits due retries to the worker pools until stopped"""
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.due or self.due[0][0] > time.time()):
+                    self.condition.wait(timeout=(self.due[0][0] - time.time()) if self.due else None)
+                if self.stopped:
+                    return
+                _, _, fullname, sender = heapq.heappop(self.due)
+                entry = self.files.get(fullname)
+                pool = self.worker_pools.get(sender)
+                if entry is None or pool is None:
+                    continue
+                self.nr_retries = self.nr_retries + 1
+            logging.debug('Retrying "{}" for Sender "{}" (attempt {})'.format(
+                fullname, sender, entry['attempts'][sender] + 1))
+            pool.submit(fullname, entry['subfolder'], entry['name'], self._cb_retry_done, retry=True)
+
+    def _cb_retry_done(self, pool, fullname, success):
+        """Callback of the worker pools after a retry
+
+        :param pool: The worker pool
+        :param fullname: The full file name
+        :param success: Whether the upload succeeded
+        """
+        if self.journal:
+            self.journal.record(fullname, pool.name,
+                                UploadJournal.STATE_DONE if success else UploadJournal.STATE_FAILED)
+        with self.condition:
+            entry = self.files[fullname]
+            if success:
+                self.nr_retries_succeeded = self.nr_retries_succeeded + 1
+                del entry['attempts'][pool.name]
+            else:
+                attempts = entry['attempts'][pool.name] + 1
+                if attempts >= self.max_attempts:
+                    logging.error('Giving up on "{}" for Sender "{}" after {} attempts'.format(
+                        fullname, pool.name, attempts))
+                    self.nr_given_up[pool.name] = self.nr_given_up.get(pool.name, 0) + 1
+                    del entry['attempts'][pool.name]
+                    entry['given_up'].append(pool.name)
+                else:
+                    entry['attempts'][pool.name] = attempts
+                    self._push(fullname, pool.name, attempts)
+                    self.condition.notify()
+            if entry['attempts']:
+                return
+            del self.files[fullname]
+        self.finish(fullname, entry['given_up'])
+
+    def finish(self, fullname, given_up):
+        """Deletes a file all Senders are done with or moves it to the dead-letter folder
+
+        :param fullname: The full file name
+        :param given_up: The names of the Senders that gave up on the file
+        """
+        try:
+            if given_up:
+                relname = os.path.relpath(fullname, self.local_folder)
+                dead_name = os.path.join(self.dead_letter_folder, relname)
+                logging.info('Moving "{}" to the dead-letter folder, Sender(s) {} gave up'.format(
+                    fullname, ', '.join(given_up)))
+                os.makedirs(os.path.dirname(dead_name), exist_ok=True)
+                shutil.move(fullname, dead_name)
+                with self.condition:
+                    self.nr_dead_lettered = self.nr_dead_lettered + 1
+            elif os.path.exists(fullname):
+                logging.debug('Removing file "{}"'.format(fullname))
+                os.remove(fullname)
+        except OSError as e:
+            logging.error('Failed to finish "{}": "{}"'.format(fullname, e))
+        if self.journal:
+            self.journal.forget(fullname)
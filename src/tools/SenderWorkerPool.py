@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A bounded pool of upload workers for a single Sender"""
+
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+
+from sender.Event import Event
+from sender.RateLimiter import RateLimiter
+from sender.CircuitBreaker import CircuitBreaker
+
+class SenderWorkerPool:
+    """Uploads files to a single Sender with senders::<name>::upload_workers threads
+    from a queue bounded by sync::upload_queue_size (submit blocks while the queue is full).
+    New uploads are taken before retries.
+    The files of an event submitted via submit_batch are sent with Sender::send_batch.
+    Every upload (a file or a batch) waits for the request and byte rate limits of the Sender (see RateLimiter).
+    While the CircuitBreaker of the Sender is open, uploads fail fast.
+    """
+
+    _PRIORITY_NEW = 0
+    _PRIORITY_RETRY = 1
+    _PRIORITY_STOP = 2
+
+    def __init__(self, settings, sender):
+        """Initialization
+
+        :param settings: The settings
+        :param sender: The Sender
+        """
+        self.settings = settings
+        self.sender = sender
+
+        self.name = self.sender.get_name()
+        self.nr_workers = max(1, self.settings.get_sender(self.name.lower(), 'upload_workers', 1))
+        self.queue_size = self.settings.get('sync', {}).get('upload_queue_size', 100)
+        self.rate_limiter = RateLimiter.get_shared(self.settings, self.name.lower())
+        self.circuit_breaker = CircuitBreaker.get_shared(self.settings, self.name.lower())
+
+        self.tasks = queue.PriorityQueue(maxsize=self.queue_size)
+        self.sequence = itertools.count()
+        self.workers = []
+        self.lock = threading.Lock()
+        # Orders all queued uploads before the stop markers
+        self.submit_lock = threading.Lock()
+        self.stopped = False
+
+        self.nr_uploaded = 0
+        self.nr_failed = 0
+        self.bytes_uploaded = 0
+        self.upload_s = 0
+
+    def start(self):
+        """Starts the workers"""
+        if self.workers:
+            return
+        logging.info('Starting {} upload worker(s) for Sender "{}"'.format(self.nr_workers, self.name))
+        for nr in range(self.nr_workers):
+            worker = threading.Thread(target=self._work, name='Upload-{}-{}'.format(self.name, nr), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """Stops the workers after the queued uploads are done"""
+        with self.submit_lock:
+            self.stopped = True
+        for _ in self.workers:
+            self.tasks.put((self._PRIORITY_STOP, next(self.sequence), None))
+        self.workers = []
+
+    def submit(self, fullname, subfolder, name, cb_done, retry=False):
+        """Queues an upload, blocks while the queue is full
+
+        :param fullname: The full file name
+        :param subfolder: The remote subfolder
+        :param name: The file name
+        :param cb_done: Called with the arguments (pool, fullname, success) after the upload
+        :param retry: Whether the upload is a retry
+        """
+        self.submit_batch(Event(subfolder, [(fullname, subfolder, name)]), cb_done, retry=retry)
+
+    def submit_batch(self, event, cb_done, retry=False):
+        """Queues the upload of all files of an event, blocks while the queue is full
+
+        :param event: The Event
+        :param cb_done: Called with the arguments (pool, fullname, success) after the upload, once per file
+        :param retry: Whether the upload is a retry
+        """
+        priority = self._PRIORITY_RETRY if retry else self._PRIORITY_NEW
+        with self.submit_lock:
+            if not self.stopped:
+                self.tasks.put((priority, next(self.sequence), (event, cb_done)))
+                return
+        logging.error('Upload workers of Sender "{}" stopped, not uploading {} file(s)'.format(self.name, len(event)))
+        if cb_done:
+            for fullname, _, _ in event.files:
+                cb_done(self, fullname, False)
+
+    def get_stats(self):
+        """Returns the upload counters
+
+        :return: Dict with the number of workers, the queue depth, the number of uploaded and failed files,
+            the throughput of a single worker, the rate limiter and circuit breaker counters
+            and the counters of the Sender (if it has any)
+        """
+        sender_stats = self.sender.get_stats() if callable(getattr(self.sender, 'get_stats', None)) else None
+        with self.lock:
+            stats = {
+                'nr_workers': self.nr_workers,
+                'queue_depth': self.tasks.qsize(),
+                'nr_uploaded': self.nr_uploaded,
+                'nr_failed': self.nr_failed,
+                'bytes_uploaded': self.bytes_uploaded,
+                'files_per_s': (self.nr_uploaded / self.upload_s) if self.upload_s > 0 else 0,
+                'bytes_per_s': (self.bytes_uploaded / self.upload_s) if self.upload_s > 0 else 0
+            }
+        stats['rate_limits'] = self.rate_limiter.get_stats()
+        stats['circuit_breaker'] = self.circuit_breaker.get_stats()
+        if sender_stats is not None:
+            stats['sender'] = sender_stats
+        return stats
+
+    def _work(self):
+        """Runs a worker"""
+        while True:
+            _, _, task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                self._upload(*task)
+            finally:
+                self.tasks.task_done()
+
+    def _send(self, fullname, subfolder, name):
+        """Sends a single file
+
+        :param fullname: The full file name
+        :param subfolder: The remote subfolder
+        :param name: The file name
+        :return: Whether the upload succeeded
+        """
+        if not self.circuit_breaker.allow():
+            logging.debug('Circuit breaker of Sender "{}" open, not sending "{}"'.format(self.name, fullname))
+            return False
+        func = self.sender.send_video if Event.is_video(fullname) else self.sender.send_image
+        error = None
+        try:
+            self.rate_limiter.acquire_upload(os.path.getsize(fullname) if os.path.exists(fullname) else 0)
+            success = func(fullname, subfolder, name)
+        except Exception as e:
+            logging.error('Failed to send "{}" to Sender "{}": "{}"'.format(fullname, self.name, e))
+            success = False
+            error = e
+        self.circuit_breaker.record_result(success, error)
+        return success
+
+    def _upload(self, event, cb_done):
+        """Uploads the files of a task, in one batch if there are several
+
+        :param event: The Event
+        :param cb_done: Called with the arguments (pool, fullname, success) after the upload, once per file
+        """
+        t0 = time.time()
+        if len(event) > 1 and not self.circuit_breaker.allow():
+            logging.debug('Circuit breaker of Sender "{}" open, not sending {} file(s)'.format(self.name, len(event)))
+            results = {}
+        elif len(event) > 1:
+            error = None
+            try:
+                self.rate_limiter.acquire_upload(event.get_size())
+                results = self.sender.send_batch(event)
+            except Exception as e:
+                logging.error('Failed to send {} file(s) to Sender "{}": "{}"'.format(len(event), self.name, e))
+                results = {}
+                error = e
+            self.circuit_breaker.record_result(all(results.get(fullname, False) for fullname, _, _ in event.files),
+                                               error)
+        else:
+            results = {fullname: self._send(fullname, subfolder, name) for fullname, subfolder, name in event.files}
+        t1 = time.time()
+        with self.lock:
+            self.upload_s = self.upload_s + (t1 - t0)
+        for fullname, _, _ in event.files:
+            success = results.get(fullname, False)
+            try:
+                size = os.path.getsize(fullname)
+            except OSError:
+                size = 0
+            with self.lock:
+                if success:
+                    self.nr_uploaded = self.nr_uploaded + 1
+                    self.bytes_uploaded = self.bytes_uploaded + size
+                else:
+                    self.nr_failed = self.nr_failed + 1
+            if cb_done:
+                cb_done(self, fullname, success)
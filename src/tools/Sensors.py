@@ -11,21 +11,11 @@
 
 import time
 import datetime
-from os import system
-import os
+import queue
 import logging
-import threading
-from subprocess import call
 
-system('sudo killall pigpiod')
-SLEEP_KILL_S = 4
-logging.info('Initializing pigpiod for {}s...'.format(SLEEP_KILL_S))
-time.sleep(SLEEP_KILL_S)
-system('sudo pigpiod')
-
-import RPi.GPIO as GPIO
-import pigpio
-from picamera import PiCamera
+from tools.camera.CameraService import CameraService, CaptureJob
+from tools.gpio.GpioBackend import GpioBackend
 
 
 class Sensors:
@@ -35,18 +25,39 @@ class Sensors:
     1. Call init
     2. Call warmup
     3. Call start
-    4. Call loop, sleep, repeat 4.
+    4. Call tick (blocks until a sensor edge arrives or the timeout is over), repeat 4.
+
+    Edges are pushed by pigpio callbacks (PIR) and the camera motion detector
+    into a thread-safe queue, timestamped, and processed in tick.
     """
 
     LOW = 0
     HIGH = 1
 
-    def __init__(self, settings, cb_motion_detected=None, cb_motion_ended=None):
+    SOURCE_PIR = 'pir'
+    SOURCE_CAMERA = 'camera'
+    SOURCE_BOTH = 'both'
+
+    _GPIO_BACKEND_INFO = {
+        'pigpio': {
+            'fullpackage': 'tools.gpio.PigpioBackend',
+            'name': 'PigpioBackend'
+        },
+        'fake': {
+            'fullpackage': 'tools.gpio.FakeGpioBackend',
+            'name': 'FakeGpioBackend'
+        }
+    }
+
+    _FILE_UPTIME = '/proc/uptime'
+
+    def __init__(self, settings, cb_motion_detected=None, cb_motion_ended=None, gpio_backend=None):
         """Initialization
 
         :param settings: The settings
         :param cb_motion_detected: On motion detected
         :param cb_motion_ended: On motion ended
+        :param gpio_backend: The GPIO backend. If not set, the backend is loaded from the setting gpio::backend
         """
         self.settings = settings
         self.cb_motion_detected = cb_motion_detected
@@ -55,33 +66,78 @@ class Sensors:
         self.time_sleep_init_s = self.settings.get('sleep')['sensors_init_sec']
         self.time_sleep_warmup_s = self.settings.get('sleep')['sensors_warmup_sec']
         self.pin_pir = self.settings.get('pins')['sensor_pir']
+        self.glitch_filter_us = self.settings.get('pins').get('glitch_filter_us', 5000)
+        self.source = self.settings.get('motion_detection', {}).get('source', self.SOURCE_PIR)
 
         self.initialized = False
         self.warmed_up = False
         self.started = False
         self.cleaned_up = False
         self.looping = False
-        self.capturing_image = False
+
+        self.gpio_backend = gpio_backend
+        self.pi = None
+        self.pir_callback = None
+        self.edges = queue.Queue()
+        self.levels = {}
+        self.last_detection_latency_s = None
 
         self.pir_state = self.LOW
         self.curr_val = self.LOW
 
+        self.camera_service = None
+        self.motion_detector = None
+
+        self.timings = {}
+        self.init_time = None
+
+    def _load_gpio_backend(self):
+        """Loads the GPIO backend
+
+        :return: The backend
+        """
+        name = self.settings.get('gpio', {}).get('backend', 'pigpio')
+        b_info = self._GPIO_BACKEND_INFO.get(name)
+        if not b_info:
+            logging.error('Unknown GPIO backend "{}", falling back to "pigpio"'.format(name))
+            b_info = self._GPIO_BACKEND_INFO['pigpio']
+        logging.info('Loading GPIO backend "{}"'.format(b_info['name']))
+        _module = __import__(b_info['fullpackage'], globals(), locals(), [b_info['name']], 0)
+        return getattr(_module, b_info['name'])(self.settings)
+
     def init(self):
-        """Manual initialization because of the sleep"""
+        """Manual initialization, starts the GPIO backend"""
         if self.initialized:
             logging.info('Already initialized')
             return
 
         logging.info('Initializing')
 
-        self.pi = pigpio.pi()
-        if not self.pi.connected:
-            logging.error('GPIO (pigpio) not connected')
+        self.init_time = time.time()
+        self.timings = {}
+
+        if not self.gpio_backend:
+            self.gpio_backend = self._load_gpio_backend()
+        self.pi = self.gpio_backend.start()
+        for name, value in self.gpio_backend.get_timings().items():
+            self.timings['gpio_{}'.format(name)] = value
+        if not self.pi:
             return
 
         self.cleaned_up = False
         self.initialized = True
 
+    def _get_uptime(self):
+        """Returns the system uptime
+
+        :return: The system uptime (in s) or None if unknown
+        """
+        try:
+            with open(self._FILE_UPTIME, 'r') as f:
+                return float(f.read().split()[0])
+        except Exception:
+            return None
+
     def warmup(self):
         """Warms up the sensors"""
         if not self.initialized:
@@ -92,9 +148,16 @@ class Sensors:
             logging.info('Already warmed up')
             return
 
-        logging.info('Warming up for {}s...'.format(
-            self.time_sleep_warmup_s))
-        time.sleep(self.time_sleep_warmup_s)
+        # The PIR sensor is powered on with the Pi, only wait for what is left of its warmup time
+        t0 = time.time()
+        uptime = self._get_uptime()
+        remaining_s = self.time_sleep_warmup_s - (uptime if uptime is not None else (t0 - self.init_time))
+        if remaining_s > 0:
+            logging.info('Warming up for {:.1f}s...'.format(remaining_s))
+            time.sleep(remaining_s)
+        else:
+            logging.info('Sensors already warmed up (uptime {}s)'.format(uptime))
+        self.timings['warmup'] = time.time() - t0
         self.warmed_up = True
 
     def start(self):
@@ -112,11 +175,44 @@ class Sensors:
             return
 
         logging.info('Starting')
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin_pir, GPIO.IN)
+        t0 = time.time()
+
+        if self.source in [self.SOURCE_PIR, self.SOURCE_BOTH]:
+            logging.info('Registering PIR edge callback [pin={}, glitch_filter={}us]'.format(
+                self.pin_pir, self.glitch_filter_us))
+            self.pi.set_mode(self.pin_pir, GpioBackend.INPUT)
+            self.pi.set_glitch_filter(self.pin_pir, self.glitch_filter_us)
+            self.pir_callback = self.pi.callback(self.pin_pir, GpioBackend.EITHER_EDGE, self._cb_pir_edge)
+            if self.pi.read(self.pin_pir) == self.HIGH:
+                self._push_edge(self.SOURCE_PIR, self.HIGH)
+
+        logging.info('Starting camera service')
+        self.camera_service = CameraService(self.settings)
+        if self.source in [self.SOURCE_CAMERA, self.SOURCE_BOTH]:
+            self._load_motion_detector()
+        self.camera_service.start()
+
+        self.timings['start'] = time.time() - t0
+        self.timings['time_to_armed'] = time.time() - self.init_time
+        logging.info('Sensors armed: {}'.format(
+            ', '.join('{}={:.3f}s'.format(k, v) for k, v in self.timings.items())))
+
         self.started = True
 
+    def get_timings(self):
+        """Returns the startup timing breakdown
+
+        :return: Dict with the startup stages and their duration (in s)
+        """
+        return dict(self.timings)
+
+    def get_capture_stats(self):
+        """Returns the capture job counters of the camera service
+
+        :return: Dict with the camera service stats, empty if not started
+        """
+        return self.camera_service.get_stats() if self.camera_service else {}
+
     def cleanup(self):
         """Cleans up the system"""
         if self.cleaned_up:
@@ -124,16 +220,29 @@ class Sensors:
             return
 
         logging.info('Cleaning up')
-        GPIO.cleanup()
-        self.pi.stop()
-        system('sudo killall pigpiod')
+        if self.camera_service:
+            self.camera_service.stop()
+            self.camera_service = None
+        self.motion_detector = None
+        if self.pir_callback:
+            self.pir_callback.cancel()
+            self.pir_callback = None
+        self.flush_events()
+        self.levels = {}
+        self.pir_state = self.LOW
+        if self.gpio_backend:
+            self.gpio_backend.stop()
+        self.pi = None
         self.cleaned_up = True
         self.warmed_up = False
         self.started = False
         self.initialized = False
 
-    def tick(self):
-        """Tick (single loop), reads sensor data"""
+    def tick(self, timeout=None):
+        """Tick (single loop), waits for sensor edges and processes them
+
+        :param timeout: Max time to wait for an edge (in s), does not wait if not set
+        """
         if not self.initialized:
             logging.error('Not initialized')
             return
@@ -152,163 +261,108 @@ class Sensors:
 
         self.looping = True
         try:
-            self.curr_val = self.pi.read(self.pin_pir)
-            if self.curr_val == self.HIGH:
-                if self.pir_state == self.LOW:
-                    self.pir_state = self.HIGH
-                    if self.cb_motion_detected:
-                        self.cb_motion_detected()
-            else:
-                if self.pir_state == self.HIGH:
-                    self.pir_state = self.LOW
-                    if self.cb_motion_ended:
-                        self.cb_motion_ended()
+            try:
+                edge = self.edges.get(timeout=timeout) if timeout else self.edges.get_nowait()
+            except queue.Empty:
+                return
+            while edge:
+                self._process_edge(edge)
+                try:
+                    edge = self.edges.get_nowait()
+                except queue.Empty:
+                    edge = None
         finally:
             self.looping = False
 
-    def _cb_img_captured(self):
-        self.capturing_image = False
+    def flush_events(self):
+        """Discards queued edges (e.g. after not reading sensor data for a while), only keeps the current levels"""
+        try:
+            while True:
+                _, source, level = self.edges.get_nowait()
+                self.levels[source] = level
+        except queue.Empty:
+            pass
+        self.pir_state = self.HIGH if self.HIGH in self.levels.values() else self.LOW
+
+    def _push_edge(self, source, level):
+        """Pushes a timestamped edge into the queue
+
+        :param source: The source (SOURCE_PIR or SOURCE_CAMERA)
+        :param level: The new level
+        """
+        self.edges.put((time.time(), source, level))
+
+    def _cb_pir_edge(self, gpio, level, tick):
+        """pigpio edge callback
+
+        :param gpio: The GPIO pin
+        :param level: The new level, 2 on watchdog timeout
+        :param tick: The pigpio tick
+        """
+        if level in [self.LOW, self.HIGH]:
+            self._push_edge(self.SOURCE_PIR, level)
+
+    def _process_edge(self, edge):
+        """Processes a single edge
+
+        :param edge: Tuple (timestamp, source, level)
+        """
+        timestamp, source, level = edge
+        self.levels[source] = level
+        self.curr_val = self.HIGH if self.HIGH in self.levels.values() else self.LOW
+        if self.curr_val == self.HIGH:
+            if self.pir_state == self.LOW:
+                self.pir_state = self.HIGH
+                self.last_detection_latency_s = time.time() - timestamp
+                logging.debug('Motion edge from "{}" processed after {:.1f}ms'.format(
+                    source, self.last_detection_latency_s * 1000))
+                if self.cb_motion_detected:
+                    self.cb_motion_detected()
+        else:
+            if self.pir_state == self.HIGH:
+                self.pir_state = self.LOW
+                if self.cb_motion_ended:
+                    self.cb_motion_ended()
+
+    def _load_motion_detector(self):
+        """Loads the software motion detector and feeds it with frames from the camera service"""
+        logging.info('Loading camera motion detector')
+        try:
+            _detector = __import__('tools.camera.MotionDetector', globals(), locals(), ['MotionDetector'], 0)
+        except ImportError as e:
+            logging.error('Failed to load camera motion detector: "{}"'.format(e))
+            return
+        self.motion_detector = _detector.MotionDetector(self.settings,
+                                                        cb_motion_detected=self._cb_camera_motion_detected,
+                                                        cb_motion_ended=self._cb_camera_motion_ended)
+        self.camera_service.set_analysis(self.motion_detector.process_buffer,
+                                         self.motion_detector.res_width,
+                                         self.motion_detector.res_height)
+
+    def _cb_camera_motion_detected(self):
+        self._push_edge(self.SOURCE_CAMERA, self.HIGH)
+
+    def _cb_camera_motion_ended(self):
+        self._push_edge(self.SOURCE_CAMERA, self.LOW)
 
     def capture_camera_image(self, cb):
-        """Captures a camera image
+        """Captures a camera image. Requests during an in-flight capture get merged or queued.
 
         :param cb: Callback
+        :return: CameraService.SUBMIT_QUEUED, SUBMIT_MERGED or SUBMIT_DROPPED, None if not started
         """
-        if self.capturing_image:
-            logging.debug('Image capturing from camera already in progress')
-            return
+        if not self.camera_service:
+            logging.error('Camera service not started')
+            return None
 
         logging.debug('Capturing image from camera')
-        self.capturing_image = True
 
         curr_datetime = '{:%Y-%m-%d-%H-%M-%S}'.format(datetime.datetime.now())
         folder_name = '{}/rs-{}'.format(self.settings.get('local_sync_folder_name'), curr_datetime)
-        c_thread = CameraCaptureThread(id=1,
-                                       name='CameraCaptureThread-{}'.format(
-                                           curr_datetime),
-                                       nr_imgs=self.settings.get('image')['nr_to_take'],
-                                       res_width=self.settings.get('camera')['resolution_width'],
-                                       res_height=self.settings.get('camera')['resolution_height'],
-                                       deg_rot=self.settings.get('camera')['rotation_degrees'],
-                                       folder_name=folder_name,
-                                       video_active=self.settings.get('video')['active'],
-                                       video_s=self.settings.get('video')['seconds'],
-                                       time_sleep_warmup_s=self.settings.get('sleep')['camera_warmup_sec'],
-                                       time_sleep_betweenimages_s=self.settings.get('sleep')['between_images_sec'],
-                                       cb_img_captured=cb,
-                                       cb_img_captured_internal=self._cb_img_captured)
-        c_thread.start()
-
-
-class CameraCaptureThread(threading.Thread):
-
-    def __init__(self,
-                    id,
-                    name,
-                    nr_imgs,
-                    res_width,
-                    res_height,
-                    deg_rot,
-                    folder_name,
-                    video_active=False,
-                    video_s=3,
-                    time_sleep_warmup_s=2,
-                    time_sleep_betweenimages_s=0.5,
-                    cb_img_captured=None,
-                    cb_img_captured_internal=None):
-        """Initializes the thread
-
-        :param id: The ID
-        :param name: The name
-        :param nr_imgs: Number of images
-        :param res_width: Resolution width
-        :param res_height: Resolution height
-        :param deg_rot: Rotation (in degree)
-        :param folder_name: The folder name
-        :param video_active: Whether to take a video
-        :param video_s: Video length in seconds
-        :param time_sleep_warmup_s: The warmup sleep (in s)
-        :param time_sleep_betweenimages_s: Sleep time between taking images (in s)
-        :param cb_img_captured: Callback on image captured
-        :param cb_img_captured_internal: Callback on image captured (internal)
-        """
-        threading.Thread.__init__(self)
-
-        self.id = id
-        self.name = name
-        self.nr_imgs = nr_imgs
-        self.res_width = res_width
-        self.res_height = res_height
-        self.deg_rot = deg_rot
-        self.folder_name = folder_name
-        self.video_active = video_active
-        self.video_s = video_s
-        self.time_sleep_warmup_s = time_sleep_warmup_s
-        self.time_sleep_betweenimages_s = time_sleep_betweenimages_s
-        self.cb_img_captured = cb_img_captured
-        self.cb_img_captured_internal = cb_img_captured_internal
-
-    def _asserting_folder(self, fname):
-        """Creates the folder to capture the images into
-
-        :param fname: The folder name
-        """
-        logging.debug('Asserting folder "{}"'.format(fname))
-
-        if not os.path.exists(fname):
-            os.makedirs(fname)
-
-    def run(self):
-        """Runs the thread"""
-        logging.debug('Starting thread [id="{}", name="{}"]'.format(
-            self.id, self.name))
-        try:
-            with PiCamera() as camera:
-                logging.debug('Camera image data [res_width={}, res_height={}, deg_rot={}]'.format(
-                    self.res_width, self.res_height, self.deg_rot))
-                camera.resolution = (self.res_width, self.res_height)
-                camera.rotation = self.deg_rot
-                camera.start_preview()
-                logging.debug('Warming up camera for {}s'.format(self.time_sleep_warmup_s))
-                time.sleep(self.time_sleep_warmup_s)
-                self._asserting_folder(self.folder_name)
-                logging.debug('Taking {} images'.format(self.nr_imgs))
-                take_two_img_parts = self.video_active and (self.nr_imgs >= 2)
-                images_taken = 0
-                # First half of the images
-                for _ in range(0, int(self.nr_imgs / 2) if take_two_img_parts else self.nr_imgs):
-                    images_taken = images_taken + 1
-                    iname = '{}/rs-{}.jpg'.format(self.folder_name, images_taken)
-                    logging.debug('Capturing image #{}: "{}"'.format(images_taken, iname))
-                    camera.capture(iname)
-                    time.sleep(self.time_sleep_betweenimages_s)
-                if self.video_active:
-                    # Take video
-                    iname = '{}/rs-video.h264'.format(self.folder_name)
-                    try:
-                        logging.debug('Capturing video: "{}"'.format(iname))
-                        camera.start_recording(iname)
-                        camera.wait_recording(self.video_s)
-                        camera.stop_recording()
-                        oname = '{}/rs-video.mp4'.format(self.folder_name)
-                        retcode = call(["MP4Box", "-add", iname, oname])
-                        if retcode != 0:
-                            logging.error('Failed to convert video "{}" to "{}"'.format(oname))
-                    except Exception as e:
-                        logging.error('Failed to capture video "{}"'.format(iname))
-                    if take_two_img_parts:
-                        # Second half of the images
-                        for _ in range(0, self.nr_imgs  - images_taken):
-                            images_taken = images_taken + 1
-                            iname = '{}/rs-{}.jpg'.format(self.folder_name, images_taken)
-                            logging.debug('Capturing image #{}: "{}"'.format(images_taken, iname))
-                            camera.capture(iname)
-                            time.sleep(self.time_sleep_betweenimages_s)
-                camera.stop_preview()
-        finally:
-            logging.debug(
-                'Done capturing images in folder "{}"'.format(self.folder_name))
-            if self.cb_img_captured_internal:
-                self.cb_img_captured_internal()
-            if self.cb_img_captured:
-                self.cb_img_captured()
+        job = CaptureJob(folder_name=folder_name,
+                         nr_imgs=self.settings.get('image')['nr_to_take'],
+                         video_active=self.settings.get('video')['active'],
+                         video_s=self.settings.get('video')['seconds'],
+                         time_sleep_betweenimages_s=self.settings.get('sleep')['between_images_sec'],
+                         callbacks=[cb])
+        return self.camera_service.submit(job)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A persistent journal of the per-file, per-Sender upload states (SQLite)"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+
+class UploadJournal:
+    """Keeps the upload states in memory and writes them to disk in batches.
+
+    Records are queued and written in a single transaction every sync::journal_flush_sec
+    or as soon as sync::journal_batch_size records are queued.
+    """
+
+    STATE_PENDING = 'pending'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+
+    _SQL_CREATE = '''CREATE TABLE IF NOT EXISTS uploads (
+        fullname TEXT NOT NULL,
+        sender TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated REAL NOT NULL,
+        PRIMARY KEY (fullname, sender))'''
+    _SQL_UPSERT = 'INSERT OR REPLACE INTO uploads (fullname, sender, state, updated) VALUES (?, ?, ?, ?)'
+    _SQL_DELETE = 'DELETE FROM uploads WHERE fullname = ?'
+    _SQL_SELECT = 'SELECT fullname, sender, state FROM uploads'
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        self.settings = settings
+
+        sync_settings = self.settings.get('sync', {})
+        self.filename = sync_settings.get('journal_file', 'upload-journal.sqlite')
+        self.flush_s = sync_settings.get('journal_flush_sec', 1)
+        self.batch_size = sync_settings.get('journal_batch_size', 100)
+
+        self.connection = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_requested = threading.Event()
+        self.writer = None
+        self.opened = False
+
+        # Full file name -> Dict sender name -> state
+        self.states = {}
+        # Queued records (fullname, sender, state, time), sender and state are None to delete a file
+        self.records = []
+
+        self.nr_records = 0
+        self.nr_flushes = 0
+        self.flush_s_total = 0
+
+    def open(self):
+        """Opens the journal, loads the states and drops the states of files that do not exist any more
+
+        :return: True if successfully opened, False else
+        """
+        if self.opened:
+            return True
+
+        logging.info('Opening upload journal "{}"'.format(self.filename))
+        try:
+            self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(self._SQL_CREATE)
+            for fullname, sender, state in self.connection.execute(self._SQL_SELECT):
+                self.states.setdefault(fullname, {})[sender] = state
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logging.error('Failed to open upload journal "{}": "{}"'.format(self.filename, e))
+            self.connection = None
+            return False
+
+        for fullname in [fullname for fullname in self.states if not os.path.isfile(fullname)]:
+            self.forget(fullname)
+        logging.info('Upload journal: {} file(s), {} unfinished'.format(
+            len(self.states), len(self.get_unfinished())))
+
+        self.opened = True
+        self.writer = threading.Thread(target=self._write, name='UploadJournal', daemon=True)
+        self.writer.start()
+        return True
+
+    def close(self):
+        """Writes all queued records and closes the journal"""
+        if not self.opened:
+            return
+        self.opened = False
+        self.flush_requested.set()
+        self.writer.join()
+        self.writer = None
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+    def record(self, fullname, sender, state):
+        """Records the upload state of a file for a Sender
+
+        :param fullname: The full file name
+        :param sender: The Sender name
+        :param state: STATE_PENDING, STATE_DONE or STATE_FAILED
+        """
+        with self.lock:
+            self.states.setdefault(fullname, {})[sender] = state
+            self._queue((fullname, sender, state, time.time()))
+
+    def forget(self, fullname):
+        """Removes all states of a file, e.g. after it has been deleted
+
+        :param fullname: The full file name
+        """
+        with self.lock:
+            if self.states.pop(fullname, None) is not None:
+                self._queue((fullname, None, None, time.time()))
+
+    def _queue(self, record):
+        """Queues a record. Call with the lock held.
+
+        :param record: The record
+        """
+        self.records.append(record)
+        self.nr_records = self.nr_records + 1
+        if len(self.records) >= self.batch_size:
+            self.flush_requested.set()
+
+    def get_states(self, fullname):
+        """Returns the upload states of a file
+
+        :param fullname: The full file name
+        :return: Dict sender name -> state
+        """
+        with self.lock:
+            return dict(self.states.get(fullname, {}))
+
+    def get_unfinished(self, senders=None):
+        """Returns the files not yet uploaded to all of their Senders
+
+        :param senders: Only consider the states of these Sender names, all if not set
+        :return: List of full file names
+        """
+        with self.lock:
+            return [fullname for fullname, states in self.states.items()
+                    if any(state != self.STATE_DONE for sender, state in states.items()
+                           if senders is None or sender in senders)]
+
+    def get_stats(self):
+        """Returns the journal counters
+
+        :return: Dict with the number of files, queued records, records and flushes and the mean flush time
+        """
+        with self.lock:
+            return {
+                'nr_files': len(self.states),
+                'nr_records_queued': len(self.records),
+                'nr_records': self.nr_records,
+                'nr_flushes': self.nr_flushes,
+                'flush_s_mean': (self.flush_s_total / self.nr_flushes) if self.nr_flushes else 0
+            }
+
+    def flush(self):
+        """Writes the queued records in a single transaction"""
+        with self.flush_lock:
+            with self.lock:
+                records = self.records
+                self.records = []
+            if not records or not self.connection:
+                return
+            t0 = time.time()
+            try:
+                with self.connection:
+                    for fullname, sender, state, updated in records:
+                        if sender is None:
+                            self.connection.execute(self._SQL_DELETE, (fullname,))
+                        else:
+                            self.connection.execute(self._SQL_UPSERT, (fullname, sender, state, updated))
+            except sqlite3.Error as e:
+                logging.error('Failed to write {} record(s) to the upload journal: "{}"'.format(len(records), e))
+                return
+            with self.lock:
+                self.nr_flushes = self.nr_flushes + 1
+                self.flush_s_total = self.flush_s_total + (time.time() - t0)
+
+    def _write(self):
+        """Runs the writer, flushes periodically or when a batch is full"""
+        while self.opened:
+            self.flush_requested.wait(self.flush_s)
+            self.flush_requested.clear()
+            self.flush()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""An abstract camera backend"""
+
+from abc import ABC, abstractmethod
+
+
+class CameraBackend(ABC):
+    """Camera backends are selected via the setting camera::backend, see CameraService::_BACKEND_INFO"""
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        super().__init__()
+
+        self.settings = settings
+        self.opened = False
+
+    def is_opened(self):
+        """Returns a boolean flag whether the camera is opened
+
+        :return: Boolean flag whether the camera is opened
+        """
+        return self.opened
+
+    @abstractmethod
+    def open(self, res_width, res_height, deg_rot, framerate=30):
+        """Opens the camera and starts the preview (exposure, white balance)
+
+        :param res_width: Resolution width
+        :param res_height: Resolution height
+        :param deg_rot: Rotation (in degree)
+        :param framerate: The framerate
+        :return: Boolean flag whether the camera has been opened
+        """
+        return False
+
+    @abstractmethod
+    def close(self):
+        """Stops the preview and closes the camera"""
+        self.opened = False
+
+    @abstractmethod
+    def capture_image(self, filename, use_video_port=False):
+        """Captures a still image
+
+        :param filename: The file name
+        :param use_video_port: Whether to capture from the video port (while recording)
+        """
+        pass
+
+    @abstractmethod
+    def capture_burst(self, filenames, fps, cb_captured=None):
+        """Captures a burst of JPEG stills from the video port, can run concurrently with a recording
+
+        :param filenames: The file names, one image per file name
+        :param fps: Number of images per second
+        :param cb_captured: Called with the file name after every image is written
+        """
+        pass
+
+    @abstractmethod
+    def start_recording(self, output):
+        """Starts recording a H.264 video
+
+        :param output: The file name or a file-like object
+        """
+        pass
+
+    @abstractmethod
+    def wait_recording(self, seconds):
+        """Waits while recording
+
+        :param seconds: Seconds to wait
+        """
+        pass
+
+    @abstractmethod
+    def stop_recording(self):
+        """Stops recording"""
+        pass
+
+    @abstractmethod
+    def start_ring_recording(self, size_bytes, bitrate):
+        """Starts continuously recording H.264 video into an in-memory ring buffer
+
+        :param size_bytes: Maximum size of the ring buffer (in bytes)
+        :param bitrate: The bitrate (in bits per second)
+        """
+        pass
+
+    @abstractmethod
+    def save_ring(self, output, seconds):
+        """Writes the last seconds of the ring buffer to a file, starting at a keyframe
+
+        :param output: The file name or a file-like object
+        :param seconds: Number of seconds to write
+        """
+        pass
+
+    @abstractmethod
+    def stop_ring_recording(self):
+        """Stops recording into the ring buffer"""
+        pass
+
+    @abstractmethod
+    def start_analysis(self, callback, res_width, res_height):
+        """Starts delivering downscaled grayscale frames (Y plane) for analysis
+
+        :param callback: Called with the arguments (buffer, row stride) for every frame
+        :param res_width: Resolution width of the analysis frames
+        :param res_height: Resolution height of the analysis frames
+        """
+        pass
+
+    @abstractmethod
+    def stop_analysis(self):
+        """Stops delivering frames for analysis"""
+        pass
@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A long-lived camera service - keeps the camera open and warm and processes capture jobs from a queue"""
+
+import os
+import time
+import queue
+import logging
+import threading
+import contextlib
+
+from tools.camera.Mp4Muxer import Mp4Muxer
+
+
+class CaptureJob:
+
+    def __init__(self,
+                 folder_name,
+                 nr_imgs,
+                 video_active=False,
+                 video_s=3,
+                 time_sleep_betweenimages_s=0.5,
+                 callbacks=[]):
+        """Initialization
+
+        :param folder_name: The folder name
+        :param nr_imgs: Number of images
+        :param video_active: Whether to take a video
+        :param video_s: Video length in seconds
+        :param time_sleep_betweenimages_s: Sleep time between taking images (in s)
+        :param callbacks: List of callbacks, called when the job is done
+        """
+        self.folder_name = folder_name
+        self.nr_imgs = nr_imgs
+        self.video_active = video_active
+        self.video_s = video_s
+        self.time_sleep_betweenimages_s = time_sleep_betweenimages_s
+        self.callbacks = list(callbacks)
+
+        self.created_time = time.time()
+        self.timings = {}
+
+        # Capture window, set and extended by the CameraService
+        self.window_end = self.created_time
+        self.extendable = False
+        self.nr_merged = 0
+
+
+class CameraService(threading.Thread):
+    """Initialize as follows:
+
+    0. Constructor
+    1. Call start, the camera gets opened and warmed up once
+    2. Call submit for every capture job
+    3. Call stop
+
+    Submitted jobs overlapping the capture window of the running or the pending job
+    get merged into it (extending its window), others get queued or - if the queue is full - dropped.
+    """
+
+    SUBMIT_QUEUED = 'queued'
+    SUBMIT_MERGED = 'merged'
+    SUBMIT_DROPPED = 'dropped'
+
+    _BACKEND_INFO = {
+        'picamera': {
+            'fullpackage': 'tools.camera.PiCameraBackend',
+            'name': 'PiCameraBackend'
+        },
+        'fake': {
+            'fullpackage': 'tools.camera.FakeCameraBackend',
+            'name': 'FakeCameraBackend'
+        }
+    }
+
+    _QUEUE_POLL_S = 1
+
+    def __init__(self, settings, backend=None):
+        """Initialization
+
+        :param settings: The settings
+        :param backend: The camera backend. If not set, the backend is loaded from the setting camera::backend
+        """
+        threading.Thread.__init__(self, name='CameraService', daemon=True)
+
+        self.settings = settings
+
+        self.res_width = self.settings.get('camera')['resolution_width']
+        self.res_height = self.settings.get('camera')['resolution_height']
+        self.deg_rot = self.settings.get('camera')['rotation_degrees']
+        self.framerate = self.settings.get('camera').get('framerate', 30)
+        self.time_sleep_warmup_s = self.settings.get('sleep')['camera_warmup_sec']
+
+        image_settings = self.settings.get('image')
+        self.burst_active = image_settings.get('burst_active', False)
+        self.burst_fps = image_settings.get('burst_fps', 10)
+
+        video_settings = self.settings.get('video')
+        self.ring_buffer_active = video_settings.get('ring_buffer_active', False)
+        self.ring_buffer_size_bytes = int(video_settings.get('ring_buffer_mb', 8) * 1024 * 1024)
+        self.video_bitrate = video_settings.get('bitrate', 4000000)
+        self.pre_roll_s = video_settings.get('pre_roll_sec', 5)
+        self.post_roll_s = video_settings.get('post_roll_sec', 5)
+
+        self.backend = backend if backend else self._load_backend(self.settings.get('camera').get('backend', 'picamera'))
+
+        self.max_window_s = self.settings.get('camera').get('max_capture_window_sec', 60)
+        self.max_queued_jobs = self.settings.get('camera').get('max_queued_jobs', 2)
+
+        self.analysis_callback = None
+        self.analysis_res = None
+
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.current_job = None
+        self.pending_job = None
+        self.nr_jobs_queued = 0
+        self.nr_jobs_merged = 0
+        self.nr_jobs_dropped = 0
+        self.ready = threading.Event()
+        self.stopped = False
+
+        self.timings = {}
+        self.last_job_timings = {}
+        self.nr_jobs_done = 0
+
+    def _load_backend(self, name):
+        """Loads the camera backend
+
+        :param name: The backend name
+        :return: The backend
+        """
+        b_info = self._BACKEND_INFO.get(name)
+        if not b_info:
+            logging.error('Unknown camera backend "{}", falling back to "picamera"'.format(name))
+            b_info = self._BACKEND_INFO['picamera']
+        logging.info('Loading camera backend "{}"'.format(b_info['name']))
+        _module = __import__(b_info['fullpackage'], globals(), locals(), [b_info['name']], 0)
+        return getattr(_module, b_info['name'])(self.settings)
+
+    @contextlib.contextmanager
+    def _stopwatch(self, timings, name):
+        """Context manager to store how long a block of code took
+
+        :param timings: The timings dict
+        :param name: The name of the watched stage
+        """
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            timings[name] = time.time() - t0
+
+    def _asserting_folder(self, fname):
+        """Creates the folder to capture the images into
+
+        :param fname: The folder name
+        """
+        logging.debug('Asserting folder "{}"'.format(fname))
+
+        if not os.path.exists(fname):
+            os.makedirs(fname)
+
+    def _open_camera(self):
+        """Opens and warms up the camera
+
+        :return: Boolean flag whether the camera is opened
+        """
+        with self._stopwatch(self.timings, 'open'):
+            if not self.backend.open(self.res_width, self.res_height, self.deg_rot, self.framerate):
+                logging.error('Could not open camera')
+                return False
+        with self._stopwatch(self.timings, 'warmup'):
+            logging.debug('Warming up camera for {}s'.format(self.time_sleep_warmup_s))
+            time.sleep(self.time_sleep_warmup_s)
+        if self.ring_buffer_active:
+            self._start_ring_recording()
+        if self.analysis_callback:
+            logging.info('Starting frame analysis [{}x{}]'.format(*self.analysis_res))
+            self.backend.start_analysis(self.analysis_callback, *self.analysis_res)
+        logging.info('Camera ready [open={:.3f}s, warmup={:.3f}s]'.format(
+            self.timings['open'], self.timings['warmup']))
+        return True
+
+    def _start_ring_recording(self):
+        """Starts continuously recording into the ring buffer"""
+        max_ring_s = self.ring_buffer_size_bytes * 8.0 / self.video_bitrate
+        logging.info('Starting ring buffer recording [size={}B, bitrate={}bps, ~{:.1f}s]'.format(
+            self.ring_buffer_size_bytes, self.video_bitrate, max_ring_s))
+        if self.pre_roll_s + self.post_roll_s > max_ring_s:
+            logging.warning('Ring buffer holds only ~{:.1f}s, pre-roll ({}s) + post-roll ({}s) will be truncated'.format(
+                max_ring_s, self.pre_roll_s, self.post_roll_s))
+        self.backend.start_ring_recording(self.ring_buffer_size_bytes, self.video_bitrate)
+
+    def set_analysis(self, callback, res_width, res_height):
+        """Sets a callback for downscaled grayscale frames, has to be set before start
+
+        :param callback: Called with the arguments (buffer, row stride) for every frame
+        :param res_width: Resolution width of the analysis frames
+        :param res_height: Resolution height of the analysis frames
+        """
+        self.analysis_callback = callback
+        self.analysis_res = (res_width, res_height)
+
+    def _get_window_s(self, job):
+        """Returns the length of the capture window of a job
+
+        :param job: The capture job
+        :return: The length of the capture window (in s)
+        """
+        return self.post_roll_s if self.ring_buffer_active else job.video_s
+
+    def submit(self, job):
+        """Submits a capture job
+
+        :param job: The capture job
+        :return: SUBMIT_QUEUED, SUBMIT_MERGED or SUBMIT_DROPPED
+        """
+        job.window_end = job.created_time + self._get_window_s(job)
+        job.extendable = job.video_active
+        with self.lock:
+            for target in [self.current_job, self.pending_job]:
+                if not target or not target.extendable or not job.video_active:
+                    continue
+                if job.created_time <= target.window_end and job.window_end <= target.created_time + self.max_window_s:
+                    target.window_end = max(target.window_end, job.window_end)
+                    target.callbacks.extend(job.callbacks)
+                    target.nr_merged = target.nr_merged + 1
+                    self.nr_jobs_merged = self.nr_jobs_merged + 1
+                    logging.info('Merged capture job into "{}", capture window extended by {:.1f}s'.format(
+                        target.folder_name, target.window_end - job.created_time))
+                    return self.SUBMIT_MERGED
+            if self.jobs.qsize() >= self.max_queued_jobs:
+                self.nr_jobs_dropped = self.nr_jobs_dropped + 1
+                logging.warning('Capture queue full ({} jobs), dropping capture job for folder "{}"'.format(
+                    self.jobs.qsize(), job.folder_name))
+                return self.SUBMIT_DROPPED
+            logging.debug('Queueing capture job for folder "{}"'.format(job.folder_name))
+            self.pending_job = job
+            self.nr_jobs_queued = self.nr_jobs_queued + 1
+            self.jobs.put(job)
+            return self.SUBMIT_QUEUED
+
+    def is_ready(self):
+        """Returns a boolean flag whether the camera is opened and warmed up
+
+        :return: Boolean flag whether the camera is opened and warmed up
+        """
+        return self.ready.is_set()
+
+    def get_stats(self):
+        """Returns the service statistics
+
+        :return: Dict with startup timings, timings of the last job and the job counters
+        """
+        return {
+            'ready': self.is_ready(),
+            'startup_timings': dict(self.timings),
+            'last_job_timings': dict(self.last_job_timings),
+            'nr_jobs_done': self.nr_jobs_done,
+            'nr_jobs_waiting': self.jobs.qsize(),
+            'nr_jobs_queued': self.nr_jobs_queued,
+            'nr_jobs_merged': self.nr_jobs_merged,
+            'nr_jobs_dropped': self.nr_jobs_dropped
+        }
+
+    def stop(self):
+        """Stops the service, the camera gets closed after the current job"""
+        logging.info('Stopping camera service')
+        self.stopped = True
+        self.jobs.put(None)
+
+    def run(self):
+        """Runs the thread"""
+        logging.debug('Starting camera service')
+        try:
+            if self._open_camera():
+                self.ready.set()
+            while not self.stopped:
+                try:
+                    job = self.jobs.get(timeout=self._QUEUE_POLL_S)
+                except queue.Empty:
+                    continue
+                try:
+                    if job:
+                        with self.lock:
+                            if self.pending_job is job:
+                                self.pending_job = None
+                            self.current_job = job
+                        self._run_job(job)
+                finally:
+                    with self.lock:
+                        self.current_job = None
+                    self.jobs.task_done()
+        finally:
+            self.ready.clear()
+            self.backend.close()
+            logging.info('Camera service stopped')
+
+    def _run_job(self, job):
+        """Runs a capture job
+
+        :param job: The capture job
+        """
+        job.timings['queued'] = time.time() - job.created_time
+        t0 = time.time()
+        try:
+            if not self.backend.is_opened():
+                logging.info('Camera not opened, reopening')
+                if not self._open_camera():
+                    return
+                self.ready.set()
+            self._asserting_folder(job.folder_name)
+            if job.video_active and self.ring_buffer_active:
+                self._run_ring_job(job)
+            elif self.burst_active:
+                self._run_burst_job(job)
+            else:
+                self._run_default_job(job)
+        except Exception as e:
+            logging.error('Failed to capture in folder "{}": "{}"'.format(job.folder_name, e))
+        finally:
+            with self.lock:
+                job.extendable = False
+                callbacks = list(job.callbacks)
+            job.timings['total'] = time.time() - t0
+            self.last_job_timings = job.timings
+            self.nr_jobs_done = self.nr_jobs_done + 1
+            logging.info('Done capturing in folder "{}" ({} merged), timings: {}'.format(
+                job.folder_name, job.nr_merged, ', '.join('{}={:.3f}s'.format(k, v) for k, v in job.timings.items())))
+            for cb in callbacks:
+                if cb:
+                    cb()
+
+    def _run_default_job(self, job):
+        """Takes the images and - in between - the video
+
+        :param job: The capture job
+        """
+        logging.debug('Taking {} images'.format(job.nr_imgs))
+        take_two_img_parts = job.video_active and (job.nr_imgs >= 2)
+        images_taken = 0
+        # First half of the images
+        with self._stopwatch(job.timings, 'images'):
+            for _ in range(0, int(job.nr_imgs / 2) if take_two_img_parts else job.nr_imgs):
+                images_taken = images_taken + 1
+                self._capture_image(job, images_taken)
+        if job.video_active:
+            # Take video
+            oname = '{}/rs-video.mp4'.format(job.folder_name)
+            try:
+                with self._muxing(job, oname) as muxer:
+                    with self._stopwatch(job.timings, 'video'):
+                        logging.debug('Capturing video: "{}"'.format(oname))
+                        self.backend.start_recording(muxer)
+                        try:
+                            self._wait_window(job, time.time() + job.video_s)
+                        finally:
+                            self.backend.stop_recording()
+            except Exception as e:
+                logging.error('Failed to capture video "{}": "{}"'.format(oname, e))
+            if take_two_img_parts:
+                # Second half of the images
+                with self._stopwatch(job.timings, 'images_2'):
+                    for _ in range(0, job.nr_imgs - images_taken):
+                        images_taken = images_taken + 1
+                        self._capture_image(job, images_taken)
+
+    def _run_burst_job(self, job):
+        """Records the video and - concurrently - takes a burst of images from the video port
+
+        :param job: The capture job
+        """
+        if not job.video_active:
+            with self._stopwatch(job.timings, 'images'):
+                self._capture_burst(job)
+            return
+        oname = '{}/rs-video.mp4'.format(job.folder_name)
+        try:
+            with self._muxing(job, oname) as muxer:
+                with self._stopwatch(job.timings, 'video'):
+                    logging.debug('Capturing video: "{}"'.format(oname))
+                    rec_end = time.time() + job.video_s
+                    self.backend.start_recording(muxer)
+                    try:
+                        with self._stopwatch(job.timings, 'images'):
+                            self._capture_burst(job)
+                        self._wait_window(job, rec_end)
+                    finally:
+                        self.backend.stop_recording()
+        except Exception as e:
+            logging.error('Failed to capture video "{}": "{}"'.format(oname, e))
+
+    def _run_ring_job(self, job):
+        """Takes the images from the video port during the post-roll, then writes pre-roll and post-roll
+
+        :param job: The capture job
+        """
+        logging.debug('Taking {} images'.format(job.nr_imgs))
+        with self._stopwatch(job.timings, 'images'):
+            if self.burst_active:
+                self._capture_burst(job)
+            else:
+                for nr in range(1, job.nr_imgs + 1):
+                    self._capture_image(job, nr, use_video_port=True)
+        oname = '{}/rs-video.mp4'.format(job.folder_name)
+        try:
+            with self._stopwatch(job.timings, 'post_roll'):
+                self._wait_window(job, job.created_time + self.post_roll_s)
+            with self._muxing(job, oname) as muxer:
+                with self._stopwatch(job.timings, 'video'):
+                    seconds = self.pre_roll_s + (time.time() - job.created_time)
+                    logging.debug('Writing last {:.1f}s of the ring buffer: "{}"'.format(seconds, oname))
+                    self.backend.save_ring(muxer, seconds)
+        except Exception as e:
+            logging.error('Failed to capture video "{}": "{}"'.format(oname, e))
+
+    def _wait_window(self, job, end_time):
+        """Waits while recording until the end of the - possibly extended - capture window
+
+        :param job: The capture job
+        :param end_time: The end of the recording without extensions
+        """
+        while True:
+            with self.lock:
+                remaining_s = max(end_time, job.window_end) - time.time()
+                if remaining_s <= 0:
+                    job.extendable = False
+                    return
+            self.backend.wait_recording(remaining_s)
+
+    def _create_muxer(self, oname):
+        """Creates a muxer writing the H.264 stream straight into the final MP4 file
+
+        :param oname: The MP4 file name
+        :return: The muxer
+        """
+        return Mp4Muxer(oname, framerate=self.framerate, res_width=self.res_width, res_height=self.res_height)
+
+    @contextlib.contextmanager
+    def _muxing(self, job, oname):
+        """Context manager for a muxer, finishes the MP4 file on success, removes the partial file on error
+
+        :param job: The capture job
+        :param oname: The MP4 file name
+        """
+        muxer = self._create_muxer(oname)
+        try:
+            yield muxer
+            with self._stopwatch(job.timings, 'mux'):
+                muxer.close()
+        except Exception:
+            muxer.abort()
+            try:
+                os.remove(oname)
+            except OSError as e:
+                logging.error('Failed to remove partial video "{}": "{}"'.format(oname, e))
+            raise
+
+    def _capture_burst(self, job):
+        """Captures all images of a job as a burst from the video port
+
+        :param job: The capture job
+        """
+        inames = ['{}/rs-{}.jpg'.format(job.folder_name, nr) for nr in range(1, job.nr_imgs + 1)]
+        logging.debug('Capturing burst of {} images at {}fps'.format(len(inames), self.burst_fps))
+
+        def cb_captured(iname):
+            if iname == inames[0]:
+                job.timings['first_image'] = time.time() - job.created_time
+
+        self.backend.capture_burst(inames, self.burst_fps, cb_captured=cb_captured)
+
+    def _capture_image(self, job, nr, use_video_port=False):
+        """Captures a single image
+
+        :param job: The capture job
+        :param nr: The image number
+        :param use_video_port: Whether to capture from the video port
+        """
+        iname = '{}/rs-{}.jpg'.format(job.folder_name, nr)
+        logging.debug('Capturing image #{}: "{}"'.format(nr, iname))
+        self.backend.capture_image(iname, use_video_port=use_video_port)
+        if nr == 1:
+            job.timings['first_image'] = time.time() - job.created_time
+        time.sleep(job.time_sleep_betweenimages_s)
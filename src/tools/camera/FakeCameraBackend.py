@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A fake camera backend - writes placeholder files, for running without camera hardware"""
+
+import logging
+import time
+import threading
+import collections
+
+from tools.camera.CameraBackend import CameraBackend
+
+
+class FakeCameraBackend(CameraBackend):
+
+    # Minimal JPEG (SOI + EOI markers)
+    _FAKE_JPEG = b'\xff\xd8\xff\xd9'
+
+    _FAKE_FPS = 30
+    _FAKE_INTRA_PERIOD = 30
+    _FAKE_FRAME_SIZE = 2048
+
+    def __init__(self, settings, capture_delay_s=0.0):
+        """Initialization
+
+        :param settings: The settings
+        :param capture_delay_s: Simulated duration of a still capture (in s)
+        """
+        super().__init__(settings)
+
+        logging.info('Initializing fake camera backend')
+
+        self.capture_delay_s = capture_delay_s
+
+        self.res_width = 0
+        self.res_height = 0
+
+        self.recording_output = None
+        self.recording_close_output = False
+        self.ring = collections.deque()
+        self.ring_size_bytes = 0
+        self.ring_max_size_bytes = 0
+        self.lock = threading.Lock()
+        self.frame_thread = None
+        self.frame_size = self._FAKE_FRAME_SIZE
+        self.producing = False
+        self.analysis_thread = None
+        self.analysing = False
+        self.nr_images_captured = 0
+        self.nr_videos_recorded = 0
+
+    # @abstractmethod override
+    def open(self, res_width, res_height, deg_rot, framerate=30):
+        logging.debug('Opening fake camera [res_width={}, res_height={}, deg_rot={}, framerate={}]'.format(
+            res_width, res_height, deg_rot, framerate))
+        self.res_width = res_width
+        self.res_height = res_height
+        self.opened = True
+        return self.opened
+
+    # @abstractmethod override
+    def close(self):
+        self.stop_analysis()
+        self.stop_ring_recording()
+        self.stop_recording()
+        self.opened = False
+
+    # @abstractmethod override
+    def capture_image(self, filename, use_video_port=False):
+        time.sleep(self.capture_delay_s)
+        with open(filename, 'wb') as f:
+            f.write(self._FAKE_JPEG)
+        self.nr_images_captured = self.nr_images_captured + 1
+
+    # @abstractmethod override
+    def capture_burst(self, filenames, fps, cb_captured=None):
+        interval_s = 1.0 / fps if fps > 0 else 0
+        t_next = time.time()
+        for filename in filenames:
+            delay_s = t_next - time.time()
+            if delay_s > 0:
+                time.sleep(delay_s)
+            with open(filename, 'wb') as f:
+                f.write(self._FAKE_JPEG)
+            self.nr_images_captured = self.nr_images_captured + 1
+            if cb_captured:
+                cb_captured(filename)
+            t_next = t_next + interval_s
+
+    # @abstractmethod override
+    def start_recording(self, output):
+        if hasattr(output, 'write'):
+            self.recording_output = output
+            self.recording_close_output = False
+        else:
+            self.recording_output = open(output, 'wb')
+            self.recording_close_output = True
+        self._start_producing()
+
+    # @abstractmethod override
+    def wait_recording(self, seconds):
+        time.sleep(seconds)
+
+    # @abstractmethod override
+    def stop_recording(self):
+        if not self.recording_output:
+            return
+        if not self.ring_max_size_bytes:
+            self._stop_producing()
+        with self.lock:
+            if self.recording_close_output:
+                self.recording_output.close()
+            self.recording_output = None
+        self.nr_videos_recorded = self.nr_videos_recorded + 1
+
+    # @abstractmethod override
+    def start_ring_recording(self, size_bytes, bitrate):
+        self.ring_max_size_bytes = size_bytes
+        self.frame_size = max(16, int(bitrate / 8 / self._FAKE_FPS))
+        self._start_producing()
+
+    # @abstractmethod override
+    def save_ring(self, output, seconds):
+        since = time.time() - seconds
+        with self.lock:
+            frames = [(is_key, frame) for t, is_key, frame in self.ring if t >= since]
+        # Start at a keyframe
+        while frames and not frames[0][0]:
+            frames.pop(0)
+        close_output = not hasattr(output, 'write')
+        f = open(output, 'wb') if close_output else output
+        try:
+            for _, frame in frames:
+                f.write(frame)
+        finally:
+            if close_output:
+                f.close()
+
+    # @abstractmethod override
+    def stop_ring_recording(self):
+        if not self.ring_max_size_bytes:
+            return
+        self.ring_max_size_bytes = 0
+        if not self.recording_output:
+            self._stop_producing()
+        with self.lock:
+            self.ring.clear()
+            self.ring_size_bytes = 0
+
+    # @abstractmethod override
+    def start_analysis(self, callback, res_width, res_height):
+        self.analysing = True
+        self.analysis_thread = threading.Thread(target=self._produce_analysis_frames,
+                                                args=(callback, res_width, res_height),
+                                                name='FakeCameraAnalysis',
+                                                daemon=True)
+        self.analysis_thread.start()
+
+    # @abstractmethod override
+    def stop_analysis(self):
+        self.analysing = False
+        if self.analysis_thread:
+            self.analysis_thread.join()
+            self.analysis_thread = None
+
+    def _produce_analysis_frames(self, callback, res_width, res_height):
+        """Produces static gray frames for analysis until stopped
+
+        :param callback: The frame callback
+        :param res_width: Resolution width
+        :param res_height: Resolution height
+        """
+        frame = b'\x80' * (res_width * res_height)
+        while self.analysing:
+            callback(frame, res_width)
+            time.sleep(1.0 / self._FAKE_FPS)
+
+    def _start_producing(self):
+        """Starts the thread producing fake frames"""
+        if self.producing:
+            return
+        self.producing = True
+        self.frame_thread = threading.Thread(target=self._produce_frames, name='FakeCameraFrames', daemon=True)
+        self.frame_thread.start()
+
+    def _stop_producing(self):
+        """Stops the thread producing fake frames"""
+        self.producing = False
+        if self.frame_thread:
+            self.frame_thread.join()
+            self.frame_thread = None
+
+    def _produce_frames(self):
+        """Produces fake frames into the recording output and the ring buffer until stopped"""
+        for is_key, frame in generate_h264(self.res_width, self.res_height,
+                                           frame_size=self.frame_size, intra_period=self._FAKE_INTRA_PERIOD):
+            if not self.producing:
+                break
+            with self.lock:
+                if self.recording_output:
+                    self.recording_output.write(frame)
+                if self.ring_max_size_bytes:
+                    self.ring.append((time.time(), is_key, frame))
+                    self.ring_size_bytes = self.ring_size_bytes + len(frame)
+                    while self.ring_size_bytes > self.ring_max_size_bytes and self.ring:
+                        _, _, dropped = self.ring.popleft()
+                        self.ring_size_bytes = self.ring_size_bytes - len(dropped)
+            time.sleep(1.0 / self._FAKE_FPS)
+
+
+class _BitWriter:
+
+    def __init__(self):
+        self.bits = []
+
+    def u(self, n, value):
+        self.bits.extend((value >> (n - 1 - i)) & 1 for i in range(n))
+
+    def ue(self, value):
+        value = value + 1
+        n = value.bit_length()
+        self.u(n - 1, 0)
+        self.u(n, value)
+
+    def rbsp(self):
+        self.bits.append(1)
+        while len(self.bits) % 8:
+            self.bits.append(0)
+        data = bytes(int(''.join(str(b) for b in self.bits[i:i + 8]), 2) for i in range(0, len(self.bits), 8))
+        # Emulation prevention
+        out = bytearray()
+        zeros = 0
+        for byte in data:
+            if zeros >= 2 and byte <= 3:
+                out.append(3)
+                zeros = 0
+            out.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return bytes(out)
+
+
+def generate_h264(res_width, res_height, nr_frames=None, frame_size=2048, intra_period=30):
+    """Generates a fake, structurally valid H.264 Annex B stream (baseline SPS/PPS, IDR and P slices)
+
+    :param res_width: Resolution width
+    :param res_height: Resolution height
+    :param nr_frames: Number of frames, infinite if not set
+    :param frame_size: Size of a frame payload (in bytes)
+    :param intra_period: Number of frames between keyframes
+    :return: Generator of tuples (is_keyframe, frame bytes)
+    """
+    width_mbs = (max(16, res_width) + 15) // 16
+    height_mbs = (max(16, res_height) + 15) // 16
+    crop_right = (width_mbs * 16 - res_width) // 2 if res_width else 0
+    crop_bottom = (height_mbs * 16 - res_height) // 2 if res_height else 0
+
+    w = _BitWriter()
+    w.u(8, 66)  # profile_idc: baseline
+    w.u(8, 0)
+    w.u(8, 40)  # level_idc
+    w.ue(0)  # seq_parameter_set_id
+    w.ue(0)  # log2_max_frame_num_minus4
+    w.ue(2)  # pic_order_cnt_type
+    w.ue(1)  # max_num_ref_frames
+    w.u(1, 0)
+    w.ue(width_mbs - 1)
+    w.ue(height_mbs - 1)
+    w.u(1, 1)  # frame_mbs_only_flag
+    w.u(1, 1)  # direct_8x8_inference_flag
+    if crop_right or crop_bottom:
+        w.u(1, 1)
+        w.ue(0)
+        w.ue(crop_right)
+        w.ue(0)
+        w.ue(crop_bottom)
+    else:
+        w.u(1, 0)
+    w.u(1, 0)  # vui_parameters_present_flag
+    sps = b'\x67' + w.rbsp()
+    pps = b'\x68\xce\x38\x80'
+
+    start_code = b'\x00\x00\x00\x01'
+    payload = b'\xaa' * max(1, frame_size)
+    nr = 0
+    while nr_frames is None or nr < nr_frames:
+        if nr % intra_period == 0:
+            yield True, start_code + sps + start_code + pps + start_code + b'\x65\x88' + payload
+        else:
+            yield False, start_code + b'\x41\x9a' + payload
+        nr = nr + 1
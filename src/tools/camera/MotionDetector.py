@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""Software motion detection on downscaled grayscale camera frames"""
+
+import time
+import logging
+
+import numpy as np
+
+
+class MotionDetector:
+    """Frame differencing against a running-average background model.
+
+    A frame counts as motion if more than min_changed_area (fraction of all pixels) differ
+    by more than pixel_threshold from the background. Motion ends after frames_to_end quiet frames.
+    """
+
+    def __init__(self, settings, cb_motion_detected=None, cb_motion_ended=None):
+        """Initialization
+
+        :param settings: The settings
+        :param cb_motion_detected: On motion detected
+        :param cb_motion_ended: On motion ended
+        """
+        self.settings = settings
+        self.cb_motion_detected = cb_motion_detected
+        self.cb_motion_ended = cb_motion_ended
+
+        md_settings = self.settings.get('motion_detection')
+        self.res_width = md_settings.get('resolution_width', 320)
+        self.res_height = md_settings.get('resolution_height', 240)
+        self.fps = md_settings.get('fps', 10)
+        self.background_alpha = md_settings.get('background_alpha', 0.05)
+        self.pixel_threshold = md_settings.get('pixel_threshold', 25)
+        self.min_changed_area = md_settings.get('min_changed_area', 0.01)
+        self.frames_to_end = md_settings.get('frames_to_end', 10)
+
+        self.min_changed_pixels = max(1, int(self.min_changed_area * self.res_width * self.res_height))
+        self.min_frame_interval_s = 1.0 / self.fps if self.fps > 0 else 0
+
+        self.background = None
+        self.frame = np.empty((self.res_height, self.res_width), dtype=np.float32)
+        self.diff = np.empty((self.res_height, self.res_width), dtype=np.float32)
+
+        self.motion = False
+        self.quiet_frames = 0
+        self.last_frame_time = 0
+        self.last_changed_pixels = 0
+        self.nr_frames_processed = 0
+        self.nr_frames_skipped = 0
+
+    def reset(self):
+        """Resets the background model"""
+        self.background = None
+        self.motion = False
+        self.quiet_frames = 0
+
+    def process_buffer(self, buf, stride=None):
+        """Processes a raw frame buffer (Y plane of a YUV420 frame)
+
+        :param buf: The buffer
+        :param stride: Length of a row in the buffer, defaults to the width
+        :return: Boolean flag whether there is motion
+        """
+        curr_time = time.time()
+        if (curr_time - self.last_frame_time) < self.min_frame_interval_s:
+            self.nr_frames_skipped = self.nr_frames_skipped + 1
+            return self.motion
+        self.last_frame_time = curr_time
+
+        stride = stride if stride else self.res_width
+        frame = np.frombuffer(buf, dtype=np.uint8, count=stride * self.res_height)
+        return self.process(frame.reshape((self.res_height, stride))[:, :self.res_width])
+
+    def process(self, frame):
+        """Processes a grayscale frame
+
+        :param frame: The frame, 2D uint8 array. Larger frames get downscaled by striding.
+        :return: Boolean flag whether there is motion
+        """
+        if frame.shape != self.frame.shape:
+            step_y = max(1, frame.shape[0] // self.res_height)
+            step_x = max(1, frame.shape[1] // self.res_width)
+            frame = frame[::step_y, ::step_x][:self.res_height, :self.res_width]
+            if frame.shape != self.frame.shape:
+                logging.error('Frame of shape {} cannot be scaled to {}'.format(frame.shape, self.frame.shape))
+                return self.motion
+
+        self.nr_frames_processed = self.nr_frames_processed + 1
+        np.copyto(self.frame, frame)
+
+        if self.background is None:
+            self.background = self.frame.copy()
+            return self.motion
+
+        # diff = frame - background; background += alpha * diff
+        np.subtract(self.frame, self.background, out=self.diff)
+        self.background += self.background_alpha * self.diff
+        np.abs(self.diff, out=self.diff)
+        self.last_changed_pixels = int(np.count_nonzero(self.diff > self.pixel_threshold))
+
+        if self.last_changed_pixels >= self.min_changed_pixels:
+            self.quiet_frames = 0
+            if not self.motion:
+                self.motion = True
+                logging.debug('Camera motion detected ({} changed pixels)'.format(self.last_changed_pixels))
+                if self.cb_motion_detected:
+                    self.cb_motion_detected()
+        elif self.motion:
+            self.quiet_frames = self.quiet_frames + 1
+            if self.quiet_frames >= self.frames_to_end:
+                self.motion = False
+                logging.debug('Camera motion ended')
+                if self.cb_motion_ended:
+                    self.cb_motion_ended()
+
+        return self.motion
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A streaming H.264 (Annex B) to MP4 muxer - replaces the MP4Box conversion"""
+
+import struct
+import logging
+
+
+class Mp4Muxer:
+    """File-like object, can be passed to PiCamera.start_recording or PiCameraCircularIO.copy_to.
+
+    The samples are written into the mdat box as they are produced, the sample tables are kept
+    in memory and written on close. The output has to be seekable (file or io.BytesIO).
+    """
+
+    _START_CODE = b'\x00\x00\x01'
+
+    _NAL_SLICE = 1
+    _NAL_IDR = 5
+    _NAL_SEI = 6
+    _NAL_SPS = 7
+    _NAL_PPS = 8
+    _NAL_AUD = 9
+
+    _TIMESCALE = 90000
+    _MOVIE_TIMESCALE = 1000
+
+    _HIGH_PROFILES = [100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135]
+
+    def __init__(self, output, framerate=30, res_width=0, res_height=0):
+        """Initialization
+
+        :param output: The output file name or a seekable file-like object
+        :param framerate: The framerate
+        :param res_width: Resolution width, used if it cannot be read from the SPS
+        :param res_height: Resolution height, used if it cannot be read from the SPS
+        """
+        if hasattr(output, 'write'):
+            self.output = output
+            self.close_output = False
+        else:
+            self.output = open(output, 'wb')
+            self.close_output = True
+
+        self.framerate = framerate
+        self.res_width = res_width
+        self.res_height = res_height
+
+        self.buffer = bytearray()
+        self.sps = None
+        self.pps = None
+
+        self.sample = bytearray()
+        self.sample_has_picture = False
+        self.sample_is_key = False
+        self.sample_sizes = []
+        self.key_samples = []
+
+        self.mdat_start = None
+        self.mdat_size = 0
+        self.closed = False
+
+    def write(self, data):
+        """Writes (a part of) the H.264 byte stream
+
+        :param data: The data
+        :return: Number of bytes written
+        """
+        self.buffer.extend(data)
+        pos = self.buffer.find(self._START_CODE)
+        if pos < 0:
+            return len(data)
+        while True:
+            nxt = self.buffer.find(self._START_CODE, pos + 3)
+            if nxt < 0:
+                break
+            self._process_nal(bytes(self.buffer[pos + 3:nxt]).rstrip(b'\x00'))
+            pos = nxt
+        del self.buffer[:pos]
+        return len(data)
+
+    def flush(self):
+        """Flushes the output"""
+        self.output.flush()
+
+    def close(self):
+        """Writes the remaining samples and the moov box"""
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            pos = self.buffer.find(self._START_CODE)
+            if pos >= 0:
+                self._process_nal(bytes(self.buffer[pos + 3:]).rstrip(b'\x00'))
+            self.buffer = bytearray()
+            self._flush_sample()
+
+            if not self.sps or not self.pps or not self.sample_sizes:
+                raise ValueError('No SPS, PPS or samples in the H.264 stream')
+
+            end = self.output.tell()
+            self.output.seek(self.mdat_start)
+            self.output.write(struct.pack('>I', 8 + self.mdat_size))
+            self.output.seek(end)
+            self.output.write(self._moov())
+            self.output.flush()
+        finally:
+            if self.close_output:
+                self.output.close()
+
+    def abort(self):
+        """Closes the output without writing the moov box, e.g. after a failed recording"""
+        self.closed = True
+        if self.close_output and not self.output.closed:
+            self.output.close()
+
+    def get_nr_samples(self):
+        """Returns the number of samples (frames) written
+
+        :return: The number of samples
+        """
+        return len(self.sample_sizes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _process_nal(self, nal):
+        """Processes a single NAL unit
+
+        :param nal: The NAL unit without start code
+        """
+        if not nal:
+            return
+        nal_type = nal[0] & 0x1F
+        if nal_type == self._NAL_SPS:
+            if not self.sps:
+                self.sps = nal
+            return
+        if nal_type == self._NAL_PPS:
+            if not self.pps:
+                self.pps = nal
+            return
+        if nal_type == self._NAL_AUD:
+            self._flush_sample()
+            return
+        if nal_type in (self._NAL_SLICE, self._NAL_IDR):
+            # first_mb_in_slice == 0 (ue(v) "1") starts a new picture
+            if len(nal) > 1 and (nal[1] & 0x80) and self.sample_has_picture:
+                self._flush_sample()
+            self.sample_has_picture = True
+            if nal_type == self._NAL_IDR:
+                self.sample_is_key = True
+        elif nal_type == self._NAL_SEI and self.sample_has_picture:
+            self._flush_sample()
+        self.sample.extend(struct.pack('>I', len(nal)))
+        self.sample.extend(nal)
+
+    def _flush_sample(self):
+        """Writes the current sample into the mdat box"""
+        if not self.sample_has_picture:
+            return
+        if self.mdat_start is None:
+            self.output.write(self._box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2avc1mp41'))
+            self.mdat_start = self.output.tell()
+            self.output.write(struct.pack('>I', 0) + b'mdat')
+        self.output.write(self.sample)
+        self.mdat_size = self.mdat_size + len(self.sample)
+        self.sample_sizes.append(len(self.sample))
+        if self.sample_is_key:
+            self.key_samples.append(len(self.sample_sizes))
+        self.sample = bytearray()
+        self.sample_has_picture = False
+        self.sample_is_key = False
+
+    def _box(self, box_type, payload):
+        """Creates a box
+
+        :param box_type: The box type
+        :param payload: The payload
+        :return: The box
+        """
+        return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+    def _full_box(self, box_type, version, flags, payload):
+        """Creates a full box
+
+        :param box_type: The box type
+        :param version: The version
+        :param flags: The flags
+        :param payload: The payload
+        :return: The box
+        """
+        return self._box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+    def _moov(self):
+        """Creates the moov box
+
+        :return: The moov box
+        """
+        width, height = self._parse_sps_resolution()
+        nr_samples = len(self.sample_sizes)
+        delta = int(round(float(self._TIMESCALE) / self.framerate))
+        duration = nr_samples * delta
+        movie_duration = int(duration * self._MOVIE_TIMESCALE / self._TIMESCALE)
+        matrix = struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+        mvhd = self._full_box(b'mvhd', 0, 0,
+                              struct.pack('>IIII', 0, 0, self._MOVIE_TIMESCALE, movie_duration)
+                              + struct.pack('>IH', 0x00010000, 0x0100) + b'\x00' * 10
+                              + matrix + b'\x00' * 24 + struct.pack('>I', 2))
+        tkhd = self._full_box(b'tkhd', 0, 3,
+                              struct.pack('>IIII', 0, 0, 1, 0) + struct.pack('>I', movie_duration)
+                              + b'\x00' * 8 + struct.pack('>hhhH', 0, 0, 0, 0)
+                              + matrix + struct.pack('>II', width << 16, height << 16))
+        mdhd = self._full_box(b'mdhd', 0, 0,
+                              struct.pack('>IIIIHH', 0, 0, self._TIMESCALE, duration, 0x55C4, 0))
+        hdlr = self._full_box(b'hdlr', 0, 0,
+                              struct.pack('>I', 0) + b'vide' + b'\x00' * 12 + b'VideoHandler\x00')
+        vmhd = self._full_box(b'vmhd', 0, 1, b'\x00' * 8)
+        dinf = self._box(b'dinf', self._full_box(b'dref', 0, 0,
+                                                 struct.pack('>I', 1) + self._full_box(b'url ', 0, 1, b'')))
+
+        avcc = self._box(b'avcC',
+                         bytes([1, self.sps[1], self.sps[2], self.sps[3], 0xFF, 0xE1])
+                         + struct.pack('>H', len(self.sps)) + self.sps
+                         + b'\x01' + struct.pack('>H', len(self.pps)) + self.pps)
+        avc1 = self._box(b'avc1',
+                         b'\x00' * 6 + struct.pack('>H', 1) + b'\x00' * 16
+                         + struct.pack('>HHIII', width, height, 0x00480000, 0x00480000, 0)
+                         + struct.pack('>H', 1) + b'\x00' * 32 + struct.pack('>Hh', 0x0018, -1)
+                         + avcc)
+        stsd = self._full_box(b'stsd', 0, 0, struct.pack('>I', 1) + avc1)
+        stts = self._full_box(b'stts', 0, 0, struct.pack('>III', 1, nr_samples, delta))
+        stss = self._full_box(b'stss', 0, 0,
+                              struct.pack('>I', len(self.key_samples))
+                              + struct.pack('>{}I'.format(len(self.key_samples)), *self.key_samples))
+        stsc = self._full_box(b'stsc', 0, 0, struct.pack('>IIII', 1, 1, nr_samples, 1))
+        stsz = self._full_box(b'stsz', 0, 0,
+                              struct.pack('>II', 0, nr_samples)
+                              + struct.pack('>{}I'.format(nr_samples), *self.sample_sizes))
+        stco = self._full_box(b'stco', 0, 0, struct.pack('>II', 1, self.mdat_start + 8))
+        stbl = self._box(b'stbl', stsd + stts + (stss if self.key_samples else b'') + stsc + stsz + stco)
+
+        minf = self._box(b'minf', vmhd + dinf + stbl)
+        mdia = self._box(b'mdia', mdhd + hdlr + minf)
+        trak = self._box(b'trak', tkhd + mdia)
+        return self._box(b'moov', mvhd + trak)
+
+    def _parse_sps_resolution(self):
+        """Reads the resolution from the SPS
+
+        :return: Tuple (width, height)
+        """
+        try:
+            return _SpsReader(self.sps).read_resolution(self._HIGH_PROFILES)
+        except Exception as e:
+            logging.debug('Could not read resolution from SPS, using {}x{}: "{}"'.format(
+                self.res_width, self.res_height, e))
+            return self.res_width, self.res_height
+
+
+class _SpsReader:
+
+    def __init__(self, sps):
+        """Initialization
+
+        :param sps: The SPS NAL unit
+        """
+        # Remove emulation prevention bytes
+        self.data = bytes(sps).replace(b'\x00\x00\x03', b'\x00\x00')
+        self.pos = 8
+
+    def _bit(self):
+        byte = self.data[self.pos >> 3]
+        bit = (byte >> (7 - (self.pos & 7))) & 1
+        self.pos = self.pos + 1
+        return bit
+
+    def _bits(self, n):
+        value = 0
+        for _ in range(n):
+            value = (value << 1) | self._bit()
+        return value
+
+    def _ue(self):
+        zeros = 0
+        while self._bit() == 0:
+            zeros = zeros + 1
+        return (1 << zeros) - 1 + self._bits(zeros)
+
+    def _se(self):
+        value = self._ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+    def read_resolution(self, high_profiles):
+        """Reads the resolution
+
+        :param high_profiles: Profiles with chroma format information
+        :return: Tuple (width, height)
+        """
+        profile_idc = self._bits(8)
+        self._bits(16)  # constraint flags, level
+        self._ue()  # seq_parameter_set_id
+        chroma_format_idc = 1
+        if profile_idc in high_profiles:
+            chroma_format_idc = self._ue()
+            if chroma_format_idc == 3:
+                self._bit()
+            self._ue()
+            self._ue()
+            self._bit()
+            if self._bit():
+                for i in range(8 if chroma_format_idc != 3 else 12):
+                    if self._bit():
+                        last, nxt = 8, 8
+                        for _ in range(16 if i < 6 else 64):
+                            if nxt != 0:
+                                nxt = (last + self._se() + 256) % 256
+                            last = last if nxt == 0 else nxt
+        self._ue()  # log2_max_frame_num_minus4
+        pic_order_cnt_type = self._ue()
+        if pic_order_cnt_type == 0:
+            self._ue()
+        elif pic_order_cnt_type == 1:
+            self._bit()
+            self._se()
+            self._se()
+            for _ in range(self._ue()):
+                self._se()
+        self._ue()  # max_num_ref_frames
+        self._bit()
+        width_mbs = self._ue() + 1
+        height_map_units = self._ue() + 1
+        frame_mbs_only = self._bit()
+        if not frame_mbs_only:
+            self._bit()
+        self._bit()
+        crop_left, crop_right, crop_top, crop_bottom = 0, 0, 0, 0
+        if self._bit():
+            crop_left, crop_right, crop_top, crop_bottom = self._ue(), self._ue(), self._ue(), self._ue()
+        crop_unit_x = 1 if chroma_format_idc in (0, 3) else 2
+        crop_unit_y = (1 if chroma_format_idc in (0, 2, 3) else 2) * (2 - frame_mbs_only)
+        width = width_mbs * 16 - (crop_left + crop_right) * crop_unit_x
+        height = (2 - frame_mbs_only) * height_map_units * 16 - (crop_top + crop_bottom) * crop_unit_y
+        return width, height
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A camera backend - encapsulates calls to the picamera API"""
+
+import time
+import logging
+
+from tools.camera.CameraBackend import CameraBackend
+
+
+class PiCameraBackend(CameraBackend):
+
+    # Recordings use splitter port 1 (the picamera default)
+    _SPLITTER_PORT_BURST = 0
+    _SPLITTER_PORT_ANALYSIS = 2
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        super().__init__(settings)
+
+        logging.info('Initializing PiCamera backend')
+
+        #import picamera
+        self.picamera = __import__('picamera', globals(), locals(), [], 0)
+
+        self.camera = None
+        self.ring = None
+        self.analysis_output = None
+
+    # @abstractmethod override
+    def open(self, res_width, res_height, deg_rot, framerate=30):
+        if self.opened:
+            logging.info('Already opened')
+            return True
+
+        logging.debug('Camera image data [res_width={}, res_height={}, deg_rot={}, framerate={}]'.format(
+            res_width, res_height, deg_rot, framerate))
+
+        try:
+            self.camera = self.picamera.PiCamera()
+            self.camera.resolution = (res_width, res_height)
+            self.camera.rotation = deg_rot
+            self.camera.framerate = framerate
+            self.camera.start_preview()
+            self.opened = True
+        except Exception as e:
+            logging.error('Failed to open camera: "{}"'.format(e))
+            self.close()
+
+        return self.opened
+
+    # @abstractmethod override
+    def close(self):
+        self.stop_analysis()
+        self.stop_ring_recording()
+        if self.camera:
+            try:
+                self.camera.stop_preview()
+            except Exception as e:
+                logging.debug('Failed to stop preview: "{}"'.format(e))
+            try:
+                self.camera.close()
+            except Exception as e:
+                logging.error('Failed to close camera: "{}"'.format(e))
+        self.camera = None
+        self.opened = False
+
+    # @abstractmethod override
+    def capture_image(self, filename, use_video_port=False):
+        self.camera.capture(filename, use_video_port=use_video_port)
+
+    # @abstractmethod override
+    def capture_burst(self, filenames, fps, cb_captured=None):
+        self.camera.capture_sequence(self._paced(filenames, fps, cb_captured),
+                                     format='jpeg',
+                                     use_video_port=True,
+                                     splitter_port=self._SPLITTER_PORT_BURST)
+
+    def _paced(self, filenames, fps, cb_captured=None):
+        """Yields the file names at the given rate, capture_sequence grabs the next frame on every file name
+
+        :param filenames: The file names
+        :param fps: Number of file names per second
+        :param cb_captured: Called with the file name once capture_sequence asks for the next one,
+            i.e. after the image was written
+        """
+        interval_s = 1.0 / fps if fps > 0 else 0
+        t_next = time.time()
+        for filename in filenames:
+            delay_s = t_next - time.time()
+            if delay_s > 0:
+                time.sleep(delay_s)
+            yield filename
+            if cb_captured:
+                cb_captured(filename)
+            t_next = t_next + interval_s
+
+    # @abstractmethod override
+    def start_recording(self, output):
+        self.camera.start_recording(output, format='h264')
+
+    # @abstractmethod override
+    def wait_recording(self, seconds):
+        self.camera.wait_recording(seconds)
+
+    # @abstractmethod override
+    def stop_recording(self):
+        self.camera.stop_recording()
+
+    # @abstractmethod override
+    def start_ring_recording(self, size_bytes, bitrate):
+        self.ring = self.picamera.PiCameraCircularIO(self.camera, size=size_bytes)
+        self.camera.start_recording(self.ring, format='h264', bitrate=bitrate)
+
+    # @abstractmethod override
+    def save_ring(self, output, seconds):
+        self.ring.copy_to(output, seconds=seconds)
+
+    # @abstractmethod override
+    def stop_ring_recording(self):
+        if not self.ring:
+            return
+        try:
+            self.camera.stop_recording()
+        except Exception as e:
+            logging.error('Failed to stop ring recording: "{}"'.format(e))
+        self.ring.close()
+        self.ring = None
+
+    # @abstractmethod override
+    def start_analysis(self, callback, res_width, res_height):
+        # Unencoded YUV rows are padded to a multiple of 32
+        self.analysis_output = _AnalysisOutput(callback, ((res_width + 31) // 32) * 32)
+        self.camera.start_recording(self.analysis_output,
+                                    format='yuv',
+                                    resize=(res_width, res_height),
+                                    splitter_port=self._SPLITTER_PORT_ANALYSIS)
+
+    # @abstractmethod override
+    def stop_analysis(self):
+        if not self.analysis_output:
+            return
+        try:
+            self.camera.stop_recording(splitter_port=self._SPLITTER_PORT_ANALYSIS)
+        except Exception as e:
+            logging.error('Failed to stop analysis: "{}"'.format(e))
+        self.analysis_output = None
+
+
+class _AnalysisOutput:
+
+    def __init__(self, callback, stride):
+        """Initialization
+
+        :param callback: Called with the arguments (buffer, row stride) for every frame
+        :param stride: Length of a row in the buffer
+        """
+        self.callback = callback
+        self.stride = stride
+
+    def write(self, buf):
+        """Receives an unencoded frame
+
+        :param buf: The frame buffer
+        :return: Number of bytes written
+        """
+        try:
+            self.callback(buf, self.stride)
+        except Exception as e:
+            logging.error('Failed to analyze frame: "{}"'.format(e))
+        return len(buf)
+
+    def flush(self):
+        pass
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A fake GPIO backend - for running without GPIO hardware"""
+
+import logging
+
+from tools.gpio.GpioBackend import GpioBackend
+from tools.gpio.FakePigpio import FakePi
+
+
+class FakeGpioBackend(GpioBackend):
+
+    # @abstractmethod override
+    def start(self):
+        if not self.pi:
+            logging.info('Starting fake GPIO backend')
+            self.pi = FakePi()
+            self.timings = {'total': 0.0}
+        return self.pi
+
+    # @abstractmethod override
+    def stop(self):
+        if self.pi:
+            self.pi.stop()
+        self.pi = None
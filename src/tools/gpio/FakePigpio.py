@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A fake pigpio.pi stand-in - injects edges, for running without GPIO hardware"""
+
+import time
+import logging
+import threading
+
+RISING_EDGE = 0
+FALLING_EDGE = 1
+EITHER_EDGE = 2
+
+INPUT = 0
+OUTPUT = 1
+
+
+class FakeCallback:
+
+    def __init__(self, fake_pi, gpio, edge, func):
+        """Initialization
+
+        :param fake_pi: The fake pi
+        :param gpio: The GPIO pin
+        :param edge: RISING_EDGE, FALLING_EDGE or EITHER_EDGE
+        :param func: Called with the arguments (gpio, level, tick)
+        """
+        self.fake_pi = fake_pi
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+
+    def cancel(self):
+        """Cancels the callback"""
+        self.fake_pi._cancel(self)
+
+
+class FakePi:
+
+    def __init__(self):
+        """Initialization"""
+        logging.info('Initializing fake pigpio')
+
+        self.connected = True
+        self.levels = {}
+        self.modes = {}
+        self.glitch_filters = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def _tick(self):
+        """Returns the current tick (microseconds, wrapping at 32 bit like pigpio)
+
+        :return: The tick
+        """
+        return int(time.time() * 1000000) & 0xFFFFFFFF
+
+    def _cancel(self, cb):
+        """Removes a callback
+
+        :param cb: The callback
+        """
+        with self.lock:
+            if cb in self.callbacks:
+                self.callbacks.remove(cb)
+
+    def stop(self):
+        """Disconnects"""
+        with self.lock:
+            self.callbacks = []
+        self.connected = False
+
+    def set_mode(self, gpio, mode):
+        """Sets the mode of a GPIO pin"""
+        self.modes[gpio] = mode
+        return 0
+
+    def read(self, gpio):
+        """Returns the level of a GPIO pin"""
+        return self.levels.get(gpio, 0)
+
+    def set_glitch_filter(self, gpio, steady):
+        """Sets the glitch filter (in microseconds) of a GPIO pin"""
+        self.glitch_filters[gpio] = steady
+        return 0
+
+    def callback(self, gpio, edge=RISING_EDGE, func=None):
+        """Registers an edge callback, called with the arguments (gpio, level, tick)"""
+        cb = FakeCallback(self, gpio, edge, func)
+        with self.lock:
+            self.callbacks.append(cb)
+        return cb
+
+    def inject_edge(self, gpio, level):
+        """Sets a new level and calls the matching callbacks
+
+        :param gpio: The GPIO pin
+        :param level: The new level (0 or 1)
+        """
+        if self.levels.get(gpio, 0) == level:
+            return
+        self.levels[gpio] = level
+        tick = self._tick()
+        with self.lock:
+            callbacks = [cb for cb in self.callbacks if cb.gpio == gpio]
+        for cb in callbacks:
+            if cb.edge == EITHER_EDGE or (cb.edge == RISING_EDGE) == (level == 1):
+                cb.func(gpio, level, tick)
+
+    def inject_pulse(self, gpio, duration_us, level=1):
+        """Injects a pulse, suppressed like by pigpio if shorter than the glitch filter
+
+        :param gpio: The GPIO pin
+        :param duration_us: Duration of the pulse (in microseconds)
+        :param level: The level of the pulse
+        """
+        if duration_us < self.glitch_filters.get(gpio, 0):
+            logging.debug('Pulse of {}us filtered as glitch'.format(duration_us))
+            return
+        self.inject_edge(gpio, level)
+        time.sleep(duration_us / 1000000.0)
+        self.inject_edge(gpio, 1 - level)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""An abstract GPIO backend"""
+
+from abc import ABC, abstractmethod
+
+
+class GpioBackend(ABC):
+    """GPIO backends are selected via the setting gpio::backend, see Sensors::_GPIO_BACKEND_INFO"""
+
+    RISING_EDGE = 0
+    FALLING_EDGE = 1
+    EITHER_EDGE = 2
+
+    INPUT = 0
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        super().__init__()
+
+        self.settings = settings
+        self.pi = None
+        self.timings = {}
+
+    def get_timings(self):
+        """Returns the startup timings
+
+        :return: Dict with the startup stages and their duration (in s)
+        """
+        return dict(self.timings)
+
+    @abstractmethod
+    def start(self):
+        """Starts the backend (lazily, not on import)
+
+        :return: A connected pigpio.pi compatible object or None
+        """
+        return None
+
+    @abstractmethod
+    def stop(self):
+        """Stops the backend"""
+        self.pi = None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A GPIO backend - encapsulates the pigpio daemon and the pigpio API"""
+
+import time
+import logging
+import contextlib
+from subprocess import call
+
+from tools.gpio.GpioBackend import GpioBackend
+
+
+class PigpioBackend(GpioBackend):
+
+    def __init__(self, settings):
+        """Initialization
+
+        :param settings: The settings
+        """
+        super().__init__(settings)
+
+        gpio_settings = self.settings.get('gpio', {})
+        self.daemon_start_timeout_s = gpio_settings.get('daemon_start_timeout_sec', 5)
+        self.daemon_probe_initial_s = gpio_settings.get('daemon_probe_initial_sec', 0.05)
+        self.stop_daemon_on_cleanup = gpio_settings.get('stop_daemon_on_cleanup', False)
+
+        self.pigpio = None
+        self.daemon_started = False
+
+    @contextlib.contextmanager
+    def _stopwatch(self, name):
+        """Context manager to store how long a startup stage took
+
+        :param name: The name of the stage
+        """
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.time() - t0
+
+    def _connect(self):
+        """Tries to connect to the pigpio daemon
+
+        :return: A connected pigpio.pi or None
+        """
+        pi = self.pigpio.pi(show_errors=False)
+        if pi.connected:
+            return pi
+        pi.stop()
+        return None
+
+    # @abstractmethod override
+    def start(self):
+        if self.pi:
+            return self.pi
+
+        t0 = time.time()
+        self.timings = {}
+
+        with self._stopwatch('import'):
+            #import pigpio
+            self.pigpio = __import__('pigpio', globals(), locals(), [], 0)
+
+        # Reuse an already running daemon
+        with self._stopwatch('probe'):
+            self.pi = self._connect()
+
+        if self.pi:
+            logging.info('Reusing running pigpio daemon')
+        else:
+            with self._stopwatch('daemon_start'):
+                logging.info('Starting pigpio daemon')
+                retcode = call(['sudo', 'pigpiod'])
+                if retcode != 0:
+                    logging.error('Failed to start pigpio daemon: Return code {}'.format(retcode))
+                self.daemon_started = True
+            with self._stopwatch('connect'):
+                self.pi = self._connect_with_backoff()
+
+        self.timings['total'] = time.time() - t0
+        logging.info('GPIO backend startup: {}'.format(
+            ', '.join('{}={:.3f}s'.format(k, v) for k, v in self.timings.items())))
+
+        if not self.pi:
+            logging.error('GPIO (pigpio) not connected')
+        return self.pi
+
+    def _connect_with_backoff(self):
+        """Probes the daemon until it accepts connections, with exponential backoff
+
+        :return: A connected pigpio.pi or None
+        """
+        deadline = time.time() + self.daemon_start_timeout_s
+        delay = self.daemon_probe_initial_s
+        attempts = 0
+        while True:
+            attempts = attempts + 1
+            pi = self._connect()
+            if pi:
+                logging.debug('Connected to pigpio daemon after {} attempt(s)'.format(attempts))
+                return pi
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logging.error('pigpio daemon not ready after {}s ({} attempts)'.format(
+                    self.daemon_start_timeout_s, attempts))
+                return None
+            time.sleep(min(delay, remaining))
+            delay = delay * 2
+
+    # @abstractmethod override
+    def stop(self):
+        if self.pi:
+            self.pi.stop()
+            self.pi = None
+        if self.daemon_started and self.stop_daemon_on_cleanup:
+            logging.info('Stopping pigpio daemon')
+            call(['sudo', 'killall', 'pigpiod'])
+            self.daemon_started = False
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""An abstract file watcher"""
+
+import os
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+
+class FileWatcher(threading.Thread, ABC):
+    """Watches a folder tree and reports files that have been completely written.
+
+    File watchers are selected via the setting sync::watcher, see FileSyncer::_WATCHER_INFO
+    """
+
+    def __init__(self, settings, folder, cb_file_ready, is_folder_watched=None):
+        """Initialization
+
+        :param settings: The settings
+        :param folder: The folder to watch
+        :param cb_file_ready: Called with the full file name for every completely written file
+        :param is_folder_watched: Called with a folder name, returns whether to descend into the folder
+        """
+        threading.Thread.__init__(self, name=self.__class__.__name__, daemon=True)
+
+        self.settings = settings
+        self.folder = folder
+        self.cb_file_ready = cb_file_ready
+        self.is_folder_watched = is_folder_watched
+
+        self.stopped = threading.Event()
+        self.nr_files_reported = 0
+
+    def _is_folder_watched(self, name):
+        """Checks whether to descend into a folder
+
+        :param name: The folder name
+        :return: True if the folder is watched, False else
+        """
+        return self.is_folder_watched(name) if self.is_folder_watched else True
+
+    def _report(self, fullname):
+        """Reports a completely written file
+
+        :param fullname: The full file name
+        """
+        self.nr_files_reported = self.nr_files_reported + 1
+        try:
+            self.cb_file_ready(fullname)
+        except Exception as e:
+            logging.error('Failed to report file "{}": "{}"'.format(fullname, e))
+
+    def scan(self, folder=None, cb_folder=None):
+        """Reports all files below a folder (scandir, skipping folders that are not watched)
+
+        :param folder: The folder, defaults to the watched folder
+        :param cb_folder: Called with every visited folder
+        """
+        folders = [folder if folder else self.folder]
+        while folders:
+            dn = folders.pop()
+            if cb_folder:
+                cb_folder(dn)
+            try:
+                with os.scandir(dn) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self._is_folder_watched(entry.name):
+                                folders.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            self._report(entry.path)
+            except OSError as e:
+                logging.debug('Failed to scan "{}": "{}"'.format(dn, e))
+
+    def stop(self):
+        """Stops watching"""
+        self.stopped.set()
+
+    def get_stats(self):
+        """Returns the watcher counters
+
+        :return: Dict with the number of reported files
+        """
+        return {
+            'nr_files_reported': self.nr_files_reported
+        }
+
+    @abstractmethod
+    def init(self):
+        """Initializes the watcher and reports the files already existing
+
+        :return: True if successfully initialized, False else
+        """
+        return False
+
+    @abstractmethod
+    def run(self):
+        """Watches until stopped"""
+        pass
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A file watcher based on Linux inotify (via ctypes)"""
+
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+from tools.watcher.FileWatcher import FileWatcher
+
+
+class InotifyWatcher(FileWatcher):
+    """Reports files on IN_CLOSE_WRITE and IN_MOVED_TO, watches new folders recursively"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    _WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_ONLYDIR
+
+    _EVENT_HEADER = struct.Struct('iIII')
+    _READ_SIZE = 64 * 1024
+    _SELECT_TIMEOUT_S = 1
+
+    def __init__(self, settings, folder, cb_file_ready, is_folder_watched=None):
+        """Initialization
+
+        :param settings: The settings
+        :param folder: The folder to watch
+        :param cb_file_ready: Called with the full file name for every completely written file
+        :param is_folder_watched: Called with a folder name, returns whether to descend into the folder
+        """
+        super().__init__(settings, folder, cb_file_ready, is_folder_watched=is_folder_watched)
+
+        self.libc = None
+        self.fd = None
+        self.watches = {}
+        self.nr_overflows = 0
+
+    # @abstractmethod override
+    def init(self):
+        name = ctypes.util.find_library('c')
+        if not name:
+            logging.error('libc not found, inotify not available')
+            return False
+        try:
+            self.libc = ctypes.CDLL(name, use_errno=True)
+            self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            logging.error('inotify not available: "{}"'.format(e))
+            return False
+        if self.fd < 0:
+            logging.error('Failed to initialize inotify: "{}"'.format(os.strerror(ctypes.get_errno())))
+            self.fd = None
+            return False
+        self._add_watch(self.folder)
+        if not self.watches:
+            self._close()
+            return False
+        self.scan(cb_folder=self._add_watch)
+        return True
+
+    def _add_watch(self, folder):
+        """Adds a watch for a folder
+
+        :param folder: The folder
+        """
+        # Watching a folder twice returns the same watch descriptor
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self._WATCH_MASK)
+        if wd < 0:
+            logging.error('Failed to watch "{}": "{}"'.format(folder, os.strerror(ctypes.get_errno())))
+            return
+        logging.debug('Watching "{}"'.format(folder))
+        self.watches[wd] = folder
+
+    def _close(self):
+        """Closes the inotify file descriptor"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches = {}
+
+    # @abstractmethod override
+    def run(self):
+        logging.info('Watching "{}" via inotify'.format(self.folder))
+        try:
+            while not self.stopped.is_set():
+                readable, _, _ = select.select([self.fd], [], [], self._SELECT_TIMEOUT_S)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(self.fd, self._READ_SIZE)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        continue
+                    raise
+                self._process_events(data)
+        except Exception as e:
+            logging.error('inotify watcher failed: "{}"'.format(e))
+        finally:
+            self._close()
+            logging.info('Stopped watching "{}"'.format(self.folder))
+
+    def _process_events(self, data):
+        """Processes a buffer of inotify events
+
+        :param data: The buffer
+        """
+        offset = 0
+        while offset + self._EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = self._EVENT_HEADER.unpack_from(data, offset)
+            offset = offset + self._EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset = offset + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # Events got lost, fall back to a full scan
+                self.nr_overflows = self.nr_overflows + 1
+                logging.warning('inotify event queue overflow, rescanning "{}"'.format(self.folder))
+                self.scan(cb_folder=self._add_watch)
+                continue
+            if mask & (self.IN_IGNORED | self.IN_DELETE_SELF):
+                self.watches.pop(wd, None)
+                continue
+
+            folder = self.watches.get(wd)
+            if not folder or not name:
+                continue
+            fullname = os.path.join(folder, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and self._is_folder_watched(name):
+                    # Files might have been written before the watch got added
+                    self.scan(fullname, cb_folder=self._add_watch)
+            elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                self._report(fullname)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['nr_watches'] = len(self.watches)
+        stats['nr_overflows'] = self.nr_overflows
+        return stats
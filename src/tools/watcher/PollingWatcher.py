@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#coding: utf8
+#
+# Copyright 2019-2021 Denis Meyer
+#
+# This file is part of raspi-surveillance
+#
+
+"""A file watcher polling the folder tree via scandir - fallback if inotify is not available"""
+
+import os
+import logging
+
+from tools.watcher.FileWatcher import FileWatcher
+
+
+class PollingWatcher(FileWatcher):
+    """Reports a file once its size and modification time did not change between two polls"""
+
+    def __init__(self, settings, folder, cb_file_ready, is_folder_watched=None):
+        """Initialization
+
+        :param settings: The settings
+        :param folder: The folder to watch
+        :param cb_file_ready: Called with the full file name for every completely written file
+        :param is_folder_watched: Called with a folder name, returns whether to descend into the folder
+        """
+        super().__init__(settings, folder, cb_file_ready, is_folder_watched=is_folder_watched)
+
+        self.poll_interval_s = self.settings.get('sync', {}).get('poll_interval_sec', 1)
+
+        # Full file name -> (size, mtime) of files not yet reported
+        self.candidates = {}
+        # Full file names already reported
+        self.reported = set()
+        self.nr_polls = 0
+
+    # @abstractmethod override
+    def init(self):
+        if not os.path.isdir(self.folder):
+            logging.error('"{}" is not a folder'.format(self.folder))
+            return False
+        self.scan()
+        self.reported = set(self._list_files())
+        return True
+
+    # @abstractmethod override
+    def run(self):
+        logging.info('Watching "{}" via polling every {}s'.format(self.folder, self.poll_interval_s))
+        while not self.stopped.wait(self.poll_interval_s):
+            try:
+                self._poll()
+            except Exception as e:
+                logging.error('Failed to poll "{}": "{}"'.format(self.folder, e))
+        logging.info('Stopped watching "{}"'.format(self.folder))
+
+    def _list_files(self):
+        """Lists all files below the watched folder
+
+        :return: Dict full file name -> (size, mtime)
+        """
+        files = {}
+        folders = [self.folder]
+        while folders:
+            dn = folders.pop()
+            try:
+                with os.scandir(dn) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self._is_folder_watched(entry.name):
+                                folders.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            files[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError as e:
+                logging.debug('Failed to scan "{}": "{}"'.format(dn, e))
+        return files
+
+    def _poll(self):
+        """Polls once, reports files that did not change since the last poll"""
+        self.nr_polls = self.nr_polls + 1
+        files = self._list_files()
+        # Forget files that are gone (e.g. uploaded and deleted)
+        self.reported.intersection_update(files.keys())
+        candidates = {}
+        for fullname, stat in files.items():
+            if fullname in self.reported:
+                continue
+            if self.candidates.get(fullname) == stat:
+                self.reported.add(fullname)
+                self._report(fullname)
+            else:
+                candidates[fullname] = stat
+        self.candidates = candidates
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['nr_polls'] = self.nr_polls
+        return stats